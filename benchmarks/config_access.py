@@ -0,0 +1,42 @@
+"""
+Measure the cost of reading a configuration section, comparing rebuilding the
+section from the flattened configuration values, as helper.config.Config
+previously did on every access, with the cached read-only section and the
+typed snapshot.
+
+Usage: python benchmarks/config_access.py [iterations]
+
+"""
+import sys
+import timeit
+
+from helper import config
+
+
+def report(name, seconds, iterations):
+    print('{:<24} {:>10.3f}us per access'.format(
+        name, seconds / iterations * 1000000))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    cfg = config.Config(schema={'wake_interval': 60})
+    for section in ['Application', 'Logging']:
+        report('{} as_dict()'.format(section),
+               timeit.timeit(lambda: cfg._values[section].as_dict(),
+                             number=iterations), iterations)
+    report('Application cached',
+           timeit.timeit(lambda: cfg.application, number=iterations),
+           iterations)
+    report('Logging cached',
+           timeit.timeit(lambda: cfg.logging, number=iterations), iterations)
+    report('Application value',
+           timeit.timeit(lambda: cfg.application['wake_interval'],
+                         number=iterations), iterations)
+    report('Snapshot attribute',
+           timeit.timeit(lambda: cfg.snapshot.wake_interval,
+                         number=iterations), iterations)
+
+
+if __name__ == '__main__':
+    main()
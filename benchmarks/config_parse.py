@@ -0,0 +1,43 @@
+"""
+Measure the cost of parsing a large configuration file at startup, comparing
+the pure Python YAML loader, the libyaml based loader and the compiled
+configuration cache used by helper.config.Config.
+
+Usage: python benchmarks/config_parse.py [loggers] [iterations]
+
+"""
+import marshal
+import sys
+import timeit
+
+import yaml
+
+
+def report(name, seconds, iterations):
+    print('{:<24} {:>10.1f}ms per parse'.format(
+        name, seconds / iterations * 1000))
+
+
+def main():
+    loggers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    content = yaml.safe_dump({
+        'Application': {'wake_interval': 60},
+        'Logging': {'loggers': dict(
+            ('logger{}'.format(offset), {'level': 'INFO',
+                                         'handlers': ['console']})
+            for offset in range(loggers))}})
+    report('yaml.SafeLoader', timeit.timeit(
+        lambda: yaml.load(content, Loader=yaml.SafeLoader),
+        number=iterations), iterations)
+    if hasattr(yaml, 'CSafeLoader'):
+        report('yaml.CSafeLoader', timeit.timeit(
+            lambda: yaml.load(content, Loader=yaml.CSafeLoader),
+            number=iterations), iterations)
+    compiled = marshal.dumps(yaml.safe_load(content))
+    report('marshal', timeit.timeit(
+        lambda: marshal.loads(compiled), number=iterations), iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Measure the cost of reloading an unchanged configuration file, comparing a
+full parse with the change detection in helper.config.Config.reload.
+
+Usage: python benchmarks/config_reload.py [loggers] [iterations]
+
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+import yaml
+
+from helper import config
+
+
+def report(name, seconds, iterations):
+    print('{:<32} {:>10.1f}us per reload'.format(
+        name, seconds / iterations * 1000000))
+
+
+def main():
+    loggers = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    handle, file_path = tempfile.mkstemp(suffix='.yml')
+    with os.fdopen(handle, 'w') as handle:
+        yaml.safe_dump({
+            'Application': {'wake_interval': 60},
+            'Logging': {'loggers': dict(
+                ('logger{}'.format(offset), {'level': 'INFO',
+                                             'handlers': ['console']})
+                for offset in range(loggers))}}, handle)
+    try:
+        cfg = config.Config(file_path)
+        report('unchanged, recently modified', timeit.timeit(
+            cfg.reload, number=iterations), iterations)
+        os.utime(file_path, (0, 0))
+        report('unchanged', timeit.timeit(
+            cfg.reload, number=iterations), iterations)
+        report('full parse', timeit.timeit(
+            cfg._load_config_file, number=10), 10)
+    finally:
+        os.unlink(file_path)
+
+
+if __name__ == '__main__':
+    main()
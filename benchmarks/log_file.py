@@ -0,0 +1,43 @@
+"""
+Measure the cost of logging a record to a file, comparing the standard
+library's FileHandler, which writes each record, with BufferedFileHandler,
+which writes records in batches.
+
+Usage: python benchmarks/log_file.py [iterations]
+
+"""
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+from helper import handlers
+
+
+def report(name, seconds, iterations):
+    print('{:<24} {:>10.3f}us per record'.format(
+        name, seconds / iterations * 1000000))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logger = logging.getLogger('benchmark')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'benchmark.log')
+    for name, factory in [
+            ('FileHandler', logging.FileHandler),
+            ('BufferedFileHandler', handlers.BufferedFileHandler)]:
+        handler = factory(path)
+        logger.handlers = [handler]
+        report(name, timeit.timeit(lambda: logger.info('Tick %i', 1),
+                                   number=iterations), iterations)
+        handler.close()
+        os.unlink(path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Measure the cost of logging a record, comparing the default verbose format
+with the JSON and logfmt formatters, and with and without finding the
+caller of each logging call.
+
+Usage: python benchmarks/log_format.py [iterations]
+
+"""
+import io
+import logging
+import sys
+import timeit
+
+from helper import config, formatters
+
+
+def report(name, seconds, iterations):
+    print('{:<24} {:>10.3f}us per record'.format(
+        name, seconds / iterations * 1000000))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logger = logging.getLogger('benchmark')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(io.StringIO())
+    logger.handlers = [handler]
+    srcfile = logging._srcfile
+    for name, formatter in [
+            ('verbose', logging.Formatter(config.LOGGING_FORMAT)),
+            ('json', formatters.JSONFormatter()),
+            ('logfmt', formatters.LogfmtFormatter())]:
+        handler.setFormatter(formatter)
+        for find_caller in [True, False]:
+            logging._srcfile = srcfile if find_caller else None
+            report('{}{}'.format(name, '' if find_caller else ' no caller'),
+                   timeit.timeit(lambda: logger.info('Tick %i', 1),
+                                 number=iterations), iterations)
+            handler.stream.seek(0)
+            handler.stream.truncate()
+    logging._srcfile = srcfile
+
+
+if __name__ == '__main__':
+    main()
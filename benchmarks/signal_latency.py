@@ -0,0 +1,63 @@
+"""
+Measure the latency between a signal being sent to the process and the main
+loop receiving it, comparing the multiprocessing.Queue that was previously
+used by helper.controller.Controller with helper.wakeup.Wakeup.
+
+Usage: python benchmarks/signal_latency.py [iterations]
+
+"""
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from helper import wakeup
+
+
+def measure(pending, iterations):
+    """Return the sorted signal-to-handler latencies for the queue-like
+    object, in microseconds.
+
+    """
+    sent = []
+
+    def on_signal(signum, _frame):
+        pending.put(signum)
+
+    def send():
+        sent.append(monotonic())
+        os.kill(os.getpid(), signal.SIGUSR1)
+
+    signal.signal(signal.SIGUSR1, on_signal)
+    latencies = []
+    for _iteration in range(iterations):
+        timer = threading.Timer(0.001, send)
+        timer.start()
+        pending.get(True, 5)
+        latencies.append((monotonic() - sent.pop()) * 1000000)
+        timer.join()
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    return sorted(latencies), threading.active_count()
+
+
+def report(name, latencies, threads):
+    print('{:<24} median {:>8.1f}us  p99 {:>8.1f}us  max {:>8.1f}us  '
+          'threads {}'.format(
+              name, latencies[len(latencies) // 2],
+              latencies[int(len(latencies) * 0.99)], latencies[-1], threads))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    report('multiprocessing.Queue',
+           *measure(multiprocessing.Queue(), iterations))
+    report('helper.wakeup.Wakeup', *measure(wakeup.Wakeup(), iterations))
+
+
+if __name__ == '__main__':
+    main()
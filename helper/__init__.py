@@ -130,6 +130,7 @@ $I:.:+I=................ .......... ........................................=:
  :8=+.,?$:.......................................  .... .............    ..,,= .
 """
 import logging
+import os
 import sys
 
 from helper import config, parser
@@ -156,6 +157,25 @@ def start(controller_class):
     """
     args = parser.parse()
     obj = controller_class(args, platform.operating_system())
+    value = getattr(args, 'workers', None)
+    if value is None:
+        value = obj.config.application.get('workers')
+    try:
+        workers = 1 if value is None else int(value)
+    except (TypeError, ValueError):
+        workers = 0
+    if workers < 1:
+        sys.stderr.write('\nError starting %s: workers must be a number '
+                         'that is at least 1, not %r\n\n' %
+                         (sys.argv[0], value))
+        sys.exit(1)
+    if workers > 1:
+        if not hasattr(os, 'fork'):
+            sys.stderr.write('\nError starting %s: running %i workers '
+                             'requires os.fork, which is not available on '
+                             '%s\n\n' % (sys.argv[0], workers, sys.platform))
+            sys.exit(1)
+        obj = platform.Supervisor(obj, workers)
     if args.foreground:
         try:
             obj.start()
@@ -0,0 +1,342 @@
+"""
+Helper AsyncIO Controller Class
+
+"""
+import asyncio
+import inspect
+import logging
+import signal
+
+from helper import config, controller, handlers
+from helper.controller import monotonic
+
+try:
+    _current_task = asyncio.current_task
+except AttributeError:  # Python < 3.7
+    _current_task = asyncio.Task.current_task
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncController(controller.Controller):
+    """Extend this class to implement your core application controller on top
+    of an :mod:`asyncio` event loop. The :meth:`AsyncController.setup`,
+    :meth:`AsyncController.process` and :meth:`AsyncController.shutdown`
+    methods are coroutines, allowing many concurrent operations to be awaited
+    in a single invocation of :meth:`AsyncController.process`.
+
+    The ``on_*`` hooks may be implemented either as regular methods or as
+    coroutines. Concurrency comes from the event loop, so the ``pool_size``
+    Application value is not supported and is rejected when the
+    configuration is loaded.
+
+    When stopped while :meth:`AsyncController.process` or a task is being
+    awaited, :meth:`AsyncController.shutdown` is awaited once it finishes or
+    the ``drain_timeout`` has passed.
+
+    """
+    def __init__(self, args, operating_system):
+        """Create an instance of the controller passing in the debug flag,
+        the options and arguments from the cli parser.
+
+        :param argparse.Namespace args: Command line arguments
+        :param str operating_system: Operating system name from helper.platform
+
+        """
+        super(AsyncController, self).__init__(args, operating_system)
+        self.loop = None
+        self._stop_task = None
+        self._work_task = None
+
+    async def process(self):
+        """To be implemented by the extending class. Is awaited after every
+        sleep interval in the main application loop. May return the same
+        hints as
+        :meth:`Controller.process <helper.controller.Controller.process>`.
+
+        :rtype: str|int|float|None
+
+        """
+        raise NotImplementedError
+
+    async def process_signal(self, signum):
+        """Invoked whenever a signal is added to the stack.
+
+        :param int signum: The signal that was added
+
+        """
+        if signum == signal.SIGTERM:
+            LOGGER.info('Received SIGTERM, initiating shutdown')
+            await self._stop()
+        elif signum == self.profile_signal:
+            self.toggle_profiling()
+        elif signum == signal.SIGHUP:
+            LOGGER.info('Received SIGHUP')
+            handlers.reopen_files()
+            await self.reload_configuration()
+        elif signum == signal.SIGUSR1:
+            await self._call(self.on_sigusr1)
+        elif signum == signal.SIGUSR2:
+            await self._call(self.on_sigusr2)
+
+    async def reload_configuration(self):
+        """Reload the configuration, reconfiguring logging if the Logging
+        section changed and awaiting
+        :meth:`AsyncController.on_configuration_reloaded` if it changed.
+
+        :rtype: helper.config.ConfigChanges
+
+        """
+        try:
+            changes = self.config.reload()
+        except ValueError as error:
+            LOGGER.error('Could not reload the configuration: %s', error)
+            return config.ConfigChanges()
+        if changes:
+            self._apply_configuration_changes(changes)
+            args, kwargs = self._configuration_reloaded_args(changes)
+            await self._call(self.on_configuration_reloaded, *args, **kwargs)
+        return changes
+
+    async def run(self):
+        """The core coroutine for the application. Will await setup, toggle
+        the runtime state flag and await :meth:`AsyncController.process`
+        every wake interval until the application is stopped.
+
+        """
+        LOGGER.info('%s v%s started', self.APPNAME, self.VERSION)
+        await self.setup()
+        self._start_watcher()
+        self._deadline = monotonic() + self.wake_interval
+        while not any([self.is_stopping, self.is_stopped]):
+            self.set_state(self.STATE_SLEEPING)
+            signum = await self._wait_for_signal(self._sleep_timeout())
+            if signum is not None:
+                await self.process_signal(signum)
+            if self._reload_requested:
+                self._reload_requested = False
+                await self.reload_configuration()
+            if any([self.is_waiting_to_stop, self.is_stopping,
+                    self.is_stopped]):
+                break
+            await self._run_tasks()
+            if any([self.is_waiting_to_stop, self.is_stopping,
+                    self.is_stopped]):
+                break
+            elif (monotonic() < self._deadline and
+                  (self.fixed_rate or signum is None)):
+                continue
+            self.set_state(self.STATE_ACTIVE)
+            profiler, started = self._profiler, monotonic()
+            if profiler:
+                profiler.enable()
+            try:
+                if self.fixed_rate:
+                    hint = await self._work(self._process_tick())
+                else:
+                    hint = await self._work(self.process())
+            finally:
+                if profiler:
+                    profiler.disable()
+                self.stats.process.add(monotonic() - started)
+            self._apply_process_hint(hint)
+
+    async def setup(self):
+        """Override to provide any required setup steps."""
+        LOGGER.debug('%s.setup() NotImplemented', self.__class__.__name__)
+
+    async def shutdown(self):
+        """Override to provide any required shutdown steps."""
+        LOGGER.debug('%s.shutdown() NotImplemented', self.__class__.__name__)
+
+    def start(self):
+        """Important:
+
+            Do not extend this method, rather redefine AsyncController.run
+
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.pending_signals.close()
+        self.pending_signals = asyncio.Queue()
+        self._installed_signals = self._signals()
+        for signum in self._installed_signals:
+            self._install_signal_handler(signum)
+        self.loop.run_until_complete(self.run())
+        if self._stop_task is not None:
+            self.loop.run_until_complete(self._stop_task)
+        self._close_loop()
+
+    def stop(self):
+        """Stop the application. When invoked while the event loop is
+        running, the shutdown is scheduled on the loop and the task is
+        returned.
+
+        :rtype: asyncio.Task|None
+
+        """
+        if self.loop is None or self.loop.is_closed():
+            return None
+        elif self.loop.is_running():
+            self._stop_task = self.loop.create_task(self._stop())
+            return self._stop_task
+        self.loop.run_until_complete(self._stop())
+        self._close_loop()
+
+    @staticmethod
+    async def _call(method, *args, **kwargs):
+        """Invoke the method, awaiting the result if it is awaitable.
+
+        :param callable method: The method to invoke
+
+        """
+        result = method(*args, **kwargs)
+        if inspect.isawaitable(result):
+            await result
+
+    def _close_loop(self):
+        """Remove the signal handlers and close the event loop."""
+        for signum in self._installed_signals:
+            self._remove_signal_handler(signum)
+        self._installed_signals = []
+        self.loop.close()
+
+    def _install_signal_handler(self, signum):
+        """Install the handler that queues the signal for the main loop.
+
+        :param int signum: The signal to handle
+
+        """
+        self.loop.add_signal_handler(signum, self._on_signal, signum, None)
+
+    def _on_signal(self, signum, _frame):
+        """Append the signal to the queue, to be processed by the main."""
+        self.pending_signals.put_nowait(signum)
+
+    async def _process_tick(self):
+        """Await :meth:`AsyncController.process` for a fixed rate tick,
+        recording how late the tick started and scheduling the next one.
+
+        """
+        scheduled = self._start_tick()
+        try:
+            return await self.process()
+        finally:
+            self._deadline = self._next_deadline(
+                scheduled, monotonic(), self.wake_interval)
+
+    def _remove_signal_handler(self, signum):
+        """Remove the handler of a signal that is no longer handled.
+
+        :param int signum: The signal to stop handling
+
+        """
+        self.loop.remove_signal_handler(signum)
+
+    async def _run_tasks(self):
+        """Run any registered tasks that are due, awaiting tasks that are
+        coroutines.
+
+        """
+        for task, scheduled in self.tasks.pop_due(monotonic()):
+            self.set_state(self.STATE_ACTIVE)
+            started, failed = monotonic(), False
+            try:
+                await self._work(self._call(task.callback))
+            except Exception as error:
+                LOGGER.exception('Task %s failed: %s', task.name, error)
+                failed = True
+            self.tasks.complete(task, scheduled, started, monotonic(), failed)
+
+    async def _stop(self):
+        """Run through the shutdown steps, awaiting
+        :meth:`AsyncController.shutdown`.
+
+        """
+        LOGGER.info('Attempting to stop the process')
+        self.set_state(self.STATE_STOP_REQUESTED)
+        self._wakeup()
+        await self._wait_for_process()
+        await self.shutdown()
+        self._stop_watcher()
+        if not self.is_stopping:
+            self.set_state(self.STATE_STOPPING)
+        await self._call(self.on_shutdown)
+        self.set_state(self.STATE_STOPPED)
+        self.logging_config.stop()
+
+    def _validate_application(self, application):
+        """Validate the Application values that are read by the main loop,
+        rejecting a ``pool_size``, since :meth:`AsyncController.process` is
+        always awaited on the event loop.
+
+        :param dict application: The Application section
+        :raises: ValueError
+
+        """
+        super(AsyncController, self)._validate_application(application)
+        if application.get('pool_size') or self.POOL_SIZE:
+            raise ValueError('pool_size is not supported by AsyncController')
+
+    async def _work(self, coroutine):
+        """Await the coroutine as a task that a shutdown waits for.
+
+        :param coroutine: The invocation of process or a task
+        :rtype: mixed
+
+        """
+        self._work_task = asyncio.ensure_future(coroutine)
+        try:
+            return await self._work_task
+        finally:
+            self._work_task = None
+
+    def _wakeup(self):
+        """Wake the main loop if it is waiting for signals, so that it
+        re-evaluates its state and schedule. Safe to call from any thread.
+
+        """
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(
+                self.pending_signals.put_nowait, None)
+
+    async def _wait_for_process(self):
+        """Wait until the invocation of :meth:`AsyncController.process` or
+        a task being awaited finishes, or the drain timeout has passed. When
+        invoked from within it, it does not wait for itself.
+
+        """
+        work = self._work_task
+        if work is None or work.done() or work is _current_task():
+            return
+        LOGGER.info('Waiting for the running invocation to finish')
+        try:
+            await asyncio.wait_for(asyncio.shield(work), self.drain_timeout)
+        except asyncio.TimeoutError:
+            LOGGER.warning('The running invocation did not finish within %s '
+                           'seconds, continuing shutdown', self.drain_timeout)
+        except Exception:  # Raised to and logged by the main loop
+            pass
+
+    async def _wait_for_signal(self, timeout):
+        """Wait up to ``timeout`` seconds for a signal to be received,
+        returning the signal number or None if the timeout passed.
+
+        :param float timeout: How long to wait for
+        :rtype: int|None
+
+        """
+        started = monotonic()
+        try:
+            signum = self.pending_signals.get_nowait()
+        except asyncio.QueueEmpty:
+            try:
+                signum = await asyncio.wait_for(
+                    self.pending_signals.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self.stats.sleep.add(monotonic() - started)
+        if signum is not None:
+            self.stats.signals += 1
+        return signum
@@ -3,12 +3,27 @@ Responsible for reading in configuration files, validating the proper
 format and providing sane defaults for parts that don't have any.
 
 """
+import copy
+import hashlib
 import json
+import keyword
 import logging
 import logging.config
+import marshal
 import os
 from os import path
+import re
 import sys
+import tempfile
+import time
+try:
+    from collections import abc
+except ImportError:  # Python 2.7 support
+    import collections as abc
+try:
+    from concurrent import futures
+except ImportError:  # Python 2.7 support without the futures backport
+    futures = None
 try:
     from urllib import parse
 except ImportError:  # Python 2.7 support
@@ -17,8 +32,31 @@ except ImportError:  # Python 2.7 support
 import flatdict
 import yaml
 
+from helper import consul, handlers
+
 LOGGER = logging.getLogger(__name__)
 
+# The source file logging uses to find the caller of a logging call, which
+# is set to None to skip finding it
+_SRCFILE = logging._srcfile
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Use the libyaml based loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+#: Local configuration files modified more recently than this many seconds
+#: ago are always re-read on reload, as a change within the resolution of the
+#: filesystem's modification time would not change their stat signature.
+STAT_GRACE = 2
+
+#: The extensions of the files loaded from an included directory
+INCLUDE_EXTENSIONS = ('.json', '.yaml', '.yml')
+
+#: Separates the prefix, section and keys of environment variables that
+#: override configuration values, such as ``MYAPP__Application__workers``
+ENV_DELIMITER = '__'
+
 APPLICATION = {'wake_interval': 60}
 
 DAEMON = {'user': None,
@@ -63,19 +101,131 @@ class Config(object):
     application. If no configuration file is provided, it will used a set of
     defaults with very basic behavior for logging and daemonization.
 
+    The configuration is merged from an ordered stack of sources, each
+    overriding the values of those before it: the defaults, the
+    configuration file, the included files and the files in included
+    directories, environment variables starting with the prefix, and the
+    ``Section:key=value`` overrides. Remote files are retrieved concurrently
+    and the merged configuration is computed once each time it is loaded.
+
+    Remote configuration files are fetched with a persistent HTTP session,
+    with the timeout, retries and last-known-good cache directory set by the
+    class attributes below or the ``HELPER_HTTP_TIMEOUT``,
+    ``HELPER_HTTP_RETRIES`` and ``HELPER_CONFIG_CACHE`` environment
+    variables.
+
     """
-    def __init__(self, file_path=None):
+    #: How long to wait for a remote configuration server, in seconds
+    HTTP_TIMEOUT = 10
+
+    #: How many times to retry a failed request for a remote configuration
+    HTTP_RETRIES = 3
+
+    #: The directory to keep the last-known-good copy of remote
+    #: configuration files in, which is used when the server can not be
+    #: reached, and the compiled copy of each parsed configuration file,
+    #: which is used in place of parsing it again when its content has not
+    #: changed. The cache is disabled when not set.
+    CACHE_DIRECTORY = None
+
+    def __init__(self, file_path=None, schema=None, includes=None,
+                 env_prefix=None, overrides=None, validator=None):
         """Create a new instance of the configuration object, passing in the
-        path to the configuration file.
+        path to the configuration file and optionally the schema of the
+        Application section, used to build :attr:`Config.snapshot`, and the
+        sources layered on top of the configuration file.
 
         :param str file_path: The path to the configuration file
+        :param dict schema: The schema of the Application section, as
+            accepted by :func:`snapshot_type`
+        :param list includes: Paths or URLs of configuration files, or
+            directories of them, that override the configuration file
+        :param str env_prefix: The prefix of the environment variables that
+            override configuration values
+        :param list overrides: ``Section:key=value`` overrides of
+            configuration values
+        :param callable validator: Invoked with the Application section
+            before it is applied, raising ValueError if it is invalid
         :raises: ValueError
 
         """
-        self._values = self._default_configuration()
-        self._file_path = self._normalize_file_path(file_path)
-        if self._file_path:
-            self._values.update(self._load_config_file())
+        self._validator = validator
+        self._schema = (snapshot_type('Application', schema)
+                        if schema is not None else None)
+        self._fragments = []
+        self._includes = list(includes or [])
+        self._layers = {}
+        self._sections = {}
+        self._snapshot = None
+        self._values = None
+        self._init_source(
+            self._normalize_file_path(file_path),
+            os.environ.get('HELPER_CONFIG_CACHE', self.CACHE_DIRECTORY),
+            int(os.environ.get('HELPER_HTTP_RETRIES', self.HTTP_RETRIES)),
+            float(os.environ.get('HELPER_HTTP_TIMEOUT', self.HTTP_TIMEOUT)))
+        self._environment = flatdict.FlatDict(
+            self._environment_values(env_prefix) if env_prefix else {})
+        self._overrides = flatdict.FlatDict(
+            self._parse_overrides(overrides or []))
+        self._set_values(self._load())
+
+    @property
+    def file_path(self):
+        """Return the normalized path or URL of the configuration file, or
+        None if the defaults are used.
+
+        :rtype: str|None
+
+        """
+        return self._file_path
+
+    @property
+    def file_paths(self):
+        """Return the normalized paths or URLs of the configuration file and
+        the included files, in the order they are merged in.
+
+        :rtype: list
+
+        """
+        return [source.file_path for source in self._sources()]
+
+    @property
+    def include_paths(self):
+        """Return the normalized paths or URLs of the included files and
+        directories, as they were passed in, without expanding directories.
+
+        :rtype: list
+
+        """
+        include_paths = []
+        for include in self._includes:
+            include = self._normalize_file_path(include)
+            if include != self._file_path and include not in include_paths:
+                include_paths.append(include)
+        return include_paths
+
+    @property
+    def snapshot(self):
+        """Return the typed, read-only snapshot of the Application section
+        built from the schema, or None if there is no schema. Each load or
+        reload replaces the snapshot with a new one, so a reference to it is
+        consistent for as long as it is held.
+
+        :rtype: Snapshot|None
+
+        """
+        return self._snapshot
+
+    @property
+    def version(self):
+        """Return the version of the remote configuration that was last
+        loaded, which is its ETag or Consul index, or None if it does not
+        have one.
+
+        :rtype: str|None
+
+        """
+        return self._etag
 
     def get(self, name, default=None):
         """Return the value for key if key is in the configuration, else default.
@@ -89,28 +239,62 @@ class Config(object):
 
     @property
     def application(self):
-        return self._values['Application'].as_dict()
+        """Return the read-only Application section, which is computed once
+        each time the configuration is loaded.
+
+        :rtype: dict
+
+        """
+        return self._sections['Application']
 
     @property
     def daemon(self):
-        return self._values['Daemon'].as_dict()
+        """Return the read-only Daemon section, which is computed once each
+        time the configuration is loaded.
+
+        :rtype: dict
+
+        """
+        return self._sections['Daemon']
 
     @property
     def logging(self):
-        return self._values['Logging'].as_dict()
+        """Return the read-only Logging section, which is computed once each
+        time the configuration is loaded.
+
+        :rtype: dict
+
+        """
+        return self._sections['Logging']
 
     def reload(self):
-        """Reload the configuration from disk returning True if the
-        configuration has changed from the previous values.
+        """Reload the configuration from disk, returning the keys that were
+        added, removed or changed from the previous values. The result is
+        truthy only if the configuration has changed.
+
+        Each configuration file is only parsed if it has changed since it
+        was last loaded, as detected by its size, modification time and
+        content hash for local files and by the ETag returned for remote
+        files, and the configuration is only merged again if one of them
+        changed or a file was added to or removed from an included
+        directory.
+
+        :rtype: ConfigChanges
+        :raises: ValueError
 
         """
-        config = self._default_configuration()
-        if self._file_path:
-            config.update(self._load_config_file())
-        if config != self._values:
-            self._values = config
-            return True
-        return False
+        config = self._load(changed_only=True)
+        if config is None:
+            return ConfigChanges()
+        changes = ConfigChanges(self._values.as_dict(), config.as_dict())
+        if changes:
+            try:
+                self._set_values(config)
+            except ValueError:
+                for source in self._sources():
+                    source._reset_source_version()
+                raise
+        return changes
 
     @staticmethod
     def _default_configuration():
@@ -125,45 +309,259 @@ class Config(object):
             'Logging': LOGGING
         })
 
-    def _load_config_file(self):
+    @staticmethod
+    def _environment_values(prefix):
+        """Return the configuration values set by the environment variables
+        starting with the prefix, such as ``MYAPP__Application__workers``
+        for the ``MYAPP`` prefix. The section is title-cased, the case of
+        the keys is kept and each value is parsed as YAML.
+
+        :param str prefix: The environment variable prefix
+        :rtype: dict
+
+        """
+        prefix = prefix + ENV_DELIMITER
+        return _nest((name[len(prefix):].split(ENV_DELIMITER), value)
+                     for name, value in sorted(os.environ.items())
+                     if name.startswith(prefix) and len(name) > len(prefix))
+
+    def _init_source(self, file_path, cache_directory, http_retries,
+                     http_timeout):
+        """Set the state used to read, cache and check the configuration
+        file for changes, shared by the configuration and the files that are
+        included in it.
+
+        :param str file_path: The normalized path or URL of the file
+        :param str cache_directory: The cache directory, if any
+        :param int http_retries: How many times to retry a remote request
+        :param float http_timeout: How long to wait for a remote server
+
+        """
+        self._consul = None
+        self._s3 = None
+        self._session = None
+        self.cache_directory = cache_directory
+        self.http_retries = http_retries
+        self.http_timeout = http_timeout
+        self._reset_source_version()
+        self._file_path = file_path
+
+    def _include_paths(self):
+        """Return the normalized paths of the included files, expanding each
+        included directory into the files in it with one of the
+        :data:`INCLUDE_EXTENSIONS`, sorted by name.
+
+        :rtype: list
+
+        """
+        file_paths = []
+        for include in self._includes:
+            include = self._normalize_file_path(include)
+            if '://' not in include and path.isdir(include):
+                file_paths.extend(
+                    path.join(include, name)
+                    for name in sorted(os.listdir(include))
+                    if path.splitext(name)[1].lower() in INCLUDE_EXTENSIONS)
+            elif include not in file_paths:
+                file_paths.append(include)
+        return [file_path for file_path in file_paths
+                if file_path != self._file_path]
+
+    def _load(self, changed_only=False):
+        """Load each of the configuration files and return the configuration
+        merged from all of the sources. If ``changed_only`` is set, None is
+        returned when none of the files have changed since they were last
+        loaded and no files were added to or removed from an included
+        directory.
+
+        :param bool changed_only: Only merge the configuration if a file
+            has changed
+        :rtype: flatdict.FlatDict|None
+        :raises: ValueError
+
+        """
+        fragments = dict((fragment.file_path, fragment)
+                         for fragment in self._fragments)
+        self._fragments = [fragments.get(file_path) or
+                           _Fragment(file_path, self)
+                           for file_path in self._include_paths()]
+        sources = self._sources()
+        try:
+            loaded = self._load_sources(sources, changed_only)
+        except ValueError:
+            for source in sources:
+                source._reset_source_version()
+            raise
+        layers = {}
+        for source, values in zip(sources, loaded):
+            layers[source.file_path] = (
+                self._layers[source.file_path] if values is None else values)
+        changed = (set(layers) != set(self._layers) or
+                   any(values is not None for values in loaded))
+        if changed_only and not changed:
+            return None
+        self._layers = layers
+        config = self._default_configuration()
+        for source in sources:
+            config.update(layers[source.file_path])
+        config.update(self._environment)
+        config.update(self._overrides)
+        return config
+
+    def _load_sources(self, sources, changed_only):
+        """Load each configuration file, retrieving remote files
+        concurrently when there is more than one of them, returning the
+        values of each in order, or None for each file that has not changed
+        when ``changed_only`` is set.
+
+        :param list sources: The configuration files to load
+        :param bool changed_only: Only load the files that have changed
+        :rtype: list
+        :raises: ValueError
+
+        """
+        pending = {}
+        remote = [source for source in sources if '://' in source.file_path]
+        if futures is not None and len(remote) > 1:
+            executor = futures.ThreadPoolExecutor(len(remote))
+            try:
+                for source in remote:
+                    pending[source.file_path] = executor.submit(
+                        source._load_config_file, changed_only and
+                        source.file_path in self._layers)
+            finally:
+                executor.shutdown(wait=False)
+        loaded = []
+        for source in sources:
+            if source.file_path in pending:
+                loaded.append(pending[source.file_path].result())
+            else:
+                loaded.append(source._load_config_file(
+                    changed_only and source.file_path in self._layers))
+        return loaded
+
+    @staticmethod
+    def _parse_overrides(overrides):
+        """Return the configuration values set by ``Section:key=value``
+        overrides, such as those passed with ``--set``. Nested keys are
+        separated by a colon and each value is parsed as YAML.
+
+        :param list overrides: The overrides to parse
+        :rtype: dict
+        :raises: ValueError
+
+        """
+        values = []
+        for override in overrides:
+            key, separator, value = override.partition('=')
+            names = key.strip().split(ConfigChanges.DELIMITER)
+            if not separator or not all(names):
+                raise ValueError('Invalid configuration override {!r}, '
+                                 'expected Section:key=value'.format(override))
+            values.append((names, value))
+        return _nest(values)
+
+    def _set_values(self, values):
+        """Replace the configuration values, converting each section into a
+        read-only view once so that reading a section does not rebuild it.
+        The views are swapped in with a single assignment so readers in other
+        threads see either the previous or the new sections.
+
+        When there is a validator or a schema, the Application section is
+        validated and a new snapshot of it built before anything is replaced.
+
+        :param flatdict.FlatDict values: The configuration values
+        :raises: ValueError
+
+        """
+        sections = dict((name, _freeze(values[name].as_dict()))
+                        for name in ['Application', 'Daemon', 'Logging'])
+        if self._validator:
+            self._validator(sections['Application'])
+        snapshot = None
+        if self._schema:
+            snapshot = self._schema(sections['Application'])
+        self._snapshot = snapshot
+        self._sections = sections
+        self._values = values
+
+    def _load_config_file(self, changed_only=False):
         """Load the configuration file into memory, returning the content.
+        If ``changed_only`` is set, None is returned without parsing the
+        file when it has not changed since it was last loaded.
+
+        :param bool changed_only: Only load the file if it has changed
+        :rtype: flatdict.FlatDict|None
+        :raises: ValueError
 
         """
+        try:
+            content = self._read_config(changed_only)
+        except (IOError, OSError) as error:
+            raise ValueError('Could not read configuration file: %s' % error)
+        if content is None:
+            LOGGER.debug('Configuration in %s is unchanged', self._file_path)
+            return None
         LOGGER.info('Loading configuration from %s', self._file_path)
-        if self._file_path.endswith('json'):
-            config = self._load_json_config()
-        else:
-            config = self._load_yaml_config()
+        config = self._read_compiled()
+        if config is None:
+            try:
+                if self._file_path.endswith('json') or \
+                        self._is_consul_prefix:
+                    config = self._load_json_config(content)
+                else:
+                    config = self._load_yaml_config(content)
+                if not isinstance(config, dict):
+                    raise ValueError(
+                        'Configuration in {} is not a mapping'.format(
+                            self._file_path))
+            except ValueError:
+                self._reset_source_version()
+                raise
+            self._write_compiled(config)
+        if '://' in self._file_path:
+            self._write_cache(content)
         for key, value in [(k, v) for k, v in config.items()]:
             if key.title() != key:
                 config[key.title()] = value
                 del config[key]
         return flatdict.FlatDict(config)
 
-    def _load_json_config(self):
+    @property
+    def _is_consul_prefix(self):
+        """Returns True if the configuration is read from a prefix in the
+        Consul KV store, which is loaded as a JSON document.
+
+        :rtype: bool
+
+        """
+        return (self._file_path.startswith('consul://') and
+                self._consul_kv().is_prefix)
+
+    @staticmethod
+    def _load_json_config(content):
         """Load the configuration file in JSON format
 
+        :param str content: The configuration file content
         :rtype: dict
 
         """
         try:
-            return json.loads(self._read_config())
+            return json.loads(content)
         except ValueError as error:
             raise ValueError(
                 'Could not read configuration file: {}'.format(error))
 
-    def _load_yaml_config(self):
+    @staticmethod
+    def _load_yaml_config(content):
         """Loads the configuration file from a .yaml or .yml file
 
+        :param str content: The configuration file content
         :type: dict
 
         """
         try:
-            config = self._read_config()
-        except OSError as error:
-            raise ValueError('Could not read configuration file: %s' % error)
-        try:
-            return yaml.safe_load(config)
+            return yaml.load(content, Loader=YAML_LOADER)
         except yaml.YAMLError as error:
             message = '\n'.join(['    > %s' % line
                                  for line in str(error).split('\n')])
@@ -184,37 +582,143 @@ class Config(object):
         """
         if not file_path:
             return None
-        elif file_path.startswith('s3://') or \
+        elif file_path.startswith('consul://') or \
+                file_path.startswith('s3://') or \
                 file_path.startswith('http://') or \
                 file_path.startswith('https://'):
             return file_path
         return path.abspath(file_path)
 
-    def _read_config(self):
+    def _content_changed(self, content):
+        """Return True if the hash of the content differs from the content
+        that was last read, recording the new hash.
+
+        :param bytes content: The raw configuration file content
+        :rtype: bool
+
+        """
+        checksum = hashlib.sha1(content).hexdigest()
+        if checksum == self._checksum:
+            return False
+        self._checksum = checksum
+        return True
+
+    def _read_config(self, changed_only=False):
         """Read the configuration from the various places it may be read from.
+        If ``changed_only`` is set, None is returned when the source has not
+        changed since it was last read.
 
-        :rtype: str
+        :param bool changed_only: Only return the content if it has changed
+        :rtype: str|None
         :raises: ValueError
 
         """
         if not self._file_path:
             return None
+        elif self._file_path.startswith('consul://'):
+            content = self._read_consul_config(changed_only)
         elif self._file_path.startswith('s3://'):
-            return self._read_s3_config()
+            content = self._read_s3_config(changed_only)
         elif self._file_path.startswith('http://') or \
                 self._file_path.startswith('https://'):
-            return self._read_remote_config()
-        elif not path.exists(self._file_path):
+            content = self._read_remote_config(changed_only)
+        else:
+            content = self._read_local_config(changed_only)
+        if content is None:
+            return None
+        changed = self._content_changed(content)
+        if changed_only and not changed:
+            return None
+        return content.decode('utf-8')
+
+    def _read_consul_config(self, changed_only):
+        """Read the configuration from a key or prefix in the Consul KV
+        store, returning None if ``changed_only`` is set and the Consul index
+        has not changed since it was last read.
+
+        When Consul can not be reached, the last-known-good copy in the
+        cache directory is used when first loading the configuration, and
+        the current configuration is kept when reloading it.
+
+        :param bool changed_only: Only return the content if it has changed
+        :rtype: bytes|None
+        :raises: ValueError
+
+        """
+        try:
+            import requests
+        except ImportError:
             raise ValueError(
-                'Configuration file not found: {}'.format(self._file_path))
+                'consul URL specified but requests not installed')
+        cached = self._use_cache(changed_only)
+        try:
+            content, index = self._consul_kv().get()
+        except (requests.RequestException, ValueError) as error:
+            return self._remote_fallback(changed_only, cached, error)
+        if (changed_only or cached) and str(index) == self._etag:
+            return cached['content'].encode('utf-8') if cached else None
+        self._etag = str(index)
+        return content.encode('utf-8')
+
+    def _read_local_config(self, changed_only):
+        """Read the configuration file from the local filesystem, returning
+        None if ``changed_only`` is set and the file has the same size,
+        inode and modification time as when it was last read.
+
+        A file that was modified within the last :data:`STAT_GRACE` seconds
+        is always read, since it could be modified again without its
+        modification time changing.
 
-        with open(self._file_path, 'r') as handle:
+        :param bool changed_only: Only return the content if it has changed
+        :rtype: bytes|None
+        :raises: ValueError
+
+        """
+        if not path.exists(self._file_path):
+            raise ValueError(
+                'Configuration file not found: {}'.format(self._file_path))
+        stat = os.stat(self._file_path)
+        signature = (stat.st_ino, stat.st_size,
+                     getattr(stat, 'st_mtime_ns', stat.st_mtime))
+        if changed_only and signature == self._stat:
+            return None
+        trusted = time.time() - stat.st_mtime > STAT_GRACE
+        self._stat = signature if trusted else None
+        with open(self._file_path, 'rb') as handle:
             return handle.read()
 
-    def _read_remote_config(self):
-        """Read a remote config via URL.
+    def _read_cache(self):
+        """Return the last-known-good copy of the remote configuration file
+        from the cache directory, or None if there is not one.
 
-        :rtype: str
+        :rtype: dict|None
+
+        """
+        cache_path = self._cache_path()
+        if not cache_path or not path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, 'r') as handle:
+                cached = json.load(handle)
+        except (IOError, OSError, ValueError) as error:
+            LOGGER.warning('Could not read cached configuration %s: %s',
+                           cache_path, error)
+            return None
+        if cached.get('file_path') != self._file_path:
+            return None
+        return cached
+
+    def _read_remote_config(self, changed_only):
+        """Read a remote config via URL, returning None if ``changed_only``
+        is set and the server reports the content has not changed since the
+        ETag or Last-Modified time it returned when it was last read.
+
+        When the server can not be reached, the last-known-good copy in the
+        cache directory is used when first loading the configuration, and
+        the current configuration is kept when reloading it.
+
+        :param bool changed_only: Only return the content if it has changed
+        :rtype: bytes|None
         :raises: ValueError
 
         """
@@ -225,17 +729,60 @@ class Config(object):
         if not requests:
             raise ValueError(
                 'Remote config URL specified but requests not installed')
-        result = requests.get(self._file_path)
-        if not result.ok:
-            raise ValueError(
-                'Failed to retrieve remote config: {}'.format(
-                    result.status_code))
-        return result.text
+        cached = self._use_cache(changed_only)
+        headers = {}
+        if (changed_only or cached) and self._etag:
+            headers['If-None-Match'] = self._etag
+        if (changed_only or cached) and self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        try:
+            result = self._http_session().get(
+                self._file_path, headers=headers, timeout=self.http_timeout)
+        except requests.RequestException as error:
+            return self._remote_fallback(changed_only, cached, error)
+        if result.status_code == 304:
+            return cached['content'].encode('utf-8') if cached else None
+        elif not result.ok:
+            return self._remote_fallback(changed_only, cached,
+                                         result.status_code)
+        self._etag = result.headers.get('ETag')
+        self._last_modified = result.headers.get('Last-Modified')
+        return result.text.encode('utf-8')
 
-    def _read_s3_config(self):
-        """Read in the value of the configuration file in Amazon S3.
+    def _remote_fallback(self, changed_only, cached, error):
+        """Handle a failure to retrieve the remote configuration, returning
+        the cached copy when first loading it, or None to keep the current
+        configuration when reloading it.
 
-        :rtype: str
+        :param bool changed_only: If the configuration is being reloaded
+        :param dict|None cached: The cached copy of the configuration
+        :param mixed error: The exception or HTTP status code
+        :rtype: bytes|None
+        :raises: ValueError
+
+        """
+        if cached:
+            LOGGER.warning('Failed to retrieve remote config (%s), using the '
+                           'cached copy', error)
+            return cached['content'].encode('utf-8')
+        elif changed_only:
+            LOGGER.warning('Failed to retrieve remote config (%s), keeping '
+                           'the current configuration', error)
+            return None
+        raise ValueError(
+            'Failed to retrieve remote config: {}'.format(error))
+
+    def _read_s3_config(self, changed_only):
+        """Read in the value of the configuration file in Amazon S3,
+        returning None if ``changed_only`` is set and the object's ETag has
+        not changed since it was last read.
+
+        When S3 can not be reached, the last-known-good copy in the cache
+        directory is used when first loading the configuration, and the
+        current configuration is kept when reloading it.
+
+        :param bool changed_only: Only return the content if it has changed
+        :rtype: bytes|None
         :raises: ValueError
 
         """
@@ -249,14 +796,586 @@ class Config(object):
             raise ValueError(
                 's3 URL specified for configuration but boto3 not installed')
         parsed = parse.urlparse(self._file_path)
+        kwargs = {'Bucket': parsed.netloc, 'Key': parsed.path.lstrip('/')}
+        cached = self._use_cache(changed_only)
+        if (changed_only or cached) and self._etag:
+            kwargs['IfNoneMatch'] = self._etag
         try:
-            response = boto3.client(
-                's3', endpoint_url=os.environ.get('S3_ENDPOINT')).get_object(
-                    Bucket=parsed.netloc, Key=parsed.path.lstrip('/'))
-        except botocore.exceptions.ClientError as e:
-            raise ValueError(
-                'Failed to download configuration from S3: {}'.format(e))
-        return response['Body'].read().decode('utf-8')
+            response = self._s3_client().get_object(**kwargs)
+        except botocore.exceptions.ClientError as error:
+            if error.response.get('Error', {}).get('Code') in (
+                    '304', 'NotModified'):
+                return cached['content'].encode('utf-8') if cached else None
+            return self._remote_fallback(changed_only, cached, error)
+        except botocore.exceptions.BotoCoreError as error:
+            return self._remote_fallback(changed_only, cached, error)
+        self._etag = response.get('ETag')
+        return response['Body'].read()
+
+    def _cache_path(self, suffix='.json'):
+        """Return the path of the cached copy of the remote configuration
+        file, or None if the cache is disabled.
+
+        :param str suffix: The suffix of the cached file
+        :rtype: str|None
+
+        """
+        if not self.cache_directory:
+            return None
+        return path.join(self.cache_directory, '{}{}'.format(
+            hashlib.sha1(self._file_path.encode('utf-8')).hexdigest(),
+            suffix))
+
+    def _compiled_path(self):
+        """Return the path of the compiled copy of the parsed configuration,
+        keyed by the hash of the content it was parsed from, or None if the
+        cache is disabled.
+
+        :rtype: str|None
+
+        """
+        if not self._checksum:
+            return None
+        return self._cache_path('-{}-{}.marshal'.format(
+            self._checksum, marshal.version))
+
+    def _consul_kv(self):
+        """Return the Consul KV key or prefix the configuration is read from,
+        creating it on first use so that its HTTP session is reused across
+        reloads.
+
+        :rtype: helper.consul.KV
+        :raises: ValueError
+
+        """
+        if self._consul is None:
+            self._consul = consul.KV(self._file_path, self._http_session(),
+                                     self.http_timeout)
+        return self._consul
+
+    def _http_session(self):
+        """Return the HTTP session used to retrieve remote configuration
+        files, creating it on first use so that connections are reused
+        across reloads.
+
+        :rtype: requests.Session
+
+        """
+        if self._session is None:
+            import requests
+            import requests.adapters
+            from urllib3.util import retry
+            adapter = requests.adapters.HTTPAdapter(
+                max_retries=retry.Retry(
+                    total=self.http_retries, backoff_factor=0.5,
+                    status_forcelist=(500, 502, 503, 504)))
+            self._session = requests.Session()
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
+
+    def _s3_client(self):
+        """Return the S3 client used to retrieve configuration files,
+        creating it on first use so that it is reused across reloads.
+
+        :rtype: botocore.client.S3
+
+        """
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client(
+                's3', endpoint_url=os.environ.get('S3_ENDPOINT'))
+        return self._s3
+
+    def _reset_source_version(self):
+        """Forget the version of the configuration source that was last
+        read, so that it is read and parsed again on the next reload.
+
+        """
+        self._checksum = None
+        self._etag = None
+        self._last_modified = None
+        self._stat = None
+
+    def _sources(self):
+        """Return the configuration file and the included files, in the
+        order they are merged in.
+
+        :rtype: list
+
+        """
+        return ([self] if self._file_path else []) + self._fragments
+
+    def _read_compiled(self):
+        """Return the parsed configuration from the compiled cache if the
+        content it was parsed from has not changed, otherwise None.
+
+        :rtype: dict|None
+
+        """
+        compiled_path = self._compiled_path()
+        if not compiled_path or not path.exists(compiled_path):
+            return None
+        try:
+            with open(compiled_path, 'rb') as handle:
+                config = marshal.load(handle)
+        except (IOError, OSError, EOFError, ValueError, TypeError) as error:
+            LOGGER.warning('Could not read compiled configuration %s: %s',
+                           compiled_path, error)
+            return None
+        return config if isinstance(config, dict) else None
+
+    def _use_cache(self, changed_only):
+        """Return the cached copy of the remote configuration file when
+        first loading the configuration, restoring the ETag and Last-Modified
+        values it was retrieved with so that the request for it is
+        conditional.
+
+        :param bool changed_only: If the configuration is being reloaded
+        :rtype: dict|None
+
+        """
+        cached = None if changed_only else self._read_cache()
+        if cached:
+            self._etag = cached.get('etag')
+            self._last_modified = cached.get('last_modified')
+        return cached
+
+    def _write_cache(self, content):
+        """Atomically replace the cached copy of the remote configuration
+        file, if the cache is enabled.
+
+        :param str content: The configuration file content
+
+        """
+        cache_path = self._cache_path()
+        if not cache_path:
+            return
+        try:
+            if not path.isdir(self.cache_directory):
+                os.makedirs(self.cache_directory, 0o700)
+            handle, temp_path = tempfile.mkstemp(dir=self.cache_directory)
+            with os.fdopen(handle, 'w') as handle:
+                json.dump({'file_path': self._file_path,
+                           'etag': self._etag,
+                           'last_modified': self._last_modified,
+                           'content': content}, handle)
+            getattr(os, 'replace', os.rename)(temp_path, cache_path)
+        except (IOError, OSError) as error:
+            LOGGER.warning('Could not write cached configuration %s: %s',
+                           cache_path, error)
+
+    def _write_compiled(self, config):
+        """Write the parsed configuration to the compiled cache, removing
+        the compiled copies of previous versions of the file. Configuration
+        that contains values marshal can not serialize, such as dates, is
+        not cached.
+
+        :param dict config: The parsed configuration
+
+        """
+        compiled_path = self._compiled_path()
+        if not compiled_path:
+            return
+        try:
+            data = marshal.dumps(config)
+        except ValueError:
+            LOGGER.debug('Configuration can not be compiled, not caching it')
+            return
+        prefix = path.basename(self._cache_path('-'))
+        try:
+            if not path.isdir(self.cache_directory):
+                os.makedirs(self.cache_directory, 0o700)
+            for name in os.listdir(self.cache_directory):
+                if name.startswith(prefix) and name.endswith('.marshal'):
+                    os.unlink(path.join(self.cache_directory, name))
+            handle, temp_path = tempfile.mkstemp(dir=self.cache_directory)
+            with os.fdopen(handle, 'wb') as handle:
+                handle.write(data)
+            getattr(os, 'replace', os.rename)(temp_path, compiled_path)
+        except (IOError, OSError) as error:
+            LOGGER.warning('Could not write compiled configuration %s: %s',
+                           compiled_path, error)
+
+
+class _Fragment(Config):
+    """A configuration file that is layered on top of the configuration
+    file, which is read, cached and checked for changes in the same way but
+    does not include the defaults.
+
+    :param str file_path: The normalized path or URL of the file
+    :param Config parent: The configuration the file is included in
+
+    """
+    def __init__(self, file_path, parent):
+        self._init_source(file_path, parent.cache_directory,
+                          parent.http_retries, parent.http_timeout)
+
+
+class ConfigChanges(object):
+    """The flattened keys that were added, removed or changed when the
+    configuration was reloaded, such as ``Application:wake_interval``.
+    Instances are truthy only if something changed.
+
+    :param dict previous: The previous configuration values
+    :param dict current: The current configuration values
+
+    """
+    DELIMITER = ':'
+
+    def __init__(self, previous=None, current=None):
+        previous = dict(_flatten(previous or {}, self.DELIMITER))
+        current = dict(_flatten(current or {}, self.DELIMITER))
+        self.added = frozenset(set(current) - set(previous))
+        self.removed = frozenset(set(previous) - set(current))
+        self.changed = frozenset(key for key in set(previous) & set(current)
+                                 if previous[key] != current[key])
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<ConfigChanges added={} removed={} changed={}>'.format(
+            sorted(self.added), sorted(self.removed), sorted(self.changed))
+
+    def affects(self, prefix):
+        """Return True if the key, or any key beneath it, was added, removed
+        or changed. For example ``changes.affects('Logging')`` is True if any
+        logging configuration changed.
+
+        :param str prefix: The flattened key to check
+        :rtype: bool
+
+        """
+        nested = prefix + self.DELIMITER
+        return any(key == prefix or key.startswith(nested)
+                   for key in self.keys)
+
+    @property
+    def keys(self):
+        """Return all of the keys that were added, removed or changed.
+
+        :rtype: frozenset
+
+        """
+        return self.added | self.removed | self.changed
+
+    @property
+    def sections(self):
+        """Return the names of the top-level sections that changed.
+
+        :rtype: frozenset
+
+        """
+        return frozenset(key.split(self.DELIMITER, 1)[0] for key in self.keys)
+
+
+def _flatten(value, delimiter, prefix=None):
+    """Yield the flattened key and value pairs of the nested dict.
+
+    :param dict value: The dict to flatten
+    :param str delimiter: The delimiter between nested keys
+    :param str prefix: The flattened key of the dict
+    :rtype: iterator
+
+    """
+    for key, item in value.items():
+        key = str(key) if prefix is None else \
+            '{}{}{}'.format(prefix, delimiter, key)
+        if isinstance(item, dict) and item:
+            for pair in _flatten(item, delimiter, key):
+                yield pair
+        else:
+            yield key, item
+
+
+def _handler_arguments(definition):
+    """Return the parts of a logging handler's definition that require it
+    to be created again when they change, which is everything but its
+    level, formatter, filters and target.
+
+    :param dict definition: The handler's definition
+    :rtype: dict
+
+    """
+    return dict((key, value) for key, value in definition.items()
+                if key not in ('filters', 'formatter', 'level', 'target'))
+
+
+def _nest(items):
+    """Return the nested dict built from pairs of key names and values,
+    title-casing the section name and parsing each value as YAML, falling
+    back to the string when it is not valid YAML.
+
+    :param iterator items: Pairs of the list of key names and the value
+    :rtype: dict
+
+    """
+    values = {}
+    for names, value in items:
+        try:
+            value = yaml.load(value, Loader=YAML_LOADER)
+        except yaml.YAMLError:
+            pass
+        node = values
+        names = [names[0].title()] + list(names[1:])
+        for name in names[:-1]:
+            if not isinstance(node.get(name), dict):
+                node[name] = {}
+            node = node[name]
+        node[names[-1]] = value
+    return values
+
+
+class Snapshot(object):
+    """The base class of the snapshot types returned by
+    :func:`snapshot_type`.
+    Values are stored in ``__slots__`` and read with attribute access, and
+    a snapshot can not be modified once it is created, so a reference to one
+    can be shared between threads.
+
+    :param dict values: The configuration values to take a snapshot of
+    :raises: ValueError
+
+    """
+    __slots__ = ()
+
+    #: The field names, types and defaults of the snapshot type
+    _fields = ()
+
+    def __init__(self, values=None):
+        values = values or {}
+        if not isinstance(values, dict):
+            raise ValueError('Expected a mapping for {}, received {!r}'.format(
+                self.__class__.__name__, values))
+        for name, kind, default in self._fields:
+            value = values.get(name, default)
+            object.__setattr__(self, name, _coerce(name, kind, value))
+
+    def __delattr__(self, name):
+        raise AttributeError('Configuration snapshots are read-only')
+
+    def __eq__(self, other):
+        return (self.__class__ is other.__class__ and
+                self.as_dict() == other.as_dict())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name, _kind, _default
+                          in self._fields))
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, ' '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name, _kind, _default in self._fields))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configuration snapshots are read-only')
+
+    def as_dict(self):
+        """Return the snapshot as a dict, including nested snapshots.
+
+        :rtype: dict
+
+        """
+        values = {}
+        for name, _kind, _default in self._fields:
+            value = getattr(self, name)
+            if isinstance(value, Snapshot):
+                value = value.as_dict()
+            elif isinstance(value, tuple):
+                value = list(value)
+            values[name] = value
+        return values
+
+
+def snapshot_type(name, schema):
+    """Return a :class:`Snapshot` type for the schema, which maps each field
+    name to its default value, to a type for a field without a default, or
+    to a dict that is the schema of a nested snapshot. The type of a field
+    with a default is the type of the default, and values are converted to
+    it, so that a value of ``"30"`` for a field with a default of ``60``
+    becomes ``30``. Lists are stored as tuples.
+
+    :param str name: The name of the snapshot type
+    :param dict schema: The schema
+    :rtype: type
+    :raises: ValueError
+
+    """
+    fields = []
+    for field in sorted(schema):
+        if not _IDENTIFIER.match(field) or keyword.iskeyword(field):
+            raise ValueError('Invalid configuration field name {!r}'.format(
+                field))
+        spec = schema[field]
+        if isinstance(spec, dict) and spec:
+            kind = snapshot_type('{}_{}'.format(name, field), spec)
+            default = None
+        elif isinstance(spec, type):
+            kind, default = spec, None
+        elif spec is None:
+            kind, default = None, None
+        else:
+            kind, default = type(spec), spec
+        fields.append((field, kind, default))
+    return type(str(name), (Snapshot,), {
+        '__slots__': tuple(field for field, _kind, _default in fields),
+        '_fields': tuple(fields)})
+
+
+def _coerce(name, kind, value):
+    """Return the value converted to the field's type.
+
+    :param str name: The name of the field
+    :param type kind: The type of the field, if it has one
+    :param mixed value: The value to convert
+    :rtype: mixed
+    :raises: ValueError
+
+    """
+    if isinstance(kind, type) and issubclass(kind, Snapshot):
+        return kind(value)
+    elif value is None or kind is None:
+        return _immutable(value)
+    elif kind is bool:
+        if isinstance(value, bool):
+            return value
+        elif str(value).lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        elif str(value).lower() in ('0', 'false', 'no', 'off'):
+            return False
+    elif kind in (list, tuple):
+        if isinstance(value, (list, tuple)):
+            return tuple(_immutable(item) for item in value)
+    elif kind is dict:
+        if isinstance(value, dict):
+            return _immutable(value)
+    elif isinstance(value, kind):
+        return value
+    else:
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            pass
+    raise ValueError('Invalid value for {}: {!r} is not {}'.format(
+        name, value, kind.__name__))
+
+
+def _immutable(value):
+    """Return an immutable copy of an untyped value, converting lists to
+    tuples and dicts to read-only dicts.
+
+    :param mixed value: The value to convert
+    :rtype: mixed
+
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_immutable(item) for item in value)
+    return _freeze(value) if isinstance(value, abc.Mapping) else value
+
+
+class _ReadOnlyDict(dict):
+    """A dict that raises :exc:`TypeError` when modified, used for the
+    section views returned by :class:`Config`. Copies are regular, mutable
+    dicts, and :meth:`_ReadOnlyDict.to_dict` returns a mutable copy of the
+    nested values as well.
+
+    """
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Configuration sections are read-only, use '
+                        'to_dict() for a mutable copy')
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def copy(self):
+        return dict(self)
+
+    def to_dict(self):
+        """Return a mutable copy, converting the nested dicts and lists.
+
+        :rtype: dict
+
+        """
+        return copy.deepcopy(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict((key, copy.deepcopy(value, memo))
+                    for key, value in self.items())
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class _ReadOnlyList(list):
+    """A list that raises :exc:`TypeError` when modified, used for lists
+    within the section views returned by :class:`Config`. Copies are
+    regular, mutable lists.
+
+    """
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Configuration sections are read-only, use '
+                        'to_list() for a mutable copy')
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = clear = extend = insert = pop = remove = _read_only
+    reverse = sort = _read_only
+
+    def copy(self):
+        return list(self)
+
+    def to_list(self):
+        """Return a mutable copy, converting the nested dicts and lists.
+
+        :rtype: list
+
+        """
+        return copy.deepcopy(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(value, memo) for value in self]
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+# Represent the read-only views as the mappings and sequences they are, so
+# that they can be passed to yaml.dump and yaml.safe_dump
+for _representer in (yaml.representer.SafeRepresenter,
+                     yaml.representer.Representer):
+    _representer.add_representer(
+        _ReadOnlyDict, yaml.representer.SafeRepresenter.represent_dict)
+    _representer.add_representer(
+        _ReadOnlyList, yaml.representer.SafeRepresenter.represent_list)
+
+
+def _freeze(value):
+    """Return a read-only copy of the value, recursively converting dicts
+    and lists. Other mappings are converted as well, since
+    :meth:`flatdict.FlatDict.as_dict` leaves empty nested sections as
+    :class:`flatdict.FlatDict` instances.
+
+    :param mixed value: The value to convert
+    :rtype: mixed
+
+    """
+    if isinstance(value, abc.Mapping):
+        return _ReadOnlyDict((key, _freeze(item))
+                             for key, item in value.items())
+    elif isinstance(value, list):
+        return _ReadOnlyList(_freeze(item) for item in value)
+    return value
 
 
 class LoggingConfig(object):
@@ -264,10 +1383,27 @@ class LoggingConfig(object):
     semantics and can be used by sub-processes to ensure consistent logging
     rule application.
 
+    When the configuration has a ``queue`` value, the handlers of the root
+    logger and each configured logger are replaced with a queue and records
+    are emitted on a background thread by a
+    :class:`~helper.handlers.QueuePipeline`. The value is either ``true`` or
+    a dict with the ``size`` of the queue and the ``policy`` for when it is
+    full, ``drop`` or ``block``.
+
+    When ``find_caller`` is ``false``, logging calls do not walk the stack
+    to find the file, line and function that made them, which is only
+    needed when they are formatted. This applies to every logger in the
+    process, and the caller lookup is only changed when ``find_caller`` is
+    set.
+
     """
     DEBUG_ONLY = 'debug_only'
     HANDLERS = 'handlers'
     LOGGERS = 'loggers'
+    FILTERS = 'filters'
+    FIND_CALLER = 'find_caller'
+    QUEUE = 'queue'
+    ROOT = 'root'
 
     def __init__(self, configuration, debug=None):
         """Create a new instance of the Logging object passing in the
@@ -281,8 +1417,13 @@ class LoggingConfig(object):
         root_logger = logging.getLogger()
         root_logger.addHandler(logging.NullHandler())
 
-        self.config = dict(configuration)
+        self.config = copy.deepcopy(dict(configuration))
         self.debug = debug
+        self.pipeline = None
+        self._configuration = copy.deepcopy(dict(configuration))
+        self._filters = {}
+        self._find_caller = None
+        self._handlers = {}
         self.configure()
 
     def update(self, configuration, debug=None):
@@ -290,29 +1431,236 @@ class LoggingConfig(object):
         handlers if debug is False. Returns True if the configuration has
         changed from previous configuration values.
 
+        Only the loggers and handlers that changed are reconfigured: a
+        handler whose class and arguments are unchanged is kept open,
+        along with anything it has buffered, and has its level, formatter
+        and filters updated in place. The configuration is applied with
+        :func:`logging.config.dictConfig` instead when its version changed
+        or it is an ``incremental`` configuration.
+
         :param dict configuration: The logging configuration
         :param bool debug: Toggles use of debug_only loggers
         :rtype: bool
+        :raises: ValueError
 
         """
-        if self.config != dict(configuration) and debug != self.debug:
-            self.config = dict(configuration)
-            self.debug = debug
-            self.configure()
-            return True
-        return False
+        if self._configuration == dict(configuration) and \
+                debug == self.debug:
+            return False
+        previous = self.config
+        self._configuration = copy.deepcopy(dict(configuration))
+        self.config = copy.deepcopy(dict(configuration))
+        self.debug = debug
+        self.configure(previous)
+        return True
+
+    def configure(self, previous=None):
+        """Configure the Python stdlib logger, stopping the queue of the
+        previous configuration first so that the records in it are emitted.
+        When the previous configuration is passed, only what changed from
+        it is reconfigured.
+
+        :param dict previous: The previous logging configuration
+        :raises: ValueError
 
-    def configure(self):
-        """Configure the Python stdlib logger"""
+        """
+        self.stop(flush=False)
         if self.debug is not None and not self.debug:
             self._remove_debug_handlers()
         self._remove_debug_only()
-        logging.config.dictConfig(self.config)
+        config = dict(self.config)
+        queue = config.pop(self.QUEUE, None)
+        self._set_find_caller(config.pop(self.FIND_CALLER, None))
+        try:
+            if not self._reconfigure(previous, config):
+                self._clear_filters(config)
+                configurator = logging.config.dictConfigClass(config)
+                configurator.configure()
+                self._handlers = self._configured(configurator, self.HANDLERS)
+                self._filters = self._configured(configurator, self.FILTERS)
+        finally:
+            if queue or queue == {}:
+                self._start_queue(queue if isinstance(queue, dict) else {})
         try:
             logging.captureWarnings(True)
         except AttributeError:
             pass
 
+    def stop(self, flush=True):
+        """Stop the queue, if it is enabled, restoring the configured
+        handlers and emitting and flushing the records that are in it.
+        Invoked when the application is shutting down.
+
+        :param bool flush: Flush the handlers once the queue is empty
+
+        """
+        if self.pipeline is not None:
+            self.pipeline.stop(flush)
+            self.pipeline = None
+
+    def _clear_filters(self, config):
+        """Remove the filters from the root logger and the configured
+        loggers, since configuring a logger adds to its filters instead of
+        replacing them.
+
+        :param dict config: The logging configuration
+
+        """
+        if config.get('incremental'):
+            return
+        for name in [None] + list(config.get(self.LOGGERS) or {}):
+            logging.getLogger(name).filters = []
+
+    @staticmethod
+    def _configured(configurator, section):
+        """Return the objects the configurator created for the handlers or
+        filters section, by name.
+
+        :param logging.config.DictConfigurator configurator: The
+            configurator that applied the configuration
+        :param str section: The section name
+        :rtype: dict
+
+        """
+        return dict((name, value) for name, value in
+                    (configurator.config.get(section) or {}).items()
+                    if not isinstance(value, dict))
+
+    def _reconfigure(self, previous, config):
+        """Apply the changes from the previous configuration, returning
+        False if they must be applied by :func:`logging.config.dictConfig`.
+        Handlers are only created for definitions that are new or whose
+        class or arguments changed, the handlers they replace are closed
+        once no logger uses them, and the loggers that are no longer
+        configured are reset and, as :func:`logging.config.dictConfig` does
+        with ``disable_existing_loggers``, disabled unless they are a child
+        of a configured logger. Filters whose definition is unchanged are
+        kept, so that their state, such as a rate limit, carries over.
+
+        :param dict|None previous: The previous logging configuration
+        :param dict config: The logging configuration to apply
+        :rtype: bool
+        :raises: ValueError
+
+        """
+        if previous is None or config.get('incremental') or \
+                config.get('version') != previous.get('version'):
+            return False
+        configurator = logging.config.DictConfigurator(config)
+        converted = configurator.config
+        formatters = converted.get('formatters') or {}
+        for name in formatters:
+            formatters[name] = configurator.configure_formatter(
+                formatters[name])
+        filters = converted.get(self.FILTERS) or {}
+        previous_filters = previous.get(self.FILTERS) or {}
+        for name in filters:
+            if name in self._filters and \
+                    config[self.FILTERS][name] == previous_filters.get(name):
+                filters[name] = self._filters[name]
+            else:
+                filters[name] = configurator.configure_filter(filters[name])
+
+        definitions = converted.get(self.HANDLERS) or {}
+        previous_definitions = previous.get(self.HANDLERS) or {}
+        handlers = {}
+        for name in sorted(definitions,
+                           key=lambda name: ('target' in definitions[name],
+                                             name)):
+            handler = self._handlers.get(name)
+            if handler is not None and _handler_arguments(
+                    config[self.HANDLERS][name]) == _handler_arguments(
+                        previous_definitions.get(name) or {}):
+                self._update_handler(
+                    configurator, handler, definitions[name], handlers)
+            else:
+                handler = configurator.configure_handler(definitions[name])
+                handler.name = name
+            handlers[name] = definitions[name] = handler
+
+        self._clear_filters(config)
+        if converted.get(self.ROOT):
+            configurator.configure_root(converted[self.ROOT])
+        else:
+            logging.getLogger().handlers = []
+        loggers = converted.get(self.LOGGERS) or {}
+        for name in loggers:
+            configurator.configure_logger(name, loggers[name])
+            logging.getLogger(name).disabled = False
+        disable = config.get('disable_existing_loggers', True)
+        for name in previous.get(self.LOGGERS) or {}:
+            if name not in loggers:
+                logger = logging.getLogger(name)
+                logger.filters = []
+                logger.handlers = []
+                logger.setLevel(logging.NOTSET)
+                logger.propagate = True
+                logger.disabled = disable and not any(
+                    name.startswith(parent + '.') for parent in loggers)
+
+        for name, handler in self._handlers.items():
+            if handlers.get(name) is not handler:
+                handler.close()
+        self._handlers = handlers
+        self._filters = dict(filters)
+        return True
+
+    def _update_handler(self, configurator, handler, definition, handlers):
+        """Update the level, formatter, filters and target of a handler that
+        is kept open.
+
+        :param logging.config.DictConfigurator configurator: The
+            configurator for the new configuration
+        :param logging.Handler handler: The handler to update
+        :param dict definition: The handler's definition
+        :param dict handlers: The handlers configured so far, by name
+        :raises: ValueError
+
+        """
+        try:
+            formatter = definition.get('formatter')
+            handler.setFormatter(configurator.config['formatters'][formatter]
+                                 if formatter else None)
+            if 'target' in definition:
+                handler.target = handlers[definition['target']]
+        except KeyError as error:
+            raise ValueError('Unable to configure handler {!r}: {} is not '
+                             'configured'.format(handler.name, error))
+        handler.setLevel(definition.get('level', logging.NOTSET))
+        handler.filters = []
+        configurator.add_filters(handler, definition.get('filters') or [])
+
+    def _set_find_caller(self, find_caller):
+        """Enable or disable finding the caller of logging calls for the
+        whole process when ``find_caller`` is set, restoring it when the
+        value was set by the previous configuration and is now removed.
+
+        :param bool find_caller: The find_caller value, if set
+
+        """
+        if find_caller is not None:
+            logging._srcfile = _SRCFILE if find_caller else None
+        elif self._find_caller is not None:
+            logging._srcfile = _SRCFILE
+        self._find_caller = find_caller
+
+    def _start_queue(self, options):
+        """Put a queue in front of the handlers of the root logger and the
+        configured loggers, emitting records on a background thread.
+
+        :param dict options: The size of the queue and the policy for when
+            it is full
+        :raises: ValueError
+
+        """
+        loggers = [logging.getLogger()] + [
+            logging.getLogger(name)
+            for name in self.config.get(self.LOGGERS) or {}]
+        self.pipeline = handlers.QueuePipeline(
+            loggers, options.get('size', handlers.QUEUE_SIZE),
+            options.get('policy', handlers.POLICY_DROP))
+        self.pipeline.start()
+
     def _remove_debug_handlers(self):
         """Remove any handlers with an attribute of debug_only that is True and
         remove the references to said handlers from any loggers that are
@@ -323,11 +1671,13 @@ class LoggingConfig(object):
         for handler in self.config[self.HANDLERS]:
             if self.config[self.HANDLERS][handler].get('debug_only'):
                 remove.append(handler)
+        loggers = list((self.config.get(self.LOGGERS) or {}).values())
+        if self.config.get(self.ROOT):
+            loggers.append(self.config[self.ROOT])
         for handler in remove:
             del self.config[self.HANDLERS][handler]
-            for logger in self.config[self.LOGGERS].keys():
-                logger = self.config[self.LOGGERS][logger]
-                if handler in logger[self.HANDLERS]:
+            for logger in loggers:
+                if handler in logger.get(self.HANDLERS, []):
                     logger[self.HANDLERS].remove(handler)
         self._remove_debug_only()
 
@@ -0,0 +1,128 @@
+"""
+Read configuration from the Consul KV store, using blocking queries to wait
+for it to change.
+
+"""
+import base64
+import json
+import logging
+import os
+try:
+    from urllib import parse
+except ImportError:  # Python 2.7 support
+    import urlparse as parse
+
+import yaml
+
+LOGGER = logging.getLogger(__name__)
+
+#: The Consul agent to use when the consul:// URL does not include one
+DEFAULT_ADDRESS = 'localhost:8500'
+
+
+class KV(object):
+    """A key, or a prefix when the path ends with a slash, in the Consul KV
+    store, addressed by a ``consul://host:port/path`` URL. When the host is
+    omitted, the ``CONSUL_HTTP_ADDR`` environment variable is used, and the
+    ``CONSUL_HTTP_TOKEN`` and ``CONSUL_HTTP_SSL`` environment variables are
+    honored, as they are by the Consul CLI.
+
+    The value of a key is a YAML or JSON document. The keys beneath a prefix
+    are loaded into a tree, splitting their paths on ``/``, with each value
+    parsed as YAML so that numbers and booleans keep their type.
+
+    :param str url: The consul:// URL
+    :param requests.Session session: The HTTP session to use
+    :param float timeout: How long to wait for Consul, in addition to the
+        wait time of a blocking query
+
+    """
+    def __init__(self, url, session=None, timeout=10):
+        try:
+            import requests
+        except ImportError:
+            requests = None
+        if not requests:
+            raise ValueError(
+                'consul URL specified but requests not installed')
+        parsed = parse.urlparse(url)
+        address = parsed.netloc or os.environ.get('CONSUL_HTTP_ADDR',
+                                                  DEFAULT_ADDRESS)
+        if '://' not in address:
+            address = '{}://{}'.format(
+                'https' if os.environ.get('CONSUL_HTTP_SSL', '').lower() in
+                ('1', 'true') else 'http', address)
+        self.key = parsed.path.lstrip('/')
+        self.api_url = '{}/v1/kv/{}'.format(address.rstrip('/'), self.key)
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self._headers = {}
+        if os.environ.get('CONSUL_HTTP_TOKEN'):
+            self._headers['X-Consul-Token'] = os.environ['CONSUL_HTTP_TOKEN']
+
+    @property
+    def is_prefix(self):
+        """Returns True if the URL addresses a prefix instead of a key.
+
+        :rtype: bool
+
+        """
+        return self.key.endswith('/') or not self.key
+
+    def get(self, index=None, wait=None):
+        """Return the value of the key, or the keys beneath the prefix as a
+        JSON document, along with the Consul index. When ``index`` is set,
+        this is a blocking query that waits up to ``wait`` seconds for the
+        index to change.
+
+        :param int index: The index returned by the previous request
+        :param float wait: How long a blocking query waits for, in seconds
+        :rtype: (str, int)
+        :raises: ValueError
+        :raises: requests.RequestException
+
+        """
+        params = {'recurse' if self.is_prefix else 'raw': 'true'}
+        blocking = 0
+        if index:
+            blocking = int(wait or 300)
+            params['index'] = index
+            params['wait'] = '{}s'.format(blocking)
+        # Consul adds up to 1/16th of the wait time as jitter
+        response = self.session.get(
+            self.api_url, params=params, headers=self._headers,
+            timeout=self.timeout + blocking * 17 / 16.0)
+        consul_index = int(response.headers.get('X-Consul-Index') or 0)
+        if response.status_code == 404 and self.is_prefix:
+            return '{}', consul_index
+        elif not response.ok:
+            raise ValueError('Failed to retrieve {} from consul: {}'.format(
+                self.key, response.status_code))
+        elif not self.is_prefix:
+            return response.text, consul_index
+        return json.dumps(self._tree(response.json()),
+                          sort_keys=True), consul_index
+
+    def _tree(self, entries):
+        """Return the tree of values for the entries beneath the prefix.
+
+        :param list entries: The entries returned by Consul
+        :rtype: dict
+
+        """
+        tree = {}
+        for entry in entries:
+            names = [name for name in
+                     entry['Key'][len(self.key):].split('/') if name]
+            if not names or entry['Key'].endswith('/'):
+                continue
+            value = entry.get('Value')
+            if value is not None:
+                value = yaml.safe_load(base64.b64decode(value).decode('utf-8'))
+            node = tree
+            for name in names[:-1]:
+                if not isinstance(node.get(name), dict):
+                    node[name] = {}
+                node = node[name]
+            node[names[-1]] = value
+        return tree
@@ -2,10 +2,13 @@
 Helper Controller Class
 
 """
+import collections
+import cProfile
+import functools
+import inspect
 import logging
-import logging.config
 import os
-import multiprocessing
+from os import path
 import platform
 try:
     import queue
@@ -13,9 +16,21 @@ except ImportError:
     import Queue as queue
 import signal
 import sys
+import tempfile
+import threading
 import time
+import warnings
+try:
+    from time import monotonic
+except ImportError:  # Python 2.7 support
+    from time import time as monotonic
+try:
+    from concurrent import futures
+except ImportError:  # Python 2.7 support without the futures backport
+    futures = None
 
-from helper import config, __version__
+from helper import (config, handlers, scheduler, stats, wakeup, watcher,
+                    __version__)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -32,13 +47,94 @@ class Controller(object):
     APPNAME = sys.argv[0].split(os.sep)[-1]
     VERSION = __version__
 
-    #: When shutting down, how long should sleeping block the interpreter while
-    #: waiting for the state to indicate the class is no longer active.
+    #: When shutting down, how long to wait for an active invocation of
+    #: :meth:`Controller.process` to finish before continuing the shutdown
+    #: anyway. Can be set with the ``drain_timeout`` Application
+    #: configuration value.
+    DRAIN_TIMEOUT = 30
+
+    #: Deprecated, shutdown no longer polls the state and this value is not
+    #: used. Set :attr:`Controller.DRAIN_TIMEOUT` instead. Will be removed in
+    #: the next release.
     SLEEP_UNIT = 0.5
 
     #: How often should :meth:`Controller.process` be invoked
     WAKE_INTERVAL = 60
 
+    #: The schema of the Application section, mapping each value to its
+    #: default, type or nested schema, used to build the typed, read-only
+    #: snapshot in :attr:`Controller.settings`. See
+    #: :func:`helper.config.snapshot_type`.
+    SCHEMA = None
+
+    #: The prefix of the environment variables that override configuration
+    #: values, such as ``MYAPP__Application__workers`` for ``MYAPP``. The
+    #: environment is not used when not set.
+    ENV_PREFIX = None
+
+    #: When enabled, the configuration file is watched for changes and
+    #: reloaded automatically, as if SIGHUP was received. Can be set with the
+    #: ``watch_config`` Application configuration value.
+    WATCH_CONFIG = False
+
+    #: How long the configuration file must be unchanged for after it was
+    #: modified before it is reloaded, so that a burst of writes results in
+    #: a single reload. Can be set with the ``watch_debounce`` Application
+    #: configuration value.
+    WATCH_DEBOUNCE = 1.0
+
+    #: The shortest time to sleep for when :meth:`Controller.process` returns
+    #: :attr:`Controller.PROCESS_BACKLOG`. Can be set with the
+    #: ``min_wake_interval`` Application configuration value.
+    MIN_WAKE_INTERVAL = 0
+
+    #: The longest time to sleep for when :meth:`Controller.process` keeps
+    #: returning :attr:`Controller.PROCESS_IDLE`. Can be set with the
+    #: ``max_wake_interval`` Application configuration value, defaulting to
+    #: the wake interval.
+    MAX_WAKE_INTERVAL = None
+
+    #: Return from :meth:`Controller.process` to indicate more work is pending
+    #: and it should be invoked again after the minimum wake interval.
+    PROCESS_BACKLOG = 'backlog'
+
+    #: Return from :meth:`Controller.process` to indicate there was no work to
+    #: do, doubling the time slept for each consecutive idle invocation up to
+    #: the maximum wake interval.
+    PROCESS_IDLE = 'idle'
+
+    #: When greater than zero, :meth:`Controller.process` and registered tasks
+    #: are dispatched onto a thread pool of this size instead of being invoked
+    #: in the main loop. Can be set with the ``pool_size`` Application
+    #: configuration value.
+    POOL_SIZE = 0
+
+    #: When enabled, :meth:`Controller.process` is invoked against a fixed,
+    #: monotonic schedule instead of sleeping for the wake interval after
+    #: each invocation. Values returned by :meth:`Controller.process` do not
+    #: change the schedule. Can be set with the ``fixed_rate`` Application
+    #: configuration value.
+    FIXED_RATE = False
+
+    #: With fixed rate scheduling, skip any ticks that were missed while
+    #: :meth:`Controller.process` was overrunning its interval.
+    OVERRUN_SKIP = scheduler.OVERRUN_SKIP
+
+    #: With fixed rate scheduling, invoke :meth:`Controller.process` once for
+    #: every missed tick until the schedule has caught up.
+    OVERRUN_CATCH_UP = scheduler.OVERRUN_CATCH_UP
+
+    #: With fixed rate scheduling, invoke :meth:`Controller.process` again
+    #: immediately after an overrun and restart the schedule from there.
+    OVERRUN_BACK_TO_BACK = scheduler.OVERRUN_BACK_TO_BACK
+
+    #: The overrun policy used with fixed rate scheduling. Can be set with the
+    #: ``overrun_policy`` Application configuration value.
+    OVERRUN_POLICY = OVERRUN_SKIP
+
+    #: The signals that are handled by the controller
+    SIGNALS = [signal.SIGHUP, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2]
+
     #: Initializing state is only set during initial object creation
     STATE_INITIALIZING = 0x01
 
@@ -88,16 +184,70 @@ class Controller(object):
         :param str operating_system: Operating system name from helper.platform
 
         """
+        if self.SLEEP_UNIT != Controller.SLEEP_UNIT:
+            warnings.warn('Controller.SLEEP_UNIT is deprecated and no longer '
+                          'used, set DRAIN_TIMEOUT instead',
+                          DeprecationWarning, stacklevel=2)
+        self._active = False
+        self._active_thread = None
+        self._completed = collections.deque()
+        self._executor = None
+        self._in_flight = 0
+        self._state_changed = threading.Condition()
+        self._working = threading.local()
         self.set_state(self.STATE_INITIALIZING)
         self.args = args
         try:
-            self.config = config.Config(args.config)
-        except ValueError:
+            self.config = config.Config(
+                args.config, self.SCHEMA, getattr(args, 'includes', None),
+                self.ENV_PREFIX, getattr(args, 'overrides', None),
+                self._validate_application)
+        except ValueError as error:
+            sys.stderr.write('\nError loading the configuration: %s\n\n' %
+                             error)
             sys.exit(1)
         self.debug = args.foreground
-        logging.config.dictConfig(self.config.logging)
+        self.logging_config = config.LoggingConfig(self.config.logging,
+                                                   self.debug)
         self.operating_system = operating_system
-        self.pending_signals = multiprocessing.Queue()
+        self.pending_signals = wakeup.Wakeup()
+        self.stats = stats.Stats()
+        self._profiler = None
+        self.tick_counters = {'ticks': 0,
+                              'skipped': 0,
+                              'lateness_last': 0.0,
+                              'lateness_max': 0.0,
+                              'lateness_total': 0.0}
+        self._deadline = None
+        self._idle_interval = None
+        self._installed_signals = []
+        self._reload_requested = False
+        self._watchers = []
+        self.tasks = scheduler.Scheduler()
+
+    def add_task(self, name, callback, interval=None, cron=None,
+                 overrun_policy=None):
+        """Register a callable to be run by the main loop, independently of
+        :meth:`Controller.process`, either every ``interval`` seconds or when
+        the ``cron`` expression matches. Timing statistics for the task are
+        available in :attr:`Controller.tasks`.
+
+        :param str name: The unique name of the task
+        :param callable callback: The callable to run, which takes no
+            arguments
+        :param float interval: How often to run the task, in seconds
+        :param str cron: A five field cron expression for when to run the task
+        :param str overrun_policy: The overrun policy for the task, defaulting
+            to :attr:`Controller.overrun_policy`
+        :rtype: helper.scheduler.Task
+        :raises: ValueError
+
+        """
+        task = scheduler.Task(name, callback, interval, cron,
+                              overrun_policy or self.overrun_policy)
+        self.tasks.add(task)
+        self._wakeup()
+        return task
 
     @property
     def current_state(self):
@@ -109,6 +259,39 @@ class Controller(object):
         """
         return self._STATES[self._state]
 
+    @property
+    def drain_timeout(self):
+        """Property method that returns how long to wait for an active
+        invocation of :meth:`Controller.process` to finish when stopping.
+
+        :rtype: int
+
+        """
+        return (self.config.application.get('drain_timeout') or
+                self.DRAIN_TIMEOUT)
+
+    @property
+    def fixed_rate(self):
+        """Property method that returns a bool specifying if
+        :meth:`Controller.process` is scheduled at a fixed rate.
+
+        :rtype: bool
+
+        """
+        return bool(self.config.application.get('fixed_rate',
+                                                self.FIXED_RATE))
+
+    @property
+    def in_flight(self):
+        """Property method that returns the number of invocations of
+        :meth:`Controller.process` and registered tasks that are currently
+        running.
+
+        :rtype: int
+
+        """
+        return self._in_flight
+
     @property
     def is_active(self):
         """Property method that returns a bool specifying if the process is
@@ -139,6 +322,16 @@ class Controller(object):
         """
         return self._state == self.STATE_INITIALIZING
 
+    @property
+    def is_profiling(self):
+        """Property method that returns a bool specifying if
+        :meth:`Controller.process` is currently being profiled.
+
+        :rtype: bool
+
+        """
+        return self._profiler is not None
+
     @property
     def is_running(self):
         """Property method that returns a bool specifying if the process is
@@ -192,8 +385,47 @@ class Controller(object):
         """
         return self._state == self.STATE_STOP_REQUESTED
 
-    def on_configuration_reloaded(self):
-        """Override to provide any steps when the configuration is reloaded."""
+    @property
+    def max_wake_interval(self):
+        """Property method that returns the longest time to sleep for when
+        :meth:`Controller.process` is idle.
+
+        :rtype: int
+
+        """
+        return (self.config.application.get('max_wake_interval') or
+                self.MAX_WAKE_INTERVAL or self.wake_interval)
+
+    @property
+    def min_wake_interval(self):
+        """Property method that returns the shortest time to sleep for when
+        :meth:`Controller.process` has more work pending.
+
+        :rtype: int
+
+        """
+        return (self.config.application.get('min_wake_interval') or
+                self.MIN_WAKE_INTERVAL)
+
+    @property
+    def overrun_policy(self):
+        """Property method that returns the overrun policy used when fixed
+        rate scheduling is enabled.
+
+        :rtype: str
+
+        """
+        return self._overrun_policy(self.config.application)
+
+    def on_configuration_reloaded(self, changes=None):
+        """Override to provide any steps when the configuration is reloaded.
+        If the override accepts an argument, or a keyword-only ``changes``
+        argument, it is passed the keys that were added, removed or changed,
+        so that only the affected resources need to be rebuilt.
+
+        :param helper.config.ConfigChanges changes: What changed
+
+        """
         LOGGER.debug('%s.on_configuration_reloaded() NotImplemented',
                      self.__class__.__name__)
 
@@ -201,12 +433,28 @@ class Controller(object):
         """Override this method to cleanly shutdown the application."""
         LOGGER.debug('%s.cleanup() NotImplemented', self.__class__.__name__)
 
+    def log_stats(self):
+        """Write the main loop statistics in :attr:`Controller.stats` to the
+        log.
+
+        """
+        summary = self.stats.as_dict()
+        LOGGER.info('%i signals handled, %i configuration reloads, %i '
+                    'invocations skipped with a saturated thread pool',
+                    summary['signals'], summary['reloads'],
+                    summary['saturated'])
+        for name in ['process', 'sleep']:
+            LOGGER.info('%s: %s', name, ', '.join(
+                '{}={}'.format(key, value)
+                for key, value in sorted(summary[name].items())))
+
     def on_sigusr1(self):
-        """Called when SIGUSR1 is received, does not have any attached
-        behavior. Override to implement a behavior for this signal.
+        """Called when SIGUSR1 is received, writes the main loop statistics
+        to the log. Override to implement a different behavior for this
+        signal.
 
         """
-        LOGGER.debug('%s.on_sigusr1() NotImplemented', self.__class__.__name__)
+        self.log_stats()
 
     def on_sigusr2(self):
         """Called when SIGUSR2 is received, does not have any attached
@@ -215,13 +463,86 @@ class Controller(object):
         """
         LOGGER.debug('%s.on_sigusr2() NotImplemented', self.__class__.__name__)
 
+    def reload_configuration(self):
+        """Reload the configuration, reconfiguring logging and invoking
+        :meth:`Controller.on_configuration_reloaded` if it changed. Logging
+        is only reconfigured if the Logging section changed. Invoked when
+        SIGHUP is received or the watched configuration file changes.
+
+        :rtype: helper.config.ConfigChanges
+
+        """
+        try:
+            changes = self.config.reload()
+        except ValueError as error:
+            LOGGER.error('Could not reload the configuration: %s', error)
+            return config.ConfigChanges()
+        if changes:
+            self._apply_configuration_changes(changes)
+            args, kwargs = self._configuration_reloaded_args(changes)
+            self.on_configuration_reloaded(*args, **kwargs)
+        return changes
+
+    def remove_task(self, name):
+        """Remove a task that was registered with
+        :meth:`Controller.add_task`.
+
+        :param str name: The name of the task to remove
+        :raises: KeyError
+
+        """
+        self.tasks.remove(name)
+
     def process(self):
         """To be implemented by the extending class. Is called after every
         sleep interval in the main application loop.
 
+        May return a hint for how long to sleep before it is called again:
+        :attr:`Controller.PROCESS_BACKLOG` if more work is pending,
+        :attr:`Controller.PROCESS_IDLE` if there was nothing to do, or the
+        number of seconds to sleep for. Returning None uses the wake interval.
+        The hint is ignored when :attr:`Controller.fixed_rate` is enabled.
+
+        :rtype: str|int|float|None
+
         """
         raise NotImplementedError
 
+    @property
+    def pool_size(self):
+        """Property method that returns the size of the thread pool that
+        :meth:`Controller.process` and registered tasks are dispatched onto,
+        or 0 if they are invoked in the main loop.
+
+        :rtype: int
+
+        """
+        return int(self.config.application.get('pool_size') or
+                   self.POOL_SIZE)
+
+    @property
+    def profile_directory(self):
+        """Property method that returns the directory profiles are written
+        to, from the ``profile_directory`` Application configuration value,
+        defaulting to the system temporary directory.
+
+        :rtype: str
+
+        """
+        return (self.config.application.get('profile_directory') or
+                tempfile.gettempdir())
+
+    @property
+    def profile_signal(self):
+        """Property method that returns the signal number that toggles
+        profiling, from the ``profile_signal`` Application configuration
+        value, or None if profiling is not toggled by a signal.
+
+        :rtype: int|None
+
+        """
+        return self._profile_signal(self.config.application)
+
     def process_signal(self, signum):
         """Invoked whenever a signal is added to the stack.
 
@@ -231,12 +552,12 @@ class Controller(object):
         if signum == signal.SIGTERM:
             LOGGER.info('Received SIGTERM, initiating shutdown')
             self.stop()
+        elif signum == self.profile_signal:
+            self.toggle_profiling()
         elif signum == signal.SIGHUP:
             LOGGER.info('Received SIGHUP')
-            if self.config.reload():
-                LOGGER.info('Configuration reloaded')
-                logging.config.dictConfig(self.config.logging)
-                self.on_configuration_reloaded()
+            handlers.reopen_files()
+            self.reload_configuration()
         elif signum == signal.SIGUSR1:
             self.on_sigusr1()
         elif signum == signal.SIGUSR2:
@@ -252,18 +573,46 @@ class Controller(object):
         """
         LOGGER.info('%s v%s started', self.APPNAME, self.VERSION)
         self.setup()
+        self._start_executor()
+        self._start_watcher()
+        self._deadline = monotonic() + self.wake_interval
         while not any([self.is_stopping, self.is_stopped]):
             self.set_state(self.STATE_SLEEPING)
-            try:
-                signum = self.pending_signals.get(True, self.wake_interval)
-            except queue.Empty:
-                pass
-            else:
+            signum = self._wait_for_signal(self._sleep_timeout())
+            if signum is not None:
                 self.process_signal(signum)
-                if any([self.is_stopping, self.is_stopped]):
-                    break
+            if self._reload_requested:
+                self._reload_requested = False
+                self.reload_configuration()
+            self._process_completed()
+            if any([self.is_waiting_to_stop, self.is_stopping,
+                    self.is_stopped]):
+                break
+            self._run_tasks()
+            if any([self.is_waiting_to_stop, self.is_stopping,
+                    self.is_stopped]):
+                break
+            elif (monotonic() < self._deadline and
+                  (self.fixed_rate or signum is None)):
+                continue
             self.set_state(self.STATE_ACTIVE)
-            self.process()
+            if self._executor:
+                self._dispatch_process()
+                continue
+            profiler, started = self._profiler, monotonic()
+            if profiler:
+                profiler.enable()
+            self._begin_work()
+            try:
+                if self.fixed_rate:
+                    hint = self._execute(self._process_tick)
+                else:
+                    hint = self._execute(self.process)
+            finally:
+                if profiler:
+                    profiler.disable()
+                self.stats.process.add(monotonic() - started)
+            self._apply_process_hint(hint)
 
     def start(self):
         """Important:
@@ -271,11 +620,45 @@ class Controller(object):
             Do not extend this method, rather redefine Controller.run
 
         """
-        for signum in [signal.SIGHUP, signal.SIGTERM,
-                       signal.SIGUSR1, signal.SIGUSR2]:
-            signal.signal(signum, self._on_signal)
+        self._installed_signals = self._signals()
+        for signum in self._installed_signals:
+            self._install_signal_handler(signum)
         self.run()
 
+    def toggle_profiling(self):
+        """Start profiling :meth:`Controller.process` invocations with
+        :mod:`cProfile`, or if profiling was already started, stop profiling
+        and write the profile to a timestamped file in
+        :attr:`Controller.profile_directory`. Invoked when the signal in the
+        ``profile_signal`` Application configuration value is received.
+
+        Profiling is refused when :meth:`Controller.process` is dispatched
+        onto the thread pool, as the profiler only sees the main loop.
+
+        :return: The path to the profile that was written, if any
+        :rtype: str|None
+
+        """
+        if not self._profiler and self._executor is not None:
+            LOGGER.warning('Profiling of process() is not available when '
+                           'pool_size is set')
+            return None
+        elif not self._profiler:
+            LOGGER.info('Starting profiling of process()')
+            self._profiler = cProfile.Profile()
+            return None
+        profiler, self._profiler = self._profiler, None
+        filename = path.join(self.profile_directory, '{}-{}-{}.prof'.format(
+            self.APPNAME, os.getpid(), time.strftime('%Y%m%dT%H%M%S')))
+        try:
+            profiler.dump_stats(filename)
+        except (IOError, OSError) as error:
+            LOGGER.error('Could not write profile to %s: %s', filename, error)
+            return None
+        LOGGER.info('Stopped profiling of process(), profile written to %s',
+                    filename)
+        return filename
+
     def set_state(self, state):
         """Set the runtime state of the Controller. Use the internal constants
         to ensure proper state values:
@@ -297,6 +680,14 @@ class Controller(object):
         elif state not in self._STATES.keys():
             raise ValueError('Invalid state {}'.format(state))
 
+        # Leaving the active state, even if the transition is not allowed
+        # while waiting to stop, means a pending shutdown can continue
+        if self._active and state not in [self.STATE_ACTIVE,
+                                          self.STATE_STOP_REQUESTED]:
+            with self._state_changed:
+                self._active = False
+                self._state_changed.notify_all()
+
         # Check for invalid transitions
 
         if self.is_waiting_to_stop and state not in [self.STATE_STOPPING,
@@ -330,6 +721,10 @@ class Controller(object):
         LOGGER.debug('State changed from %s to %s',
                      self._STATES[self._state], self._STATES[state])
         self._state = state
+        if state == self.STATE_ACTIVE:
+            with self._state_changed:
+                self._active = True
+                self._active_thread = threading.current_thread()
 
     def setup(self):
         """Override to provide any required setup steps."""
@@ -344,13 +739,17 @@ class Controller(object):
         LOGGER.info('Attempting to stop the process')
         self.set_state(self.STATE_STOP_REQUESTED)
 
+        # Wake the main loop if it is sleeping
+        self._wakeup()
+
         # Call shutdown for classes to add shutdown steps
         self.shutdown()
+        self._stop_watcher()
 
         # Wait for the current run to finish
-        while self.is_running and self.is_waiting_to_stop:
-            LOGGER.info('Waiting for the process to finish')
-            time.sleep(self.SLEEP_UNIT)
+        self._wait_for_process()
+        if self._executor:
+            self._executor.shutdown(wait=False)
 
         # Change the state to shutting down
         if not self.is_stopping:
@@ -362,6 +761,21 @@ class Controller(object):
         # Change our state
         self.set_state(self.STATE_STOPPED)
 
+        # Emit the log records waiting in the logging queue
+        self.logging_config.stop()
+
+    @property
+    def settings(self):
+        """Return the typed, read-only snapshot of the Application section
+        built from :attr:`Controller.SCHEMA`, or None if there is no schema.
+        The snapshot is replaced when the configuration is reloaded, so
+        hold a reference to it to read consistent values across a reload.
+
+        :rtype: helper.config.Snapshot|None
+
+        """
+        return self.config.snapshot
+
     @property
     def system_platform(self):
         """Return a tuple containing the operating system, python
@@ -374,6 +788,28 @@ class Controller(object):
                 platform.python_implementation(),
                 platform.python_version())
 
+    @property
+    def watch_config(self):
+        """Property method that returns True if the configuration file is
+        watched for changes.
+
+        :rtype: bool
+
+        """
+        value = self.config.application.get('watch_config')
+        return self.WATCH_CONFIG if value is None else bool(value)
+
+    @property
+    def watch_debounce(self):
+        """Property method that returns how long the configuration file
+        must be unchanged for after it was modified before it is reloaded.
+
+        :rtype: float
+
+        """
+        value = self.config.application.get('watch_debounce')
+        return self.WATCH_DEBOUNCE if value is None else float(value)
+
     @property
     def wake_interval(self):
         """Property method that returns the wake interval in seconds.
@@ -384,6 +820,507 @@ class Controller(object):
         return (self.config.application.get('wake_interval') or
                 self.WAKE_INTERVAL)
 
+    def _wakeup(self):
+        """Wake the main loop if it is blocked waiting for signals, so that it
+        re-evaluates its state and schedule. Safe to call from any thread.
+
+        """
+        self.pending_signals.notify()
+
+    def _is_working(self):
+        """Return True if there are invocations of :meth:`Controller.process`
+        or registered tasks in flight, or another thread is in the
+        :attr:`Controller.STATE_ACTIVE` state, such as a :meth:`Controller.run`
+        that is redefined. The invocation or thread calling it is not
+        counted. Must be called with the state condition held.
+
+        :rtype: bool
+
+        """
+        own = 1 if getattr(self._working, 'active', False) else 0
+        return (self._in_flight > own or
+                (self._active and
+                 self._active_thread is not threading.current_thread()))
+
+    def _wait_for_process(self):
+        """Block until there are no invocations of :meth:`Controller.process`
+        or registered tasks in flight and the state has left
+        :attr:`Controller.STATE_ACTIVE`, or the drain timeout has passed.
+        When invoked from within one of them, it does not wait for itself.
+
+        """
+        with self._state_changed:
+            if not self._is_working():
+                return
+            LOGGER.info('Waiting for the running invocations to finish')
+            deadline = monotonic() + self.drain_timeout
+            while self._is_working():
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    LOGGER.warning('Running invocations did not finish within '
+                                   '%s seconds, continuing shutdown',
+                                   self.drain_timeout)
+                    return
+                self._state_changed.wait(remaining)
+
+    def _begin_work(self):
+        """Increment the count of invocations in flight, before invoking
+        :meth:`Controller.process` or a task with :meth:`Controller._execute`.
+
+        """
+        with self._state_changed:
+            self._in_flight += 1
+
+    def _dispatch(self, callback, task, scheduled):
+        """Submit the callback to the thread pool, recording its completion to
+        be processed by the main loop.
+
+        :param callable callback: The callable to invoke
+        :param task: The task being run, or None for process
+        :type task: helper.scheduler.Task|None
+        :param float scheduled: When the invocation was due
+
+        """
+        self._executor.submit(self._execute, callback).add_done_callback(
+            functools.partial(self._on_dispatched_done, task, scheduled,
+                              monotonic()))
+
+    def _dispatch_process(self):
+        """Submit :meth:`Controller.process` to the thread pool, unless every
+        thread in the pool is already busy, and schedule the next
+        invocation.
+
+        """
+        now = monotonic()
+        if self._in_flight >= self.pool_size:
+            LOGGER.debug('Thread pool is saturated, skipping process()')
+            self.stats.saturated += 1
+        else:
+            self._begin_work()
+            self._dispatch(self.process, None, self._deadline)
+        if self.fixed_rate:
+            self._deadline = self._next_deadline(
+                self._start_tick(), now, self.wake_interval)
+        else:
+            self._deadline = now + self.wake_interval
+
+    def _execute(self, callback):
+        """Invoke the callback as in-flight work, which must have been counted
+        with :meth:`Controller._begin_work`, notifying any pending shutdown
+        when it finishes.
+
+        :param callable callback: The callable to invoke
+        :rtype: mixed
+
+        """
+        self._working.active = True
+        try:
+            return callback()
+        finally:
+            self._working.active = False
+            with self._state_changed:
+                self._in_flight -= 1
+                self._state_changed.notify_all()
+
+    def _on_dispatched_done(self, task, scheduled, started, future):
+        """Invoked in the pool thread when a dispatched invocation finishes,
+        queueing it for :meth:`Controller._process_completed` and waking the
+        main loop.
+
+        """
+        self._completed.append((task, scheduled, started, monotonic(), future))
+        self._wakeup()
+
+    def _process_completed(self):
+        """Record the results of invocations that finished in the thread pool,
+        rescheduling tasks and applying process hints. An exception raised by
+        :meth:`Controller.process` is re-raised, as it would have been if it
+        was invoked in the main loop.
+
+        """
+        while self._completed:
+            task, scheduled, started, finished, future = \
+                self._completed.popleft()
+            error = future.exception()
+            if task is None:
+                self.stats.process.add(finished - started)
+                if error is not None:
+                    raise error
+                elif future.result() is not None:
+                    self._apply_process_hint(future.result())
+                continue
+            if error is not None:
+                LOGGER.error('Task %s failed: %s', task.name, error)
+            self.tasks.complete(task, scheduled, started, finished,
+                                error is not None)
+
+    def _request_reload(self):
+        """Ask the main loop to reload the configuration. Invoked by the
+        configuration file watcher from its own thread.
+
+        """
+        self._reload_requested = True
+        self._wakeup()
+
+    def _start_executor(self):
+        """Create the thread pool if a pool size is configured.
+
+        :raises: ValueError
+
+        """
+        if not self.pool_size:
+            return
+        elif futures is None:
+            raise ValueError('pool_size is configured but concurrent.futures '
+                             'is not available')
+        LOGGER.info('Dispatching process() onto a pool of %i threads',
+                    self.pool_size)
+        self._executor = futures.ThreadPoolExecutor(self.pool_size)
+
+    def _start_watcher(self):
+        """Start watching the configuration file and each included file and
+        directory for changes if enabled.
+
+        """
+        if not self.watch_config:
+            return
+        file_paths = ([self.config.file_path] if self.config.file_path
+                      else []) + self.config.include_paths
+        if not file_paths:
+            LOGGER.warning('Only local and consul configuration can be '
+                           'watched')
+        for file_path in file_paths:
+            if file_path == self.config.file_path and \
+                    file_path.startswith('consul://'):
+                config_watcher = watcher.ConsulWatcher(
+                    file_path, self._request_reload, self.config.version)
+                config_watcher.start()
+            elif '://' in file_path:
+                LOGGER.warning('Only local and consul configuration can be '
+                               'watched, not watching %s', file_path)
+                continue
+            else:
+                config_watcher = self._start_file_watcher(file_path)
+            self._watchers.append(config_watcher)
+            LOGGER.info('Watching %s for changes', file_path)
+
+    def _start_file_watcher(self, file_path):
+        """Start watching a local file or directory for changes, polling it
+        if it can not be watched with inotify.
+
+        :param str file_path: The file or directory to watch
+        :rtype: helper.watcher.Watcher
+
+        """
+        file_watcher = watcher.Watcher(
+            file_path, self._request_reload, self.watch_debounce)
+        try:
+            file_watcher.start()
+        except (IOError, OSError) as error:
+            LOGGER.warning('Could not watch %s with %s, polling instead: %s',
+                           file_path, file_watcher.backend, error)
+            file_watcher.backend = watcher.BACKEND_POLL
+            file_watcher.start()
+        return file_watcher
+
+    def _stop_watcher(self):
+        """Stop watching the configuration for changes."""
+        while self._watchers:
+            self._watchers.pop().stop()
+
+    def _apply_configuration_changes(self, changes):
+        """Record a configuration reload and reconfigure logging if the
+        Logging section changed.
+
+        :param helper.config.ConfigChanges changes: What changed
+
+        """
+        LOGGER.info('Configuration reloaded, %i key(s) changed',
+                    len(changes.keys))
+        self.stats.reloads += 1
+        if changes.affects('Logging'):
+            self.logging_config.update(self.config.logging, self.debug)
+        if changes.affects('Application:profile_signal'):
+            self._update_signal_handlers()
+
+    def _overrun_policy(self, application):
+        """Return the overrun policy set in the Application section.
+
+        :param dict application: The Application section
+        :rtype: str
+        :raises: ValueError
+
+        """
+        policy = application.get('overrun_policy') or self.OVERRUN_POLICY
+        if policy not in scheduler.OVERRUN_POLICIES:
+            raise ValueError('Invalid overrun policy {}'.format(policy))
+        return policy
+
+    def _profile_signal(self, application):
+        """Return the signal number that toggles profiling set in the
+        Application section, or None if it is not set. Signals that the
+        controller already handles are rejected.
+
+        :param dict application: The Application section
+        :rtype: int|None
+        :raises: ValueError
+
+        """
+        value = application.get('profile_signal')
+        if not value:
+            return None
+        if not isinstance(value, int):
+            name = str(value).upper()
+            if not name.startswith('SIG'):
+                name = 'SIG{}'.format(name)
+            value = getattr(signal, name, None)
+        if value is None or value in self.SIGNALS:
+            raise ValueError('Invalid profile signal {}'.format(
+                application.get('profile_signal')))
+        return int(value)
+
+    def _validate_application(self, application):
+        """Validate the Application values that are read by the main loop
+        when the configuration is loaded or reloaded, so that an invalid
+        value keeps the previous configuration instead of raising from the
+        main loop.
+
+        :param dict application: The Application section
+        :raises: ValueError
+
+        """
+        self._overrun_policy(application)
+        self._profile_signal(application)
+
+    def _configuration_reloaded_args(self, changes):
+        """Return the positional and keyword arguments to invoke
+        :meth:`Controller.on_configuration_reloaded` with, which only
+        include the changes if the method accepts them, either as a
+        positional argument or as a keyword-only ``changes`` argument, so
+        that overrides written without one keep working.
+
+        :param helper.config.ConfigChanges changes: What changed
+        :rtype: tuple(tuple, dict)
+
+        """
+        method = self.on_configuration_reloaded
+        try:
+            parameters = inspect.signature(method).parameters.values()
+        except AttributeError:  # Python 2.7 support
+            if self._accepts_argument(method):
+                return (changes,), {}
+        except (TypeError, ValueError):
+            pass
+        else:
+            for parameter in parameters:
+                if parameter.kind in (parameter.POSITIONAL_ONLY,
+                                      parameter.POSITIONAL_OR_KEYWORD,
+                                      parameter.VAR_POSITIONAL):
+                    return (changes,), {}
+                elif parameter.kind == parameter.KEYWORD_ONLY and \
+                        parameter.name == 'changes':
+                    return (), {'changes': changes}
+        return (), {}
+
+    @staticmethod
+    def _accepts_argument(method):
+        """Return True if the method accepts a positional argument, using
+        :func:`inspect.getargspec` on Python 2.7, where
+        :func:`inspect.signature` is not available. Callable objects are
+        inspected by their ``__call__`` method, and callables that can not
+        be inspected, such as :func:`functools.partial` objects, are
+        treated as not accepting one.
+
+        :param callable method: The method to inspect
+        :rtype: bool
+
+        """
+        for candidate in (method, getattr(method, '__call__', None)):
+            try:
+                spec = inspect.getargspec(candidate)
+            except TypeError:
+                continue
+            offset = 1 if inspect.ismethod(candidate) else 0
+            return bool(spec.varargs or len(spec.args) > offset)
+        return False
+
+    def _apply_process_hint(self, hint):
+        """Set when :meth:`Controller.process` is next invoked based upon the
+        value it returned. Hints are ignored with fixed rate scheduling, so
+        that the schedule is kept.
+
+        :param str|int|float|None hint: The value process returned
+
+        """
+        if self.fixed_rate:
+            if hint is not None:
+                LOGGER.debug('Ignoring process() return value %r with fixed '
+                             'rate scheduling', hint)
+            self._idle_interval = None
+            return
+        elif hint == self.PROCESS_BACKLOG:
+            delay, self._idle_interval = self.min_wake_interval, None
+        elif hint == self.PROCESS_IDLE:
+            delay = min(self._idle_interval * 2 if self._idle_interval
+                        else self.wake_interval, self.max_wake_interval)
+            self._idle_interval = delay
+        elif (isinstance(hint, (int, float)) and
+              not isinstance(hint, bool)):
+            delay, self._idle_interval = max(hint, 0), None
+        else:
+            if hint is not None:
+                LOGGER.warning('Ignoring invalid process() return value: %r',
+                               hint)
+            self._idle_interval = None
+            self._deadline = monotonic() + self.wake_interval
+            return
+        self._deadline = monotonic() + delay
+
+    def _next_deadline(self, scheduled, now, interval):
+        """Return the monotonic deadline for the next fixed rate tick, applying
+        the overrun policy if the tick that was scheduled for ``scheduled``
+        finished after the next tick was due.
+
+        :param float scheduled: When the tick that just finished was due
+        :param float now: The current monotonic time
+        :param float interval: The wake interval
+        :rtype: float
+
+        """
+        deadline, missed = scheduler.next_deadline(
+            scheduled, now, interval, self.overrun_policy)
+        if missed:
+            self.tick_counters['skipped'] += missed
+            LOGGER.warning('Skipped %i tick(s) while process() overran',
+                           missed)
+        return deadline
+
+    def _process_tick(self):
+        """Invoke :meth:`Controller.process` for a fixed rate tick, recording
+        how late the tick started and scheduling the next one.
+
+        """
+        scheduled = self._start_tick()
+        try:
+            return self.process()
+        finally:
+            self._deadline = self._next_deadline(
+                scheduled, monotonic(), self.wake_interval)
+
+    def _start_tick(self):
+        """Record how late the fixed rate tick that is about to be processed
+        started, returning when it was scheduled for.
+
+        :rtype: float
+
+        """
+        scheduled = self._deadline
+        lateness = max(monotonic() - scheduled, 0.0)
+        self.tick_counters['ticks'] += 1
+        self.tick_counters['lateness_last'] = lateness
+        self.tick_counters['lateness_total'] += lateness
+        if lateness > self.tick_counters['lateness_max']:
+            self.tick_counters['lateness_max'] = lateness
+        return scheduled
+
+    def _signals(self):
+        """Return the signals to install handlers for.
+
+        :rtype: list
+
+        """
+        signals = list(self.SIGNALS)
+        if self.profile_signal and self.profile_signal not in signals:
+            signals.append(self.profile_signal)
+        return signals
+
+    def _install_signal_handler(self, signum):
+        """Install the handler that queues the signal for the main loop.
+
+        :param int signum: The signal to handle
+
+        """
+        signal.signal(signum, self._on_signal)
+
+    def _remove_signal_handler(self, signum):
+        """Restore the default handler of a signal that is no longer
+        handled.
+
+        :param int signum: The signal to stop handling
+
+        """
+        signal.signal(signum, signal.SIG_DFL)
+
+    def _update_signal_handlers(self):
+        """Install or remove signal handlers so that they match
+        :meth:`Controller._signals`, so that a ``profile_signal`` that was
+        changed by a configuration reload is honored. Does nothing until the
+        controller was started.
+
+        """
+        if not self._installed_signals:
+            return
+        signals = self._signals()
+        for signum in self._installed_signals:
+            if signum not in signals:
+                self._remove_signal_handler(signum)
+        for signum in signals:
+            if signum not in self._installed_signals:
+                self._install_signal_handler(signum)
+        self._installed_signals = signals
+
+    def _run_tasks(self):
+        """Run any registered tasks that are due, dispatching them onto the
+        thread pool if there is one.
+
+        """
+        for task, scheduled in self.tasks.pop_due(monotonic()):
+            self.set_state(self.STATE_ACTIVE)
+            self._begin_work()
+            if self._executor:
+                self._dispatch(task.callback, task, scheduled)
+                continue
+            started, failed = monotonic(), False
+            try:
+                self._execute(task.callback)
+            except Exception as error:
+                LOGGER.exception('Task %s failed: %s', task.name, error)
+                failed = True
+            self.tasks.complete(task, scheduled, started, monotonic(), failed)
+
+    def _sleep_timeout(self):
+        """Return how long the main loop should block waiting for signals
+        before invoking :meth:`Controller.process` or a registered task.
+
+        :rtype: float
+
+        """
+        now = monotonic()
+        timeout = max(self._deadline - now, 0)
+        task_deadline = self.tasks.next_deadline()
+        if task_deadline is not None:
+            timeout = min(timeout, max(task_deadline - now, 0))
+        return timeout
+
+    def _wait_for_signal(self, timeout):
+        """Wait up to ``timeout`` seconds for a signal to be received,
+        returning the signal number or None if the timeout passed.
+
+        :param float timeout: How long to wait for
+        :rtype: int|None
+
+        """
+        started = monotonic()
+        try:
+            signum = self.pending_signals.get(True, timeout)
+        except queue.Empty:
+            return None
+        else:
+            self.stats.signals += 1
+            return signum
+        finally:
+            self.stats.sleep.add(monotonic() - started)
+
     def _on_signal(self, signum, _frame):
         """Append the signal to the queue, to be processed by the main."""
         self.pending_signals.put(signum)
@@ -0,0 +1,232 @@
+"""
+Logging filters that limit the volume of records logged from hot code
+paths, by rate limiting and sampling them.
+
+"""
+import copy
+import logging
+import random
+import threading
+import time
+try:
+    from time import monotonic
+except ImportError:  # Python 2.7 support
+    from time import time as monotonic
+
+#: Rate limit the records of each logger
+KEY_LOGGER = 'logger'
+
+#: Rate limit the records of each message template of each logger
+KEY_MESSAGE = 'message'
+
+
+def _level(value):
+    """Return the numeric logging level for the level name or number.
+
+    :param str|int|None value: The level
+    :rtype: int|None
+    :raises: ValueError
+
+    """
+    if value is None or isinstance(value, int):
+        return value
+    level = logging.getLevelName(str(value).upper())
+    if not isinstance(level, int):
+        raise ValueError('Unknown logging level: {}'.format(value))
+    return level
+
+
+class RateLimitFilter(logging.Filter):
+    """Allows up to ``rate`` records every ``period`` seconds for each
+    logger, or for each message template of each logger, so that a warning
+    logged in a loop is only emitted a few times. The message template is
+    the message before it is merged with its arguments, so
+    ``LOGGER.warning('Failed to connect to %s', host)`` is limited as one
+    message regardless of the host.
+
+    The first record allowed in each period after records were suppressed
+    has `` (N similar messages suppressed)`` appended to its message and
+    the number set as its ``suppressed`` attribute. When no record is
+    logged after the period ends, as when a burst of errors stops, a
+    background thread logs the last suppressed record with the count
+    appended instead, so that the count is always reported. The thread
+    exits once there are no suppressed records left to report.
+
+    Attach the filter to a logger rather than a handler so that records are
+    suppressed before they are put on the logging queue.
+
+    :param int rate: How many records are allowed each period
+    :param float period: The length of the period, in seconds
+    :param str key: Limit each logger (:data:`KEY_LOGGER`) or each message
+        template (:data:`KEY_MESSAGE`)
+    :param str|int level: Records at or above this level are not limited
+    :param str name: Only filter records of this logger and its children
+    :param int max_keys: How many loggers or message templates to track,
+        after which those whose period has ended are forgotten
+    :raises: ValueError
+
+    """
+    def __init__(self, rate=10, period=60, key=KEY_MESSAGE, level=None,
+                 name='', max_keys=10000):
+        logging.Filter.__init__(self, name)
+        if key not in (KEY_LOGGER, KEY_MESSAGE):
+            raise ValueError('Invalid rate limit key: {}'.format(key))
+        self.rate = int(rate)
+        self.period = float(period)
+        self.key = key
+        self.level = _level(level)
+        self.max_keys = int(max_keys)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._thread = None
+        self._windows = {}
+
+    def filter(self, record):
+        """Return True if the record is allowed.
+
+        :param logging.LogRecord record: The record to filter
+        :rtype: bool
+
+        """
+        if not logging.Filter.filter(self, record):
+            return False
+        elif self.level is not None and record.levelno >= self.level:
+            return True
+        elif getattr(record, 'suppressed', None) is not None:
+            return True
+        key = record.name if self.key == KEY_LOGGER else \
+            (record.name, str(record.msg))
+        now, suppressed = monotonic(), 0
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._forget(now)
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0, None]
+                self._pending.discard(key)
+            if window[1] >= self.rate:
+                window[2] += 1
+                window[3] = record
+                self._pending.add(key)
+                if self._thread is None or not self._thread.is_alive():
+                    self._start_thread()
+                return False
+            window[1] += 1
+        if suppressed:
+            self._annotate(record, suppressed)
+        return True
+
+    @staticmethod
+    def _annotate(record, suppressed):
+        """Append the number of suppressed records to the message of the
+        record and set it as its ``suppressed`` attribute.
+
+        :param logging.LogRecord record: The record to annotate
+        :param int suppressed: The number of suppressed records
+
+        """
+        record.suppressed = suppressed
+        record.msg = '{} ({} similar messages suppressed)'.format(
+            record.msg, suppressed)
+
+    def _forget(self, now):
+        """Forget the loggers or message templates whose period has ended,
+        or all of them if none have.
+
+        :param float now: The current monotonic time
+
+        """
+        expired = [key for key, window in self._windows.items()
+                   if now - window[0] >= self.period]
+        if not expired:
+            self._windows.clear()
+        for key in expired:
+            del self._windows[key]
+
+    def _report(self):
+        """Log the last suppressed record of each logger or message template
+        whose period has ended with the number of suppressed records
+        appended, unless a record allowed since then reported it.
+
+        :return: True if suppressed records remain to be reported
+        :rtype: bool
+
+        """
+        now, summaries = monotonic(), []
+        with self._lock:
+            for key in list(self._pending):
+                window = self._windows.get(key)
+                if window is None:
+                    self._pending.discard(key)
+                elif now - window[0] >= self.period:
+                    self._pending.discard(key)
+                    summary = copy.copy(window[3])
+                    self._annotate(summary, window[2])
+                    summaries.append(summary)
+                    window[2], window[3] = 0, None
+            pending = bool(self._pending)
+            if not pending:
+                self._thread = None
+        for summary in summaries:
+            logging.getLogger(summary.name).handle(summary)
+        return pending
+
+    def _run(self):
+        """Report the suppressed records as their periods end, until there
+        are none left to report.
+
+        """
+        interval = min(self.period, 1.0)
+        while True:
+            time.sleep(interval)
+            if not self._report():
+                break
+
+    def _start_thread(self):
+        """Start the background thread that reports suppressed records.
+        Must be invoked with the lock held.
+
+        """
+        self._thread = threading.Thread(target=self._run,
+                                        name='helper-rate-limit')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+class SamplingFilter(logging.Filter):
+    """Allows a random sample of records, setting ``sample_rate`` on each
+    record that is allowed so that counts derived from the logs can be
+    scaled back up.
+
+    :param float rate: The fraction of records to allow, from 0 to 1
+    :param str|int level: Records at or above this level are always allowed
+    :param str name: Only filter records of this logger and its children
+    :raises: ValueError
+
+    """
+    def __init__(self, rate=0.1, level=None, name=''):
+        logging.Filter.__init__(self, name)
+        self.rate = float(rate)
+        if not 0 <= self.rate <= 1:
+            raise ValueError('Invalid sampling rate: {}'.format(rate))
+        self.level = _level(level)
+        self.dropped = 0
+        self._random = random.random
+
+    def filter(self, record):
+        """Return True if the record is allowed.
+
+        :param logging.LogRecord record: The record to filter
+        :rtype: bool
+
+        """
+        if not logging.Filter.filter(self, record):
+            return False
+        elif self.level is not None and record.levelno >= self.level:
+            return True
+        elif self._random() < self.rate:
+            record.sample_rate = self.rate
+            return True
+        self.dropped += 1
+        return False
@@ -0,0 +1,228 @@
+"""
+Structured log formatters that write each record as a JSON document or a
+logfmt line, so that log output can be ingested without being parsed.
+
+"""
+import collections
+import json
+import logging
+import re
+import time
+
+#: The fields that are written when none are configured
+DEFAULT_FIELDS = ('timestamp', 'level', 'logger', 'message')
+
+# Characters that require a logfmt value to be quoted
+_NEEDS_QUOTES = re.compile(r'[\s="\\]')
+
+# The attributes every log record has, which are not written as extra fields
+_RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord('', logging.INFO, '', 0, '', None, None).__dict__) | \
+    frozenset(['asctime', 'message'])
+
+
+def _encoder(name):
+    """Return the function that encodes a dict as a JSON document with the
+    named module, or the fastest one that is installed when not named:
+    ``orjson``, ``ujson`` or the standard library's ``json``.
+
+    :param str|None name: The module to use
+    :rtype: callable
+    :raises: ValueError
+
+    """
+    for module in ([name] if name else ['orjson', 'ujson', 'json']):
+        if module == 'json':
+            return json.JSONEncoder(
+                default=str, ensure_ascii=False,
+                separators=(',', ':')).encode
+        try:
+            library = __import__(module)
+        except ImportError:
+            if name:
+                raise ValueError(
+                    'JSON encoder {} is not installed'.format(name))
+            continue
+        if module == 'orjson':
+            return lambda value: library.dumps(value, default=str).decode(
+                'utf-8')
+        elif module == 'ujson':
+            return lambda value: library.dumps(
+                value, ensure_ascii=False, default=str)
+        raise ValueError('Unsupported JSON encoder: {}'.format(name))
+
+
+class StructuredFormatter(logging.Formatter):
+    """The base class of formatters that write the fields of each record as
+    key and value pairs. The function that returns the value of each field
+    is looked up once when the formatter is created, rather than for each
+    record.
+
+    Fields are named by the attribute of the record they are read from,
+    such as ``process``, ``threadName`` or ``lineno``, or are one of:
+
+    - ``timestamp``: when the record was created, in ISO 8601 format in UTC,
+      or formatted with ``datefmt`` when it is set
+    - ``level``: the level name
+    - ``logger``: the logger name
+    - ``message``: the message merged with its arguments
+
+    The exception and stack information are written as ``exception`` and
+    ``stack`` when present. Fields is either a list of field names or a dict
+    that maps the key to write each field as to its field name.
+
+    :param list|dict fields: The fields to write, in order
+    :param str datefmt: The :func:`time.strftime` format of the timestamp
+    :param bool extra: Also write the attributes added to the record with
+        the ``extra`` argument of a logging call
+
+    """
+    def __init__(self, fields=None, datefmt=None, extra=False):
+        logging.Formatter.__init__(self, datefmt=datefmt)
+        fields = fields or DEFAULT_FIELDS
+        if not isinstance(fields, dict):
+            fields = [(field, field) for field in fields]
+        else:
+            fields = list(fields.items())
+        self.fields = tuple((key, self._getter(field))
+                            for key, field in fields)
+        self.extra = extra
+        self._second = (None, None)
+
+    def format(self, record):
+        """Return the record formatted as a string.
+
+        :param logging.LogRecord record: The record to format
+        :rtype: str
+
+        """
+        raise NotImplementedError
+
+    def formatTime(self, record, datefmt=None):
+        """Return the time the record was created, in ISO 8601 format in
+        UTC with milliseconds unless ``datefmt`` is set. The part of the
+        timestamp up to the second is reused for records created within the
+        same second.
+
+        :param logging.LogRecord record: The record to format
+        :param str datefmt: The :func:`time.strftime` format to use
+        :rtype: str
+
+        """
+        if datefmt:
+            return logging.Formatter.formatTime(self, record, datefmt)
+        second, timestamp = self._second
+        if int(record.created) != second:
+            second = int(record.created)
+            timestamp = time.strftime('%Y-%m-%dT%H:%M:%S',
+                                      time.gmtime(second))
+            self._second = second, timestamp
+        return '{}.{:03d}Z'.format(timestamp, int(record.msecs))
+
+    def values(self, record):
+        """Return the key and value pairs to write for the record.
+
+        :param logging.LogRecord record: The record to format
+        :rtype: list
+
+        """
+        values = [(key, getter(record)) for key, getter in self.fields]
+        if self.extra:
+            values.extend((key, value)
+                          for key, value in record.__dict__.items()
+                          if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            values.append(('exception', record.exc_text))
+        elif record.exc_text:
+            values.append(('exception', record.exc_text))
+        if getattr(record, 'stack_info', None):
+            values.append(('stack', self.formatStack(record.stack_info)))
+        return values
+
+    def _getter(self, field):
+        """Return the function that returns the value of the field for a
+        record.
+
+        :param str field: The field name
+        :rtype: callable
+
+        """
+        if field == 'timestamp':
+            return lambda record: self.formatTime(record, self.datefmt)
+        elif field == 'level':
+            return lambda record: record.levelname
+        elif field == 'logger':
+            return lambda record: record.name
+        elif field == 'message':
+            return lambda record: record.getMessage()
+        return lambda record: getattr(record, field, None)
+
+
+class JSONFormatter(StructuredFormatter):
+    """Writes each record as a single line JSON document. The document is
+    encoded with ``orjson`` or ``ujson`` when one of them is installed, or
+    with the encoder named by ``encoder``.
+
+    :param list|dict fields: The fields to write, in order
+    :param str datefmt: The :func:`time.strftime` format of the timestamp
+    :param bool extra: Also write the attributes added to the record with
+        the ``extra`` argument of a logging call
+    :param str encoder: ``orjson``, ``ujson`` or ``json``
+    :raises: ValueError
+
+    """
+    def __init__(self, fields=None, datefmt=None, extra=False, encoder=None):
+        StructuredFormatter.__init__(self, fields, datefmt, extra)
+        self.encode = _encoder(encoder)
+
+    def format(self, record):
+        """Return the record formatted as a JSON document.
+
+        :param logging.LogRecord record: The record to format
+        :rtype: str
+
+        """
+        return self.encode(collections.OrderedDict(self.values(record)))
+
+
+class LogfmtFormatter(StructuredFormatter):
+    """Writes each record as a line of ``key=value`` pairs, quoting values
+    that are empty or contain whitespace, quotes, equals signs or
+    backslashes.
+
+    :param list|dict fields: The fields to write, in order
+    :param str datefmt: The :func:`time.strftime` format of the timestamp
+    :param bool extra: Also write the attributes added to the record with
+        the ``extra`` argument of a logging call
+
+    """
+    def format(self, record):
+        """Return the record formatted as a logfmt line.
+
+        :param logging.LogRecord record: The record to format
+        :rtype: str
+
+        """
+        quote = self._quote
+        return ' '.join([key + '=' + quote(value)
+                         for key, value in self.values(record)])
+
+    @staticmethod
+    def _quote(value):
+        """Return the value as a logfmt value.
+
+        :param mixed value: The value to write
+        :rtype: str
+
+        """
+        if value is None:
+            return ''
+        elif value is True or value is False:
+            return 'true' if value else 'false'
+        value = str(value)
+        if not value or _NEEDS_QUOTES.search(value):
+            return '"{}"'.format(value.replace('\\', '\\\\').replace(
+                '"', '\\"').replace('\n', '\\n'))
+        return value
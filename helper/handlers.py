@@ -0,0 +1,416 @@
+"""
+Logging handlers that reduce the cost of emitting log records, by moving it
+off of the threads that log them and by batching writes.
+
+"""
+import atexit
+import copy
+import logging
+import os
+import threading
+import weakref
+try:
+    import queue
+except ImportError:  # Python 2.7 support
+    import Queue as queue
+
+LOGGER = logging.getLogger(__name__)
+
+#: Drop records when the queue is full, so that logging never blocks
+POLICY_DROP = 'drop'
+
+#: Block the thread that is logging until there is room in the queue
+POLICY_BLOCK = 'block'
+
+#: The default maximum number of records waiting to be emitted
+QUEUE_SIZE = 10000
+
+# The pipelines that are running, restarted in forked child processes and
+# stopped when the interpreter exits
+_PIPELINES = weakref.WeakSet()
+
+# The buffered file handlers that are open, which are reopened by
+# reopen_files and whose flush thread is restarted in forked child processes
+_BUFFERED = weakref.WeakSet()
+
+
+class QueueHandler(logging.Handler):
+    """Puts each record on the queue of a :class:`QueuePipeline`, to be
+    emitted on its background thread by the handlers this handler replaced.
+
+    :param QueuePipeline pipeline: The pipeline to put records on
+    :param tuple handlers: The handlers that emit the records
+
+    """
+    def __init__(self, pipeline, handlers):
+        logging.Handler.__init__(self)
+        self.pipeline = pipeline
+        self.handlers = handlers
+
+    def emit(self, record):
+        """Put the record on the queue.
+
+        :param logging.LogRecord record: The record to emit
+
+        """
+        try:
+            self.pipeline.put(self.handlers, self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    @staticmethod
+    def prepare(record):
+        """Return a copy of the record with the message merged with its
+        arguments, so that arguments that are modified after the call to log
+        do not change the message that is emitted.
+
+        :param logging.LogRecord record: The record to prepare
+        :rtype: logging.LogRecord
+
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class QueuePipeline(object):
+    """Emits the records logged to each of the loggers on a background
+    thread, by replacing the handlers of each logger with a
+    :class:`QueueHandler` that puts the records on a bounded queue. Logging
+    then only costs formatting the message and putting it on the queue, so a
+    slow disk or syslog server does not stall the thread that is logging.
+
+    When the queue is full, records are dropped and counted in
+    :attr:`QueuePipeline.dropped` with the :data:`POLICY_DROP` policy, or
+    the thread that is logging waits for room in the queue with the
+    :data:`POLICY_BLOCK` policy. Stopping the pipeline restores the handlers
+    of each logger, emits the records that are in the queue and flushes the
+    handlers, which also happens when the interpreter exits.
+
+    :param list loggers: The loggers to emit the records of
+    :param int size: The maximum number of records waiting to be emitted
+    :param str policy: What to do when the queue is full
+    :raises: ValueError
+
+    """
+    def __init__(self, loggers, size=QUEUE_SIZE, policy=POLICY_DROP):
+        if policy not in (POLICY_DROP, POLICY_BLOCK):
+            raise ValueError('Invalid logging queue policy: {}'.format(policy))
+        self.loggers = loggers
+        self.size = int(size)
+        self.policy = policy
+        self.dropped = 0
+        self._handlers = {}
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    @property
+    def is_running(self):
+        """Returns True if the pipeline is running.
+
+        :rtype: bool
+
+        """
+        return self._thread is not None
+
+    def put(self, handlers, record):
+        """Put the record on the queue to be emitted by the handlers,
+        applying the policy when the queue is full.
+
+        :param tuple handlers: The handlers to emit the record with
+        :param logging.LogRecord record: The record to emit
+
+        """
+        if self.policy == POLICY_BLOCK:
+            self._queue.put((handlers, record))
+            return
+        try:
+            self._queue.put_nowait((handlers, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        """Replace the handlers of each logger with a :class:`QueueHandler`
+        and start emitting records on the background thread. Loggers that
+        share the same handlers share a :class:`QueueHandler`.
+
+        """
+        if self.is_running:
+            return
+        proxies = {}
+        for logger in self.loggers:
+            handlers = tuple(logger.handlers)
+            if not handlers:
+                continue
+            if handlers not in proxies:
+                proxies[handlers] = QueueHandler(self, handlers)
+            self._handlers[logger] = list(logger.handlers)
+            logger.handlers = [proxies[handlers]]
+        self._start_thread()
+        _PIPELINES.add(self)
+
+    def stop(self, flush=True):
+        """Restore the handlers of each logger, wait for the records in the
+        queue to be emitted and flush the handlers.
+
+        :param bool flush: Flush the handlers once the queue is empty
+
+        """
+        if not self.is_running:
+            return
+        _PIPELINES.discard(self)
+        for logger, handlers in self._handlers.items():
+            logger.handlers = handlers
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if flush:
+            for handlers in self._handlers.values():
+                for handler in handlers:
+                    handler.flush()
+        self._handlers = {}
+        if self.dropped:
+            LOGGER.warning('Dropped %i log records while the logging queue '
+                           'was full', self.dropped)
+
+    def _run(self, records):
+        """Emit the records on the queue until the sentinel is received.
+
+        :param queue.Queue records: The queue the thread was started with
+
+        """
+        while True:
+            item = records.get()
+            if item is None:
+                break
+            handlers, record = item
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+
+    def _start_thread(self):
+        """Create the queue and start the background thread."""
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.size)
+        self._thread = threading.Thread(target=self._run,
+                                        args=(self._queue,),
+                                        name='helper-logging')
+        self._thread.daemon = True
+        self._thread.start()
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """Writes records to a file in batches, so that heavy logging costs a
+    write for each batch instead of one for each record. The buffered
+    records are written when there are ``capacity`` of them, when a record
+    at or above ``flush_level`` is logged, and every ``flush_interval``
+    seconds by a background thread, so that a quiet period does not leave
+    records unwritten.
+
+    The file is reopened by :func:`reopen_files`, which the controller
+    invokes when SIGHUP is received, so that it can be rotated by
+    logrotate without reconfiguring logging.
+
+    :param str filename: The path of the file to write to
+    :param str mode: The mode to open the file with
+    :param str encoding: The encoding of the file
+    :param bool delay: Open the file when the first batch is written
+    :param int capacity: How many records to buffer before writing them
+    :param float flush_interval: The longest time a record is buffered,
+        in seconds
+    :param str|int flush_level: Records at or above this level are written
+        immediately, along with the records buffered before them
+    :raises: ValueError
+
+    """
+    def __init__(self, filename, mode='a', encoding=None, delay=False,
+                 capacity=1000, flush_interval=1.0, flush_level=logging.ERROR):
+        level = flush_level
+        if not isinstance(level, int):
+            level = logging.getLevelName(str(level).upper())
+            if not isinstance(level, int):
+                raise ValueError('Unknown logging level: {}'.format(
+                    flush_level))
+        logging.FileHandler.__init__(self, filename, mode, encoding, delay)
+        self.capacity = int(capacity)
+        self.flush_interval = float(flush_interval)
+        self.flush_level = level
+        self.buffer = []
+        self._pid = None
+        self._stop = None
+        self._thread = None
+        self._start_thread()
+        _BUFFERED.add(self)
+
+    def close(self):
+        """Stop the background thread, write the buffered records and close
+        the file.
+
+        """
+        _BUFFERED.discard(self)
+        if self._stop is not None:
+            self._stop.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._stop = None
+        self.acquire()
+        try:
+            self._write()
+            logging.FileHandler.close(self)
+        finally:
+            self.release()
+
+    def emit(self, record):
+        """Add the formatted record to the buffer, writing the buffer when
+        it is full or the record is at or above the flush level.
+
+        :param logging.LogRecord record: The record to emit
+
+        """
+        try:
+            self.buffer.append(self.format(record) +
+                               getattr(self, 'terminator', '\n'))
+            if len(self.buffer) >= self.capacity or \
+                    record.levelno >= self.flush_level:
+                self._write()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """Write the buffered records to the file."""
+        self.acquire()
+        try:
+            self._write()
+        finally:
+            self.release()
+
+    def reopen(self):
+        """Write the buffered records and reopen the file, so that records
+        are written to a new file once it was moved aside for rotation.
+
+        """
+        self.acquire()
+        try:
+            self._write()
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            if not self.delay:
+                self.stream = self._open()
+        finally:
+            self.release()
+
+    def _run(self, stop):
+        """Write the buffered records every flush interval until stopped.
+
+        :param threading.Event stop: Set when the handler is closed
+
+        """
+        while not stop.wait(self.flush_interval):
+            if self.buffer:
+                self.flush()
+
+    def _start_thread(self):
+        """Start the background thread that writes the buffered records
+        every flush interval.
+
+        """
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop,),
+            name='helper-logging-flush')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write(self):
+        """Write the buffered records to the file with a single write,
+        opening the file if it was delayed. Must be invoked with the handler
+        lock held.
+
+        """
+        if not self.buffer:
+            return
+        if self.stream is None:
+            if self.mode != 'w' or not getattr(self, '_closed', False):
+                self.stream = self._open()
+            else:
+                del self.buffer[:]
+                return
+        self.stream.write(''.join(self.buffer))
+        self.stream.flush()
+        del self.buffer[:]
+
+
+def reopen_files():
+    """Reopen the file of each :class:`BufferedFileHandler`, after writing
+    the records buffered for it. Invoked by the controller when SIGHUP is
+    received.
+
+    """
+    for handler in list(_BUFFERED):
+        try:
+            handler.reopen()
+        except (IOError, OSError) as error:
+            LOGGER.error('Could not reopen %s: %s', handler.baseFilename,
+                         error)
+
+
+def flush_files():
+    """Write the records buffered by each :class:`BufferedFileHandler`.
+    Invoked before forking, so that the records are not copied into the
+    child process and written by both processes.
+
+    """
+    for handler in list(_BUFFERED):
+        handler.flush()
+
+
+def shutdown():
+    """Stop each pipeline, emitting the records in its queue, and flush and
+    close every handler, as is done when the interpreter exits. Invoked by
+    worker processes, which exit without running the exit handlers.
+
+    """
+    _stop_pipelines()
+    logging.shutdown()
+
+
+def after_fork():
+    """Restart the background thread of each pipeline and buffered file
+    handler in a forked child process, where the thread does not exist. The
+    queue of each pipeline is replaced, since the records in it are emitted
+    by the parent and its lock may have been held when the process forked.
+
+    Invoked by :func:`os.register_at_fork` where it is available, and by
+    :mod:`helper.unix` after each fork for Python versions without it.
+    Threads that were started by the current process are left running, so
+    invoking it more than once after a fork has no further effect.
+
+    """
+    pid = os.getpid()
+    for pipeline in list(_PIPELINES):
+        if pipeline._pid != pid:
+            pipeline._start_thread()
+    for handler in list(_BUFFERED):
+        if handler._pid != pid:
+            handler._start_thread()
+
+
+@atexit.register
+def _stop_pipelines():
+    """Stop each pipeline that is running, emitting the records that are in
+    its queue, when the interpreter exits.
+
+    """
+    for pipeline in list(_PIPELINES):
+        pipeline.stop()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=flush_files, after_in_child=after_fork)
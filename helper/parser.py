@@ -67,8 +67,20 @@ def _add_default_arguments(parser):
     """
     parser.add_argument('-c', '--config', action='store', dest='config',
                         help='Path to the configuration file')
+    parser.add_argument('-i', '--include', action='append', dest='includes',
+                        metavar='PATH',
+                        help='Path to a configuration file or directory of '
+                             'configuration files that overrides the '
+                             'configuration file, may be specified more '
+                             'than once')
+    parser.add_argument('--set', action='append', dest='overrides',
+                        metavar='SECTION:KEY=VALUE',
+                        help='Override a configuration value, may be '
+                             'specified more than once')
     parser.add_argument('-f', '--foreground', action='store_true', dest='foreground',
                         help='Run the application interactively')
+    parser.add_argument('-w', '--workers', action='store', dest='workers',
+                        type=int, help='Number of worker processes to run')
 
 
 def parse():
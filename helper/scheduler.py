@@ -0,0 +1,352 @@
+"""
+Scheduling of multiple independent periodic tasks in the controller main loop.
+
+"""
+import datetime
+import heapq
+import itertools
+import logging
+import time
+try:
+    from time import monotonic
+except ImportError:  # Python 2.7 support
+    from time import time as monotonic
+
+from helper import stats
+
+LOGGER = logging.getLogger(__name__)
+
+#: Skip any runs that were missed while a task was overrunning its interval.
+OVERRUN_SKIP = 'skip'
+
+#: Run a task once for every missed run until its schedule has caught up.
+OVERRUN_CATCH_UP = 'catch_up'
+
+#: Run a task again immediately after an overrun and restart its schedule.
+OVERRUN_BACK_TO_BACK = 'back_to_back'
+
+OVERRUN_POLICIES = [OVERRUN_SKIP, OVERRUN_CATCH_UP, OVERRUN_BACK_TO_BACK]
+
+
+def next_deadline(scheduled, now, interval, policy):
+    """Return the monotonic deadline for the next run of something that is
+    scheduled at a fixed rate, applying the overrun policy if the run that was
+    scheduled for ``scheduled`` finished after the next run was due, along
+    with the number of runs that were skipped.
+
+    :param float scheduled: When the run that just finished was due
+    :param float now: The current monotonic time
+    :param float interval: The interval between runs
+    :param str policy: The overrun policy
+    :rtype: (float, int)
+    :raises: ValueError
+
+    """
+    if policy not in OVERRUN_POLICIES:
+        raise ValueError('Invalid overrun policy {}'.format(policy))
+    deadline = scheduled + interval
+    if now < deadline or policy == OVERRUN_CATCH_UP:
+        return deadline, 0
+    elif policy == OVERRUN_BACK_TO_BACK:
+        return now, 0
+    missed = int((now - scheduled) // interval)
+    return scheduled + (missed + 1) * interval, missed
+
+
+class CronSchedule(object):
+    """A five field cron expression (minute, hour, day of month, month and
+    day of week) supporting ``*``, ranges, lists and steps. As with cron, if
+    both the day of month and day of week are restricted, a day matching
+    either field matches.
+
+    :param str expression: The cron expression
+    :raises: ValueError
+
+    """
+    _FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(
+                'Invalid cron expression {!r}'.format(expression))
+        (self.minutes, self.hours, self.days, self.months,
+         self.weekdays) = [self._parse(field, minimum, maximum)
+                           for field, (minimum, maximum)
+                           in zip(fields, self._FIELDS)]
+        if 7 in self.weekdays:  # Sunday may be either 0 or 7
+            self.weekdays.add(0)
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def next_after(self, value):
+        """Return the first time after ``value`` that matches the
+        expression.
+
+        :param datetime.datetime value: The time to start from
+        :rtype: datetime.datetime
+
+        """
+        value = value.replace(second=0, microsecond=0)
+        value += datetime.timedelta(minutes=1)
+        limit = value.year + 5
+        while value.year <= limit:
+            if value.month not in self.months:
+                year, month = value.year, value.month + 1
+                if month > 12:
+                    year, month = year + 1, 1
+                value = datetime.datetime(year, month, 1)
+            elif not self._day_matches(value):
+                value = (value.replace(hour=0, minute=0) +
+                         datetime.timedelta(days=1))
+            elif value.hour not in self.hours:
+                value = (value.replace(minute=0) +
+                         datetime.timedelta(hours=1))
+            elif value.minute not in self.minutes:
+                value += datetime.timedelta(minutes=1)
+            else:
+                return value
+        raise ValueError('Cron expression {!r} never matches'.format(
+            self.expression))
+
+    def _day_matches(self, value):
+        """Return True if the day of the value matches the expression.
+
+        :param datetime.datetime value: The value to check
+        :rtype: bool
+
+        """
+        day = value.day in self.days
+        weekday = (value.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    @staticmethod
+    def _parse(field, minimum, maximum):
+        """Return the set of values that match a cron expression field.
+
+        :param str field: The field to parse
+        :param int minimum: The smallest valid value for the field
+        :param int maximum: The largest valid value for the field
+        :rtype: set
+        :raises: ValueError
+
+        """
+        values = set()
+        for part in field.split(','):
+            part, _sep, step = part.partition('/')
+            try:
+                step = int(step) if step else 1
+                if part == '*':
+                    start, end = minimum, maximum
+                elif '-' in part:
+                    start, end = [int(v) for v in part.split('-', 1)]
+                else:
+                    start = int(part)
+                    end = maximum if _sep else start
+            except ValueError:
+                raise ValueError('Invalid cron field {!r}'.format(field))
+            if start < minimum or end > maximum or start > end or step < 1:
+                raise ValueError('Invalid cron field {!r}'.format(field))
+            values.update(range(start, end + 1, step))
+        return values
+
+
+class Task(object):
+    """A callable that is run by the controller main loop on its own
+    interval or cron schedule, with its own overrun policy and timing
+    statistics.
+
+    :param str name: The unique name of the task
+    :param callable callback: The callable to run, which takes no arguments
+    :param float interval: How often to run the task, in seconds
+    :param str cron: A cron expression specifying when to run the task
+    :param str overrun_policy: The overrun policy for interval tasks
+    :raises: ValueError
+
+    """
+    def __init__(self, name, callback, interval=None, cron=None,
+                 overrun_policy=OVERRUN_SKIP):
+        if (interval is None) == (cron is None):
+            raise ValueError('Task {} requires either an interval or a cron '
+                             'expression'.format(name))
+        elif interval is not None and interval <= 0:
+            raise ValueError('Invalid interval for task {}'.format(name))
+        elif overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError('Invalid overrun policy {}'.format(
+                overrun_policy))
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.cron = CronSchedule(cron) if cron else None
+        self.overrun_policy = overrun_policy
+        self.deadline = None
+        self.duration = stats.Histogram()
+        self.failures = 0
+        self.skipped = 0
+        self.lateness_last = 0.0
+        self.lateness_max = 0.0
+
+    def first_deadline(self, now):
+        """Return the monotonic deadline for the first run of the task.
+
+        :param float now: The current monotonic time
+        :rtype: float
+
+        """
+        if self.cron:
+            return self._next_cron_deadline(now)
+        return now + self.interval
+
+    def next_deadline(self, scheduled, now):
+        """Return the monotonic deadline for the next run of the task after
+        the run that was scheduled for ``scheduled`` finished at ``now``.
+
+        :param float scheduled: When the run that finished was due
+        :param float now: The current monotonic time
+        :rtype: float
+
+        """
+        if self.cron:
+            return self._next_cron_deadline(now)
+        deadline, missed = next_deadline(
+            scheduled, now, self.interval, self.overrun_policy)
+        if missed:
+            self.skipped += missed
+            LOGGER.warning('Task %s skipped %i run(s) while overrunning',
+                           self.name, missed)
+        return deadline
+
+    def as_dict(self):
+        """Return a summary of the task's schedule and statistics.
+
+        :rtype: dict
+
+        """
+        return {'interval': self.interval,
+                'cron': self.cron.expression if self.cron else None,
+                'overrun_policy': self.overrun_policy,
+                'duration': self.duration.as_dict(),
+                'failures': self.failures,
+                'skipped': self.skipped,
+                'lateness_last': self.lateness_last,
+                'lateness_max': self.lateness_max}
+
+    def _next_cron_deadline(self, now):
+        """Return the monotonic deadline of the next time that matches the
+        cron expression.
+
+        :param float now: The current monotonic time
+        :rtype: float
+
+        """
+        wall = time.time()
+        value = self.cron.next_after(datetime.datetime.fromtimestamp(wall))
+        return now + max(time.mktime(value.timetuple()) - wall, 0)
+
+
+class Scheduler(object):
+    """A heap of tasks ordered by when they are next due. The scheduler does
+    not run tasks itself; the controller runs the tasks returned by
+    :meth:`Scheduler.pop_due` and passes them back to
+    :meth:`Scheduler.complete` to be rescheduled.
+
+    """
+    def __init__(self):
+        self._counter = itertools.count()
+        self._heap = []
+        self._tasks = {}
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def __getitem__(self, name):
+        return self._tasks[name]
+
+    def __iter__(self):
+        return iter(list(self._tasks.values()))
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, task):
+        """Add a task to the scheduler.
+
+        :param Task task: The task to add
+        :raises: ValueError
+
+        """
+        if task.name in self._tasks:
+            raise ValueError('Task {} already exists'.format(task.name))
+        self._tasks[task.name] = task
+        self._push(task, task.first_deadline(monotonic()))
+
+    def complete(self, task, scheduled, started, finished, failed=False):
+        """Record the run of a task that was returned by
+        :meth:`Scheduler.pop_due` and schedule its next run.
+
+        :param Task task: The task that ran
+        :param float scheduled: When the run was due
+        :param float started: When the run started
+        :param float finished: When the run finished
+        :param bool failed: If the run raised an exception
+
+        """
+        task.duration.add(finished - started)
+        task.lateness_last = max(started - scheduled, 0.0)
+        task.lateness_max = max(task.lateness_max, task.lateness_last)
+        if failed:
+            task.failures += 1
+        if self._tasks.get(task.name) is task:
+            self._push(task, task.next_deadline(scheduled, finished))
+
+    def next_deadline(self):
+        """Return the monotonic time the next task is due, or None if there
+        are no tasks.
+
+        :rtype: float|None
+
+        """
+        self._discard_removed()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return the tasks that are due at ``now``, in the order
+        they are due, along with when each was due.
+
+        :param float now: The current monotonic time
+        :rtype: list((Task, float))
+
+        """
+        due = []
+        while self.next_deadline() is not None and self._heap[0][0] <= now:
+            deadline, _count, task = heapq.heappop(self._heap)
+            task.deadline = None
+            due.append((task, deadline))
+        return due
+
+    def remove(self, name):
+        """Remove the task from the scheduler.
+
+        :param str name: The name of the task to remove
+        :raises: KeyError
+
+        """
+        self._tasks.pop(name).deadline = None
+
+    def _discard_removed(self):
+        """Discard heap entries for tasks that have been removed."""
+        while self._heap and self._heap[0][2].deadline != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _push(self, task, deadline):
+        """Schedule the task to run at the deadline.
+
+        :param Task task: The task to schedule
+        :param float deadline: When the task is due
+
+        """
+        task.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), task))
@@ -0,0 +1,127 @@
+"""
+Low overhead runtime statistics for the controller main loop.
+
+"""
+import array
+import bisect
+
+
+class Histogram(object):
+    """A fixed-size histogram of durations in seconds, backed by an array of
+    counters with exponentially sized buckets. Adding a value is a bisect and
+    an increment, so it can be called on every tick.
+
+    :param float minimum: The upper bound of the smallest bucket
+    :param float maximum: The upper bound of the largest bucket, larger
+        values are counted in an overflow bucket
+    :param float factor: The growth factor between bucket bounds
+
+    """
+    def __init__(self, minimum=0.000001, maximum=3600, factor=2):
+        bounds = [minimum]
+        while bounds[-1] < maximum:
+            bounds.append(bounds[-1] * factor)
+        self.bounds = bounds
+        self.counts = array.array('L', [0] * (len(bounds) + 1))
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """Add a value to the histogram.
+
+        :param float value: The value to add
+
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def mean(self):
+        """Return the mean of the values added to the histogram.
+
+        :rtype: float|None
+
+        """
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percentile):
+        """Return an estimate of the percentile, which is the upper bound of
+        the bucket that contains it, capped at the largest value added.
+
+        :param float percentile: The percentile to return, from 0 to 100
+        :rtype: float|None
+
+        """
+        if not self.count:
+            return None
+        threshold, seen = self.count * percentile / 100.0, 0
+        for offset, count in enumerate(self.counts):
+            seen += count
+            if seen and seen >= threshold:
+                if offset == len(self.bounds):
+                    return self.maximum
+                return min(self.bounds[offset], self.maximum)
+        return self.maximum
+
+    def reset(self):
+        """Remove all of the values from the histogram."""
+        for offset in range(len(self.counts)):
+            self.counts[offset] = 0
+        self.count, self.total = 0, 0.0
+        self.minimum, self.maximum = None, None
+
+    def as_dict(self):
+        """Return a summary of the histogram.
+
+        :rtype: dict
+
+        """
+        return {'count': self.count,
+                'total': self.total,
+                'min': self.minimum,
+                'max': self.maximum,
+                'mean': self.mean,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class Stats(object):
+    """Statistics collected by the controller main loop: the duration of each
+    :meth:`~helper.controller.Controller.process` invocation, the time spent
+    sleeping between them, the number of signals handled and configuration
+    reloads, and how often an invocation was skipped because the thread pool
+    was saturated.
+
+    """
+    def __init__(self):
+        self.process = Histogram()
+        self.sleep = Histogram()
+        self.signals = 0
+        self.reloads = 0
+        self.saturated = 0
+
+    def reset(self):
+        """Reset all of the statistics."""
+        self.process.reset()
+        self.sleep.reset()
+        self.signals, self.reloads, self.saturated = 0, 0, 0
+
+    def as_dict(self):
+        """Return a summary of the statistics.
+
+        :rtype: dict
+
+        """
+        return {'process': self.process.as_dict(),
+                'sleep': self.sleep.as_dict(),
+                'signals': self.signals,
+                'reloads': self.reloads,
+                'saturated': self.saturated}
@@ -4,6 +4,7 @@ Unix daemonization support
 """
 import atexit
 import datetime
+import errno
 import grp
 import logging
 import os
@@ -11,11 +12,19 @@ from os import path
 import platform
 import pwd
 import re
+import signal
 import stat
 import subprocess
 import sys
+import time
 import traceback
 import warnings
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from helper import handlers, wakeup
 
 
 # Ignore the DeprecationWarning caused by os.popen3 in Python 2.6
@@ -40,6 +49,24 @@ def operating_system():
     return os_platform
 
 
+def _fork():
+    """Fork the process, writing the buffered log records first so that
+    they are not copied into the child and written by both processes, and
+    restarting the background logging threads in the child, which only has
+    the thread that forked it. Returns the pid of the child process in the
+    parent and 0 in the child.
+
+    :rtype: int
+    :raises: OSError
+
+    """
+    handlers.flush_files()
+    pid = os.fork()
+    if not pid:
+        handlers.after_fork()
+    return pid
+
+
 class Daemon(object):
     """Daemonize the helper application, putting it in a forked background
     process.
@@ -56,8 +83,7 @@ class Daemon(object):
 
         """
         # The logger is reset by the time it gets here, fix to avoid warnings
-        from helper import NullHandler
-        LOGGER.addHandler(NullHandler())
+        LOGGER.addHandler(logging.NullHandler())
 
         self.controller = controller
         self.config = self.controller.config
@@ -121,8 +147,8 @@ class Daemon(object):
 
         """
         if not self._gid:
-            if self.controller.config.daemon.group:
-                self._gid = grp.getgrnam(self.config.daemon.group).gr_gid
+            if self.config.daemon.get('group'):
+                self._gid = grp.getgrnam(self.config.daemon['group']).gr_gid
             else:
                 self._gid = os.getgid()
         return self._gid
@@ -135,8 +161,8 @@ class Daemon(object):
 
         """
         if not self._uid:
-            if self.config.daemon.user:
-                self._uid = pwd.getpwnam(self.config.daemon.user).pw_uid
+            if self.config.daemon.get('user'):
+                self._uid = pwd.getpwnam(self.config.daemon['user']).pw_uid
             else:
                 self._uid = os.getuid()
         return self._uid
@@ -156,7 +182,7 @@ class Daemon(object):
             fd.close()
 
         try:
-            pid = os.fork()
+            pid = _fork()
             if pid > 0:
                     sys.exit(0)
         except OSError as error:
@@ -180,7 +206,7 @@ class Daemon(object):
 
         # Fork again
         try:
-            pid = os.fork()
+            pid = _fork()
             if pid > 0:
                 sys.exit(0)
         except OSError as error:
@@ -225,8 +251,8 @@ class Daemon(object):
         :raises: OSError
 
         """
-        if self.config.daemon.pidfile:
-            pidfile = path.abspath(self.config.daemon.pidfile)
+        if self.config.daemon.get('pidfile'):
+            pidfile = path.abspath(self.config.daemon['pidfile'])
             if not os.access(path.dirname(pidfile), os.W_OK):
                 raise ValueError('Cannot write to specified pid file path'
                                  ' %s' % pidfile)
@@ -296,3 +322,234 @@ class Daemon(object):
         LOGGER.debug('Writing pidfile: %s', self.pidfile_path)
         with open(self.pidfile_path, "w") as handle:
             handle.write(str(os.getpid()))
+
+
+class Supervisor(object):
+    """Run multiple instances of a controller in forked worker processes,
+    forwarding signals to them and respawning workers that exit abnormally.
+
+    The supervisor can be passed to :class:`Daemon` in place of a controller
+    so that the parent process is only daemonized once.
+
+    """
+    #: The signals that are forwarded to each of the worker processes
+    SIGNALS = [signal.SIGHUP, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2]
+
+    #: How long to wait before respawning a worker that exited abnormally
+    RESPAWN_DELAY = 1
+
+    #: The maximum delay before respawning a worker, which is doubled for each
+    #: consecutive abnormal exit up to this value
+    RESPAWN_DELAY_MAX = 60
+
+    #: If a worker ran for at least this many seconds before exiting, it is
+    #: respawned without any delay
+    RESPAWN_RESET = 60
+
+    def __init__(self, controller, workers):
+        """Create a new supervisor that will run ``workers`` instances of the
+        controller class of the controller that is passed in.
+
+        :param controller: The controller to create worker instances from
+        :type controller: helper.controller.Controller
+        :param int workers: The number of worker processes to run
+
+        """
+        self.controller = controller
+        self.config = controller.config
+        self.workers = workers
+        self._failures = [0] * workers
+        self._pids = {}
+        self._respawn_at = {}
+        self._started_at = {}
+        self._stopping = False
+        self._wakeup = None
+
+    def start(self):
+        """Spawn the worker processes and supervise them until the supervisor
+        receives SIGTERM and all of the workers have exited.
+
+        """
+        LOGGER.info('Starting %i workers', self.workers)
+        self._wakeup = wakeup.Wakeup()
+        for signum in self._signals():
+            signal.signal(signum, self._on_signal)
+        for slot in range(self.workers):
+            self._spawn(slot)
+        try:
+            while self._pids or (self._respawn_at and not self._stopping):
+                self._process_signals(self._timeout())
+                self._reap()
+                self._respawn()
+        finally:
+            for signum in self._signals():
+                signal.signal(signum, signal.SIG_DFL)
+            self._wakeup.close()
+        LOGGER.info('All workers have exited')
+
+    def stop(self):
+        """Stop all of the worker processes, blocking until they have
+        exited.
+
+        """
+        LOGGER.info('Stopping %i workers', len(self._pids))
+        self._stopping = True
+        self._respawn_at = {}
+        self._signal_workers(signal.SIGTERM)
+        for pid in list(self._pids):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            del self._pids[pid]
+
+    def _on_signal(self, signum, _frame):
+        """Append the signal to the queue, to be processed by the main."""
+        if signum == signal.SIGCHLD:
+            self._wakeup.notify()
+        else:
+            self._wakeup.put(signum)
+
+    def _process_signals(self, timeout):
+        """Block until a signal is received or the timeout has passed,
+        forwarding any signals that were received to the workers and
+        initiating shutdown on SIGTERM.
+
+        :param float|None timeout: How long to block for
+
+        """
+        try:
+            signum = self._wakeup.get(True, timeout)
+        except queue.Empty:
+            return
+        while True:
+            if signum == signal.SIGTERM:
+                LOGGER.info('Received SIGTERM, stopping workers')
+                self._stopping = True
+                self._respawn_at = {}
+            self._signal_workers(signum)
+            try:
+                signum = self._wakeup.get_nowait()
+            except queue.Empty:
+                return
+
+    def _reap(self):
+        """Collect the exit status of any workers that have exited,
+        scheduling abnormally exited workers to be respawned.
+
+        """
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as error:
+                if error.errno != errno.ECHILD:
+                    raise
+                return
+            if not pid:
+                return
+            slot = self._pids.pop(pid, None)
+            if slot is None:
+                continue
+            runtime = time.time() - self._started_at.pop(slot)
+            if self._stopping or (os.WIFEXITED(status) and
+                                  not os.WEXITSTATUS(status)):
+                LOGGER.info('Worker %i (pid %i) exited', slot, pid)
+                continue
+            if runtime >= self.RESPAWN_RESET:
+                self._failures[slot] = 0
+            delay = min(self.RESPAWN_DELAY * (2 ** self._failures[slot]),
+                        self.RESPAWN_DELAY_MAX) if self._failures[slot] else 0
+            self._failures[slot] += 1
+            LOGGER.warning('Worker %i (pid %i) exited abnormally with status '
+                           '%i, respawning in %.1f seconds',
+                           slot, pid, status, delay)
+            self._respawn_at[slot] = time.time() + delay
+
+    def _respawn(self):
+        """Respawn any workers whose respawn delay has passed."""
+        now = time.time()
+        for slot, respawn_at in list(self._respawn_at.items()):
+            if respawn_at <= now:
+                del self._respawn_at[slot]
+                self._spawn(slot)
+
+    def _signals(self):
+        """Return the signals to install handlers for: the signals that are
+        forwarded to the workers, the signal that toggles profiling in the
+        workers if one is configured, and SIGCHLD.
+
+        :rtype: list
+
+        """
+        signals = list(self.SIGNALS)
+        profile_signal = getattr(self.controller, 'profile_signal', None)
+        if profile_signal and profile_signal not in signals:
+            signals.append(profile_signal)
+        return signals + [signal.SIGCHLD]
+
+    def _signal_workers(self, signum):
+        """Send the signal to all of the running workers.
+
+        :param int signum: The signal to send
+
+        """
+        for pid in self._pids:
+            try:
+                os.kill(pid, signum)
+            except OSError as error:
+                LOGGER.debug('Could not signal worker pid %i: %s', pid, error)
+
+    def _spawn(self, slot):
+        """Fork a new worker process for the slot, which creates its own
+        controller instance and runs it. Buffered log records are written
+        before forking, the background logging threads are restarted in the
+        worker, and the worker shuts logging down before it exits so that
+        the records it buffered or queued are written.
+
+        :param int slot: The worker slot to spawn a process for
+
+        """
+        pid = _fork()
+        if pid:
+            LOGGER.info('Started worker %i as pid %i', slot, pid)
+            self._pids[pid] = slot
+            self._started_at[slot] = time.time()
+            return
+        self._wakeup.close()
+        for signum in self._signals():
+            signal.signal(signum, signal.SIG_DFL)
+        status = 0
+        try:
+            controller = self.controller.__class__(
+                self.controller.args, self.controller.operating_system)
+            try:
+                controller.start()
+            except KeyboardInterrupt:
+                controller.stop()
+        except SystemExit as error:
+            if error.code is None:
+                status = 0
+            elif isinstance(error.code, int):
+                status = error.code
+            else:
+                status = 1
+        except Exception as error:
+            LOGGER.exception('Worker %i failed: %s', slot, error)
+            status = 1
+        finally:
+            try:
+                handlers.shutdown()
+            except Exception:
+                pass
+            os._exit(status)
+
+    def _timeout(self):
+        """Return how long to block waiting for signals, based upon when the
+        next worker is to be respawned.
+
+        :rtype: float|None
+
+        """
+        if not self._respawn_at:
+            return None
+        return max(min(self._respawn_at.values()) - time.time(), 0)
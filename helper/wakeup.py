@@ -0,0 +1,162 @@
+"""
+In-process wakeup primitive used to deliver signals and notifications from
+signal handlers and other threads to a blocking main loop.
+
+"""
+import collections
+import errno
+import os
+import select
+import socket
+import sys
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Wakeup(object):
+    """A self-pipe with an attached FIFO of pending items. Putting an item
+    appends it to the FIFO and writes a byte to the pipe, waking a loop that
+    is blocked in :meth:`Wakeup.get`. It is safe to put items from signal
+    handlers and from other threads.
+
+    The :meth:`Wakeup.get` and :meth:`Wakeup.put` methods mirror the
+    :class:`queue.Queue` interface, raising :exc:`queue.Empty` when the
+    timeout passes without an item being put.
+
+    """
+    def __init__(self):
+        self._items = collections.deque()
+        if sys.platform == 'win32':
+            self._reader, self._writer = socket.socketpair()
+            self._reader.setblocking(False)
+            self._writer.setblocking(False)
+            self._read_fd = self._reader.fileno()
+        else:
+            self._reader = self._writer = None
+            self._read_fd, self._write_fd = os.pipe()
+            for fd in (self._read_fd, self._write_fd):
+                _set_nonblocking(fd)
+
+    def close(self):
+        """Close the pipe, after which the object can no longer be used."""
+        if self._reader is not None:
+            self._reader.close()
+            self._writer.close()
+        else:
+            os.close(self._read_fd)
+            os.close(self._write_fd)
+
+    def empty(self):
+        """Return True if there are no pending items.
+
+        :rtype: bool
+
+        """
+        return not self._items
+
+    def fileno(self):
+        """Return the file descriptor that becomes readable when an item is
+        put, for use with :func:`select.select` or an event loop.
+
+        :rtype: int
+
+        """
+        return self._read_fd
+
+    def get(self, block=True, timeout=None):
+        """Return the next pending item, blocking up to ``timeout`` seconds
+        for one to be put if ``block`` is True.
+
+        :param bool block: Block until an item is available
+        :param float timeout: How long to block for, None blocks forever
+        :raises: queue.Empty
+
+        """
+        if not self._items and block:
+            try:
+                select.select([self._read_fd], [], [], timeout)
+            except (OSError, select.error) as error:
+                if _errno(error) != errno.EINTR:
+                    raise
+            self._drain()
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def get_nowait(self):
+        """Return the next pending item without blocking.
+
+        :raises: queue.Empty
+
+        """
+        return self.get(False)
+
+    def notify(self):
+        """Wake the loop that is blocked in :meth:`Wakeup.get` without
+        adding an item, causing it to raise :exc:`queue.Empty`.
+
+        """
+        try:
+            if self._writer is not None:
+                self._writer.send(b'\0')
+            else:
+                os.write(self._write_fd, b'\0')
+        except (OSError, socket.error) as error:
+            # A full pipe already guarantees the reader will wake up
+            if _errno(error) not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def put(self, item, block=True, timeout=None):
+        """Append the item to the pending items and wake the loop.
+
+        :param mixed item: The item to put
+
+        """
+        self._items.append(item)
+        self.notify()
+
+    def put_nowait(self, item):
+        """Append the item to the pending items and wake the loop.
+
+        :param mixed item: The item to put
+
+        """
+        self.put(item)
+
+    def _drain(self):
+        """Read all of the pending wakeup bytes from the pipe."""
+        try:
+            while True:
+                if self._reader is not None:
+                    data = self._reader.recv(4096)
+                else:
+                    data = os.read(self._read_fd, 4096)
+                if not data:
+                    return
+        except (OSError, socket.error) as error:
+            if _errno(error) not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+
+def _errno(error):
+    """Return the errno for an exception raised by select or os calls,
+    which differ between Python 2 and 3.
+
+    :rtype: int
+
+    """
+    return getattr(error, 'errno', None) or error.args[0]
+
+
+def _set_nonblocking(fd):
+    """Put the file descriptor in non-blocking mode.
+
+    :param int fd: The file descriptor
+
+    """
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
@@ -0,0 +1,380 @@
+"""
+Watch the configuration for changes in a background thread, using inotify on
+Linux and polling the file's stat signature elsewhere, or Consul blocking
+queries for configuration in the Consul KV store.
+
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+from os import path
+import select
+import struct
+import sys
+import threading
+try:
+    from time import monotonic
+except ImportError:  # Python 2.7 support
+    from time import time as monotonic
+
+from helper import consul, wakeup
+
+LOGGER = logging.getLogger(__name__)
+
+#: Use inotify to watch for changes
+BACKEND_INOTIFY = 'inotify'
+
+#: Poll the stat signature of the file for changes
+BACKEND_POLL = 'poll'
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+
+# The events in the directory containing the file that indicate the file
+# may have changed, including it being replaced by a rename
+_IN_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+            _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+
+_EVENT = struct.Struct('iIII')
+
+
+def _libc():
+    """Return libc if it provides the inotify functions, otherwise None.
+
+    :rtype: ctypes.CDLL|None
+
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+class Watcher(object):
+    """Invoke a callback from a background thread when a file changes,
+    including when it is replaced by an atomic rename or a symlink swap, as
+    configuration management tools do. Changes are debounced: the callback
+    is invoked once the file has not changed for ``debounce`` seconds, so a
+    burst of writes results in a single invocation.
+
+    The directory containing the file is watched with inotify where it is
+    available, otherwise the file's inode, size and modification time are
+    polled every ``poll_interval`` seconds.
+
+    When ``file_path`` is a directory, such as a ``conf.d`` directory of
+    included configuration files, a file being added to, removed from or
+    changed in it invokes the callback.
+
+    :param str file_path: The path to the file or directory to watch
+    :param callable callback: Invoked with no arguments when the file changes
+    :param float debounce: How long the file must be unchanged for before
+        the callback is invoked, in seconds
+    :param float poll_interval: How often to poll the file when inotify is
+        not available, in seconds
+    :param str backend: Force the use of :data:`BACKEND_INOTIFY` or
+        :data:`BACKEND_POLL`
+
+    """
+    def __init__(self, file_path, callback, debounce=1.0, poll_interval=5.0,
+                 backend=None):
+        self.file_path = path.abspath(file_path)
+        self.is_directory = path.isdir(self.file_path)
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = backend or (BACKEND_INOTIFY if _libc() else
+                                   BACKEND_POLL)
+        self._inotify_fd = None
+        self._signature = None
+        self._stop = None
+        self._thread = None
+
+    @property
+    def is_running(self):
+        """Returns True if the watcher thread is running.
+
+        :rtype: bool
+
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start watching the file in a background thread.
+
+        :raises: OSError
+
+        """
+        if self.is_running:
+            return
+        if self.backend == BACKEND_INOTIFY:
+            self._inotify_fd = self._add_inotify_watch()
+        self._stop = wakeup.Wakeup()
+        self._signature = self._stat_signature()
+        self._thread = threading.Thread(
+            target=self._run, name='helper-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+        LOGGER.debug('Watching %s for changes using %s', self.file_path,
+                     self.backend)
+
+    def stop(self):
+        """Stop watching the file, waiting for the background thread to
+        exit. Must not be invoked from the callback.
+
+        """
+        if self._stop is None:
+            return
+        self._stop.put(None)
+        self._thread.join()
+        self._close()
+
+    def _add_inotify_watch(self):
+        """Return an inotify file descriptor watching the directory, or the
+        directory that contains the file.
+
+        :rtype: int
+        :raises: OSError
+
+        """
+        libc = _libc()
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        directory = (self.file_path if self.is_directory else
+                     path.dirname(self.file_path)).encode(
+                         sys.getfilesystemencoding())
+        if libc.inotify_add_watch(fd, directory, _IN_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(error, os.strerror(error))
+        return fd
+
+    def _close(self):
+        """Close the file descriptors used by the watcher."""
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        self._stop.close()
+        self._stop = None
+
+    def _is_relevant(self, name):
+        """Return True if an inotify event for the named entry in the
+        directory may have changed the file. When the file is a symlink, as
+        with Kubernetes ConfigMap volumes, any entry may be its target, and
+        when a directory is watched, every entry is in it.
+
+        :param bytes name: The name of the entry in the directory
+        :rtype: bool
+
+        """
+        if self.is_directory:
+            return True
+        return (name.decode(sys.getfilesystemencoding(), 'replace') ==
+                path.basename(self.file_path) or path.islink(self.file_path))
+
+    def _read_inotify_events(self):
+        """Read the pending inotify events, returning True if any of them
+        may have changed the file.
+
+        :rtype: bool
+
+        """
+        changed = False
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 65536)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return changed
+                raise
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                _wd, _mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                changed = changed or self._is_relevant(name)
+
+    def _run(self):
+        """Wait for the file to change and invoke the callback once it has
+        not changed for the debounce period, until stopped.
+
+        """
+        while self._wait(None):
+            while self._wait(self.debounce):
+                pass
+            if not self._stop.empty():
+                break
+            LOGGER.debug('%s changed', self.file_path)
+            try:
+                self.callback()
+            except Exception as error:
+                LOGGER.exception('Error invoking watcher callback: %s', error)
+
+    def _stat_signature(self, file_path=None):
+        """Return the inode, size and modification time of the file, or None
+        if it does not exist. The signature of a directory is the name and
+        signature of each entry in it.
+
+        :param str file_path: The file to stat, defaulting to the watched
+            file
+        :rtype: tuple|None
+
+        """
+        file_path = file_path or self.file_path
+        if file_path == self.file_path and self.is_directory:
+            try:
+                names = sorted(os.listdir(file_path))
+            except OSError:
+                return None
+            return tuple((name, self._stat_signature(
+                path.join(file_path, name))) for name in names)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size,
+                getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+    def _wait(self, timeout):
+        """Wait up to ``timeout`` seconds for the file to change, returning
+        True if it changed and False if the timeout passed or the watcher
+        was stopped.
+
+        :param float|None timeout: How long to wait, None waits until the
+            file changes or the watcher is stopped
+        :rtype: bool
+
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while self._stop.empty():
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            fds = [self._stop.fileno()]
+            if self._inotify_fd is not None:
+                fds.append(self._inotify_fd)
+            else:
+                remaining = min(remaining or self.poll_interval,
+                                self.poll_interval)
+            try:
+                readable = select.select(fds, [], [], remaining)[0]
+            except (OSError, select.error) as error:
+                if (getattr(error, 'errno', None) or
+                        error.args[0]) != errno.EINTR:
+                    raise
+                continue
+            if self._stop.fileno() in readable:
+                continue
+            if self._inotify_fd is not None:
+                if not self._read_inotify_events():
+                    continue
+            signature = self._stat_signature()
+            if self._inotify_fd is not None or signature != self._signature:
+                self._signature = signature
+                return True
+        return False
+
+
+class ConsulWatcher(object):
+    """Invoke a callback from a background thread when a key or prefix in
+    the Consul KV store changes, using blocking queries that return as soon
+    as its index changes instead of polling.
+
+    :param str url: The consul:// URL of the key or prefix to watch
+    :param callable callback: Invoked with no arguments when it changes
+    :param int index: The Consul index of the version that was loaded, so
+        that a change made before the watcher started is not missed
+    :param float wait: How long each blocking query waits for, in seconds
+
+    """
+    #: How long to wait before retrying after an error, in seconds
+    RETRY_DELAY = 1
+
+    #: The longest time to wait before retrying after repeated errors
+    RETRY_DELAY_MAX = 60
+
+    def __init__(self, url, callback, index=None, wait=300):
+        self.kv = consul.KV(url)
+        self.callback = callback
+        self.index = int(index) if index else None
+        self.wait = wait
+        self._stop = None
+        self._thread = None
+
+    @property
+    def is_running(self):
+        """Returns True if the watcher thread is running.
+
+        :rtype: bool
+
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start watching the key or prefix in a background thread."""
+        if self.is_running:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='helper-consul-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+        LOGGER.debug('Watching %s for changes', self.kv.api_url)
+
+    def stop(self):
+        """Stop watching for changes. A blocking query that is in progress
+        is abandoned rather than waited for, and its result is discarded.
+
+        """
+        if self._stop is not None:
+            self._stop.set()
+
+    def _run(self):
+        """Issue blocking queries until stopped, invoking the callback each
+        time the index changes.
+
+        """
+        delay = self.RETRY_DELAY
+        stop = self._stop
+        while not stop.is_set():
+            try:
+                _content, index = self.kv.get(self.index, self.wait)
+            except Exception as error:
+                LOGGER.warning('Error watching %s, retrying in %i seconds: '
+                               '%s', self.kv.api_url, delay, error)
+                stop.wait(delay)
+                delay = min(delay * 2, self.RETRY_DELAY_MAX)
+                continue
+            delay = self.RETRY_DELAY
+            if stop.is_set():
+                break
+            elif self.index is not None and index != self.index:
+                LOGGER.debug('%s changed', self.kv.api_url)
+                try:
+                    self.callback()
+                except Exception as error:
+                    LOGGER.exception('Error invoking watcher callback: %s',
+                                     error)
+            if index > 0:
+                self.index = index
+            else:
+                # Consul did not return an index, avoid a tight loop
+                self.index = None
+                stop.wait(self.RETRY_DELAY)
@@ -0,0 +1,156 @@
+"""
+Tests for helper.aio, imported by aio_tests on Python 3.5 and later since
+coroutines are a syntax error on earlier versions.
+
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+import mock
+
+from helper import aio
+
+
+class Controller(aio.AsyncController):
+
+    def __init__(self, *args, **kwargs):
+        super(Controller, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    async def setup(self):
+        self.calls.append('setup')
+
+    async def process(self):
+        self.calls.append('process')
+        if self.calls.count('process') == 3:
+            self._on_signal(signal.SIGTERM, None)
+
+    async def shutdown(self):
+        self.calls.append('shutdown')
+
+    async def on_sigusr1(self):
+        self.calls.append('sigusr1')
+
+
+class AsyncControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'config.yml')
+        self.write('wake_interval: 0.01')
+        self.controller = self.create()
+
+    def create(self):
+        return Controller(
+            argparse.Namespace(config=self.path, foreground=True), 'test')
+
+    def write(self, *values):
+        with open(self.path, 'w') as handle:
+            handle.write('Application:\n')
+            for value in values:
+                handle.write('  {}\n'.format(value))
+
+    def test_run_until_sigterm(self):
+        self.controller.start()
+        self.assertEqual(self.controller.calls,
+                         ['setup', 'process', 'process', 'process',
+                          'shutdown'])
+        self.assertTrue(self.controller.is_stopped)
+        self.assertTrue(self.controller.loop.is_closed())
+
+    def test_fixed_rate_run_until_sigterm(self):
+        self.write('wake_interval: 0.01', 'fixed_rate: true')
+        controller = self.create()
+        controller.start()
+        self.assertEqual(controller.calls.count('process'), 3)
+        self.assertEqual(controller.tick_counters['ticks'], 3)
+        self.assertTrue(controller.is_stopped)
+
+    def test_coroutine_signal_hook_is_awaited(self):
+        setup = self.controller.setup
+
+        async def setup_and_signal():
+            await setup()
+            self.controller._on_signal(signal.SIGUSR1, None)
+
+        self.controller.setup = setup_and_signal
+        self.controller.start()
+        self.assertEqual(self.controller.calls,
+                         ['setup', 'sigusr1', 'process', 'process',
+                          'process', 'shutdown'])
+
+    def test_reloaded_profile_signal_is_handled(self):
+        previous = signal.signal(signal.SIGPROF, lambda *args: None)
+        self.addCleanup(signal.signal, signal.SIGPROF, previous)
+        setup = self.controller.setup
+
+        async def setup_and_reload():
+            await setup()
+            self.write('wake_interval: 0.01', 'profile_signal: SIGPROF')
+            await self.controller.reload_configuration()
+            os.kill(os.getpid(), signal.SIGPROF)
+
+        self.controller.setup = setup_and_reload
+        self.controller.start()
+        self.assertTrue(self.controller.is_profiling)
+        self.assertEqual(self.controller._installed_signals, [])
+
+    def test_stop_waits_for_running_process(self):
+        self.write('wake_interval: 0.01', 'drain_timeout: 5')
+        controller = self.create()
+
+        async def process():
+            controller.calls.append('process')
+            controller.loop.call_soon(controller.stop)
+            await asyncio.sleep(0.1)
+            controller.calls.append('processed')
+
+        controller.process = process
+        controller.start()
+        self.assertEqual(controller.calls,
+                         ['setup', 'process', 'processed', 'shutdown'])
+        self.assertTrue(controller.is_stopped)
+
+    def test_stop_continues_after_drain_timeout(self):
+        self.write('wake_interval: 0.01', 'drain_timeout: 0.05')
+        controller = self.create()
+
+        async def process():
+            controller.calls.append('process')
+            controller.loop.call_soon(controller.stop)
+            await asyncio.sleep(0.5)
+            controller.calls.append('processed')
+
+        controller.process = process
+        with mock.patch('helper.aio.LOGGER') as logger:
+            controller.start()
+        self.assertEqual(controller.calls[:3],
+                         ['setup', 'process', 'shutdown'])
+        self.assertTrue(logger.warning.called)
+
+    def test_stop_without_loop(self):
+        self.assertIsNone(self.controller.stop())
+
+    def test_pool_size_is_rejected_at_startup(self):
+        self.write('wake_interval: 0.01', 'pool_size: 2')
+        with mock.patch('sys.stderr') as stderr:
+            with self.assertRaises(SystemExit):
+                self.create()
+        self.assertIn('pool_size is not supported',
+                      stderr.write.call_args[0][0])
+
+    def test_pool_size_is_rejected_on_reload(self):
+        self.write('wake_interval: 0.5', 'pool_size: 2')
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        changes = loop.run_until_complete(
+            self.controller.reload_configuration())
+        self.assertFalse(changes)
+        self.assertEqual(self.controller.wake_interval, 0.01)
+        self.assertEqual(self.controller.pool_size, 0)
@@ -0,0 +1,9 @@
+"""
+The AsyncController tests are defined in aio_cases, which is only imported
+on Python 3.5 and later since coroutines are a syntax error before then.
+
+"""
+import sys
+
+if sys.version_info >= (3, 5):
+    from tests.aio_cases import AsyncControllerTests  # noqa: F401
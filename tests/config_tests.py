@@ -1,11 +1,19 @@
+import copy
 import json
+import logging.config
 import os
+import shutil
+import tempfile
+import threading
 import unittest
 import uuid
 
 import boto3
+import mock
+import requests
+import yaml
 
-from helper import config
+from helper import config, handlers, watcher
 
 
 class ConfigDefaultTests(unittest.TestCase):
@@ -82,3 +90,633 @@ class S3ConfigTests(RemoteConfigTests):
     def test_value_error_raised_for_missing_file(self):
         with self.assertRaises(ValueError):
             config.Config('s3://{}/{}.json'.format(self.bucket, uuid.uuid4()))
+
+    def test_client_is_reused(self):
+        cfg = config.Config('s3://{}/test.json'.format(self.bucket))
+        client = cfg._s3_client()
+        cfg.reload()
+        self.assertIs(cfg._s3_client(), client)
+
+    def test_reload_sends_etag(self):
+        cfg = config.Config('s3://{}/test.json'.format(self.bucket))
+        etag = cfg._etag
+        self.assertIsNotNone(etag)
+        with mock.patch.object(cfg._s3_client(), 'get_object',
+                               wraps=cfg._s3_client().get_object) as get:
+            self.assertFalse(cfg.reload())
+            self.assertEqual(get.call_args[1]['IfNoneMatch'], etag)
+
+    def test_reload_detects_change(self):
+        cfg = config.Config('s3://{}/test.json'.format(self.bucket))
+        self.value['Application']['key'] = str(uuid.uuid4())
+        cfg._s3_client().put_object(
+            Bucket=self.bucket, Key='test.json', Body=json.dumps(self.value))
+        self.assertTrue(cfg.reload())
+        self.assertEqual(cfg.application['key'],
+                         self.value['Application']['key'])
+
+    def test_cache_is_used_for_cold_start(self):
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        file_path = 's3://{}/test.json'.format(self.bucket)
+        with mock.patch.dict(os.environ,
+                             {'HELPER_CONFIG_CACHE': cache_directory}):
+            config.Config(file_path)
+            boto3.client(
+                's3', endpoint_url=os.environ['S3_ENDPOINT']).delete_object(
+                    Bucket=self.bucket, Key='test.json')
+            cfg = config.Config(file_path)
+        self.assertEqual(cfg.application['key'],
+                         self.value['Application']['key'])
+
+
+class ConsulConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.prefix = str(uuid.uuid4())
+        self.base_url = 'http://{}/v1/kv/{}'.format(
+            os.environ['CONSUL_HTTP_ADDR'], self.prefix)
+        self.put('Application/key', 'value')
+        self.put('Application/wake_interval', '30')
+        self.put('Logging/loggers/test/level', 'DEBUG')
+        self.addCleanup(requests.delete, self.base_url,
+                        params={'recurse': 'true'})
+
+    def put(self, key, value):
+        requests.put('{}/{}'.format(self.base_url, key),
+                     data=value).raise_for_status()
+
+    def test_loaded_prefix(self):
+        cfg = config.Config('consul:///{}/'.format(self.prefix))
+        self.assertEqual(cfg.application['key'], 'value')
+        self.assertEqual(cfg.application['wake_interval'], 30)
+        self.assertEqual(cfg.logging['loggers'], {'test': {'level': 'DEBUG'}})
+
+    def test_loaded_key(self):
+        self.put('config.yml', 'Application:\n  key: document\n')
+        cfg = config.Config('consul:///{}/config.yml'.format(self.prefix))
+        self.assertEqual(cfg.application['key'], 'document')
+
+    def test_reload(self):
+        cfg = config.Config('consul:///{}/'.format(self.prefix))
+        self.assertFalse(cfg.reload())
+        self.put('Application/key', 'changed')
+        self.assertEqual(cfg.reload().changed, {'Application:key'})
+        self.assertEqual(cfg.application['key'], 'changed')
+
+    def test_watcher(self):
+        cfg = config.Config('consul:///{}/'.format(self.prefix))
+        changed = threading.Event()
+        consul_watcher = watcher.ConsulWatcher(
+            cfg.file_path, changed.set, cfg.version, wait=5)
+        consul_watcher.start()
+        self.addCleanup(consul_watcher.stop)
+        self.put('Application/key', 'changed')
+        self.assertTrue(changed.wait(10))
+
+    def test_value_error_raised_for_missing_key(self):
+        with self.assertRaises(ValueError):
+            config.Config('consul:///{}/missing.yml'.format(self.prefix))
+
+
+class ConfigSectionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config = config.Config()
+
+    def test_sections_are_cached(self):
+        self.assertIs(self.config.application, self.config.application)
+        self.assertIs(self.config.logging, self.config.logging)
+
+    def test_sections_are_read_only(self):
+        with self.assertRaises(TypeError):
+            self.config.application['wake_interval'] = 1
+        with self.assertRaises(TypeError):
+            self.config.logging['handlers']['console']['level'] = 'DEBUG'
+        with self.assertRaises(TypeError):
+            self.config.logging['root']['handlers'].append('console')
+
+    def test_copies_are_mutable(self):
+        value = copy.deepcopy(self.config.logging)
+        value['handlers']['console']['level'] = 'DEBUG'
+        value['root']['handlers'].append('console')
+        self.assertNotIn('level', self.config.logging['handlers']['console'])
+
+    def test_to_dict_returns_mutable_copy(self):
+        value = self.config.logging.to_dict()
+        self.assertEqual(value, self.config.logging)
+        self.assertIs(type(value['root']['handlers']), list)
+        value['handlers']['console']['level'] = 'DEBUG'
+        value['root']['handlers'].append('console')
+        self.assertNotIn('level', self.config.logging['handlers']['console'])
+
+    def test_sections_can_be_serialized(self):
+        self.assertEqual(json.loads(json.dumps(self.config.logging)),
+                         self.config.logging)
+        self.assertEqual(yaml.safe_load(yaml.safe_dump(self.config.logging)),
+                         self.config.logging)
+        self.assertEqual(yaml.safe_load(yaml.dump(self.config.logging)),
+                         self.config.logging)
+
+    def test_sections_can_configure_logging(self):
+        logging.config.dictConfig(self.config.logging)
+        config.LoggingConfig(self.config.logging, False)
+
+
+class ConfigReloadTests(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.yml')
+        os.close(handle)
+        self.addCleanup(os.unlink, self.path)
+        self.write({'wake_interval': 5})
+        self.config = config.Config(self.path)
+
+    def write(self, application):
+        with open(self.path, 'w') as handle:
+            yaml.safe_dump({'Application': application}, handle)
+
+    def test_reload_without_change(self):
+        application = self.config.application
+        self.assertFalse(self.config.reload())
+        self.assertIs(self.config.application, application)
+
+    def test_reload_returns_changes(self):
+        self.write({'wake_interval': 10, 'pool': {'size': 2}})
+        changes = self.config.reload()
+        self.assertEqual(changes.added, {'Application:pool:size'})
+        self.assertEqual(changes.changed, {'Application:wake_interval'})
+        self.assertEqual(changes.removed, set())
+        self.assertEqual(changes.sections, {'Application'})
+        self.assertTrue(changes.affects('Application:pool'))
+        self.assertFalse(changes.affects('Application:po'))
+        self.assertFalse(changes.affects('Logging'))
+
+    def test_reload_swaps_sections(self):
+        application = self.config.application
+        self.write({'wake_interval': 10})
+        self.assertTrue(self.config.reload())
+        self.assertEqual(self.config.application['wake_interval'], 10)
+        self.assertEqual(application['wake_interval'], 5)
+
+    def test_reload_skips_parse_when_unchanged(self):
+        os.utime(self.path, (0, 0))
+        self.config.reload()
+        with mock.patch.object(self.config, '_load_yaml_config') as load:
+            with mock.patch.object(self.config, '_content_changed') as hash:
+                self.assertFalse(self.config.reload())
+                hash.assert_not_called()
+            load.assert_not_called()
+
+    def test_reload_skips_parse_when_content_unchanged(self):
+        self.write({'wake_interval': 5})
+        with mock.patch.object(self.config, '_load_yaml_config') as load:
+            self.assertFalse(self.config.reload())
+            load.assert_not_called()
+
+    def test_reload_parses_again_after_error(self):
+        with open(self.path, 'w') as handle:
+            handle.write('Application: [')
+        with self.assertRaises(ValueError):
+            self.config.reload()
+        with self.assertRaises(ValueError):
+            self.config.reload()
+
+
+class CompiledConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'config.yml')
+        self.write('Application:\n  key: 1\n')
+        patcher = mock.patch.dict(os.environ, {
+            'HELPER_CONFIG_CACHE': os.path.join(self.directory, 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, content):
+        with open(self.path, 'w') as handle:
+            handle.write(content)
+
+    def compiled(self):
+        cache_directory = os.path.join(self.directory, 'cache')
+        if not os.path.isdir(cache_directory):
+            return []
+        return [name for name in os.listdir(cache_directory)
+                if name.endswith('.marshal')]
+
+    def test_yaml_loader(self):
+        if hasattr(yaml, 'CSafeLoader'):
+            self.assertIs(config.YAML_LOADER, yaml.CSafeLoader)
+
+    def test_unchanged_file_is_not_parsed(self):
+        config.Config(self.path)
+        with mock.patch.object(config.Config, '_load_yaml_config') as load:
+            cfg = config.Config(self.path)
+            load.assert_not_called()
+        self.assertEqual(cfg.application['key'], 1)
+
+    def test_changed_file_is_parsed(self):
+        config.Config(self.path)
+        self.write('Application:\n  key: 2\n')
+        self.assertEqual(config.Config(self.path).application['key'], 2)
+        self.assertEqual(len(self.compiled()), 1)
+
+    def test_unmarshallable_values_are_not_cached(self):
+        self.write('Application:\n  key: 2020-01-01\n')
+        config.Config(self.path)
+        self.assertEqual(self.compiled(), [])
+
+
+class SnapshotTests(unittest.TestCase):
+
+    SCHEMA = {'wake_interval': 60,
+              'name': str,
+              'enabled': False,
+              'hosts': ['localhost'],
+              'options': {},
+              'database': {'host': 'localhost', 'port': 5432}}
+
+    def setUp(self):
+        self.snapshot_type = config.snapshot_type('Settings', self.SCHEMA)
+
+    def test_defaults(self):
+        snapshot = self.snapshot_type()
+        self.assertEqual(snapshot.wake_interval, 60)
+        self.assertIsNone(snapshot.name)
+        self.assertFalse(snapshot.enabled)
+        self.assertEqual(snapshot.hosts, ('localhost',))
+        self.assertEqual(snapshot.database.host, 'localhost')
+        self.assertEqual(snapshot.database.port, 5432)
+
+    def test_values_are_coerced(self):
+        snapshot = self.snapshot_type({
+            'wake_interval': '30', 'enabled': 'true', 'name': 'test',
+            'options': {'key': [1]}, 'database': {'port': '6543'}})
+        self.assertEqual(snapshot.wake_interval, 30)
+        self.assertIs(snapshot.enabled, True)
+        self.assertEqual(snapshot.database.port, 6543)
+        self.assertEqual(snapshot.options, {'key': [1]})
+
+    def test_invalid_value(self):
+        with self.assertRaises(ValueError):
+            self.snapshot_type({'wake_interval': 'soon'})
+        with self.assertRaises(ValueError):
+            self.snapshot_type({'database': 'localhost'})
+
+    def test_invalid_field_name(self):
+        with self.assertRaises(ValueError):
+            config.snapshot_type('Settings', {'wake-interval': 1})
+
+    def test_snapshot_is_read_only(self):
+        snapshot = self.snapshot_type()
+        with self.assertRaises(AttributeError):
+            snapshot.wake_interval = 1
+        with self.assertRaises(AttributeError):
+            snapshot.undeclared = 1
+        with self.assertRaises(TypeError):
+            self.snapshot_type({'options': {'a': 1}}).options['a'] = 2
+
+    def test_as_dict(self):
+        self.assertEqual(self.snapshot_type().as_dict(), {
+            'wake_interval': 60, 'name': None, 'enabled': False,
+            'hosts': ['localhost'], 'options': {},
+            'database': {'host': 'localhost', 'port': 5432}})
+
+    def test_config_snapshot_is_swapped_on_reload(self):
+        handle, file_path = tempfile.mkstemp(suffix='.yml')
+        os.close(handle)
+        self.addCleanup(os.unlink, file_path)
+        with open(file_path, 'w') as handle:
+            handle.write('Application:\n  wake_interval: 5\n')
+        cfg = config.Config(file_path, self.SCHEMA)
+        snapshot = cfg.snapshot
+        with open(file_path, 'w') as handle:
+            handle.write('Application:\n  wake_interval: 10\n')
+        cfg.reload()
+        self.assertEqual(snapshot.wake_interval, 5)
+        self.assertEqual(cfg.snapshot.wake_interval, 10)
+        with open(file_path, 'w') as handle:
+            handle.write('Application:\n  wake_interval: soon\n')
+        with self.assertRaises(ValueError):
+            cfg.reload()
+        self.assertEqual(cfg.snapshot.wake_interval, 10)
+        self.assertEqual(cfg.application['wake_interval'], 10)
+
+
+class RemoteConfigChangeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.url = 'https://example.com/config.yml'
+        self.cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_directory)
+        patcher = mock.patch.dict(
+            os.environ, {'HELPER_CONFIG_CACHE': self.cache_directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('requests.Session.get')
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get.return_value = mock.Mock(
+            ok=True, status_code=200, text='Application: {key: 1}\n',
+            headers={'ETag': '"abc"'})
+        self.config = config.Config(self.url)
+
+    def test_reload_sends_etag(self):
+        self.get.return_value = mock.Mock(ok=False, status_code=304)
+        self.assertFalse(self.config.reload())
+        self.get.assert_called_with(
+            self.url, headers={'If-None-Match': '"abc"'},
+            timeout=config.Config.HTTP_TIMEOUT)
+
+    def test_session_is_reused(self):
+        session = self.config._http_session()
+        self.config.reload()
+        self.assertIs(self.config._http_session(), session)
+
+    def test_reload_keeps_configuration_when_unavailable(self):
+        self.get.side_effect = requests.ConnectionError('down')
+        self.assertFalse(self.config.reload())
+        self.assertEqual(self.config.application['key'], 1)
+
+    def test_startup_uses_cache_when_unavailable(self):
+        self.get.side_effect = requests.ConnectionError('down')
+        self.assertEqual(config.Config(self.url).application['key'], 1)
+
+    def test_startup_uses_cache_when_not_modified(self):
+        self.get.return_value = mock.Mock(ok=False, status_code=304)
+        self.assertEqual(config.Config(self.url).application['key'], 1)
+        self.get.assert_called_with(
+            self.url, headers={'If-None-Match': '"abc"'},
+            timeout=config.Config.HTTP_TIMEOUT)
+
+    def test_startup_without_cache_raises_when_unavailable(self):
+        self.get.side_effect = requests.ConnectionError('down')
+        with self.assertRaises(ValueError):
+            config.Config('https://example.com/other.yml')
+
+
+class LayeredConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = self.write('config.yml', 'Application:\n'
+                                             '  key: 1\n'
+                                             '  nested: {a: 1, b: 2}\n')
+        self.include = path = os.path.join(self.directory, 'conf.d')
+        os.mkdir(path)
+
+    def write(self, name, content):
+        file_path = os.path.join(self.directory, name)
+        with open(file_path, 'w') as handle:
+            handle.write(content)
+        return file_path
+
+    def test_included_directory_overrides_in_name_order(self):
+        self.write('conf.d/20-b.yml', 'Application: {key: 3}')
+        self.write('conf.d/10-a.json', '{"Application": {"key": 2}}')
+        self.write('conf.d/README', 'Application: {key: 4}')
+        cfg = config.Config(self.path, includes=[self.include])
+        self.assertEqual(cfg.application['key'], 3)
+        self.assertEqual(cfg.file_paths, [
+            self.path, os.path.join(self.include, '10-a.json'),
+            os.path.join(self.include, '20-b.yml')])
+
+    def test_included_file_is_merged_deeply(self):
+        file_path = self.write('override.yml', 'Application:\n'
+                                               '  nested: {b: 3}\n')
+        cfg = config.Config(self.path, includes=[file_path])
+        self.assertEqual(dict(cfg.application['nested']), {'a': 1, 'b': 3})
+
+    def test_included_file_uses_the_source_settings(self):
+        file_path = self.write('override.yml', 'Application: {key: 2}')
+        with mock.patch.dict(os.environ, {
+                'HELPER_CONFIG_CACHE': self.directory,
+                'HELPER_HTTP_RETRIES': '5'}):
+            cfg = config.Config(self.path, includes=[file_path])
+        fragment = cfg._fragments[0]
+        self.assertEqual(fragment.file_path, file_path)
+        self.assertEqual(fragment.cache_directory, self.directory)
+        self.assertEqual(fragment.http_retries, 5)
+        self.assertEqual(fragment.http_timeout, cfg.http_timeout)
+
+    def test_missing_include_raises(self):
+        with self.assertRaises(ValueError):
+            config.Config(self.path, includes=[
+                os.path.join(self.directory, 'missing.yml')])
+
+    def test_environment_overrides_files(self):
+        self.write('conf.d/10.yml', 'Application: {key: 2}')
+        with mock.patch.dict(os.environ, {
+                'TESTAPP__application__key': '5',
+                'TESTAPP__Application__nested__a': 'true',
+                'OTHER__Application__key': '6'}):
+            cfg = config.Config(self.path, includes=[self.include],
+                                env_prefix='TESTAPP')
+        self.assertEqual(cfg.application['key'], 5)
+        self.assertIs(cfg.application['nested']['a'], True)
+
+    def test_overrides_take_precedence(self):
+        with mock.patch.dict(os.environ, {'TESTAPP__Application__key': '5'}):
+            cfg = config.Config(
+                self.path, env_prefix='TESTAPP',
+                overrides=['Application:key=7', 'Daemon:user=www'])
+        self.assertEqual(cfg.application['key'], 7)
+        self.assertEqual(cfg.daemon['user'], 'www')
+
+    def test_invalid_override_raises(self):
+        with self.assertRaises(ValueError):
+            config.Config(self.path, overrides=['Application:key'])
+
+    def test_reload_merges_changed_include(self):
+        file_path = self.write('conf.d/10.yml', 'Application: {key: 2}')
+        cfg = config.Config(self.path, includes=[self.include],
+                            overrides=['Application:nested:b=9'])
+        self.write('conf.d/10.yml', 'Application: {key: 3}')
+        self.assertEqual(cfg.reload().changed, {'Application:key'})
+        self.assertEqual(cfg.application['key'], 3)
+        self.assertEqual(cfg.application['nested']['b'], 9)
+        os.unlink(file_path)
+        self.assertEqual(cfg.reload().changed, {'Application:key'})
+        self.assertEqual(cfg.application['key'], 1)
+
+    def test_reload_only_parses_changed_files(self):
+        self.write('conf.d/10.yml', 'Application: {key: 2}')
+        cfg = config.Config(self.path, includes=[self.include])
+        for source in [cfg] + cfg._fragments:
+            source._stat = None
+            source._checksum = None
+        self.write('conf.d/20.yml', 'Application: {key: 3}')
+        with mock.patch.object(config.Config, '_load_yaml_config',
+                               wraps=config.Config._load_yaml_config) as load:
+            self.assertTrue(cfg.reload())
+        self.assertEqual(load.call_count, 3)
+        with mock.patch.object(config.Config, '_load_yaml_config') as load:
+            for source in [cfg] + cfg._fragments:
+                source._stat = None
+            self.assertFalse(cfg.reload())
+        load.assert_not_called()
+
+    @unittest.skipIf(config.futures is None or
+                     not hasattr(threading, 'Barrier'),
+                     'concurrent.futures or threading.Barrier is not '
+                     'available')
+    def test_remote_includes_load_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def get(url, **_kwargs):
+            barrier.wait()
+            return mock.Mock(
+                ok=True, status_code=200, headers={},
+                text='Application: {{{}: 1}}'.format(url.rsplit('/', 1)[1]))
+
+        with mock.patch('requests.Session.get', side_effect=get):
+            cfg = config.Config(self.path, includes=[
+                'https://example.com/a', 'https://example.com/b'])
+        self.assertEqual(cfg.application['a'], 1)
+        self.assertEqual(cfg.application['b'], 1)
+
+
+class LoggingQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.configuration = copy.deepcopy(config.LOGGING)
+        self.configuration['loggers'] = {
+            'helper.tests': {'handlers': ['console'], 'level': 'INFO'}}
+        self.configuration['queue'] = {'size': 100, 'policy': 'block'}
+
+    def test_queue_replaces_handlers(self):
+        logging_config = config.LoggingConfig(self.configuration)
+        self.addCleanup(logging_config.stop)
+        self.assertEqual(logging_config.pipeline.size, 100)
+        self.assertEqual(logging_config.pipeline.policy, 'block')
+        logger = logging.getLogger('helper.tests')
+        self.assertIsInstance(logger.handlers[0], handlers.QueueHandler)
+        logging_config.stop()
+        self.assertIsInstance(logger.handlers[0], logging.StreamHandler)
+        self.assertIsNone(logging_config.pipeline)
+
+    def test_queue_enabled_with_defaults(self):
+        self.configuration['queue'] = True
+        logging_config = config.LoggingConfig(self.configuration)
+        self.addCleanup(logging_config.stop)
+        self.assertEqual(logging_config.pipeline.size, handlers.QUEUE_SIZE)
+        self.assertEqual(logging_config.pipeline.policy, handlers.POLICY_DROP)
+
+    def test_queue_disabled_by_default(self):
+        del self.configuration['queue']
+        logging_config = config.LoggingConfig(self.configuration)
+        self.assertIsNone(logging_config.pipeline)
+
+    def test_reconfigure_stops_previous_queue(self):
+        logging_config = config.LoggingConfig(self.configuration)
+        self.addCleanup(logging_config.stop)
+        pipeline = logging_config.pipeline
+        self.configuration['queue']['size'] = 10
+        self.assertTrue(logging_config.update(self.configuration))
+        self.assertFalse(pipeline.is_running)
+        self.assertEqual(logging_config.pipeline.size, 10)
+
+
+class LoggingUpdateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.configuration = copy.deepcopy(config.LOGGING)
+        self.configuration['formatters']['plain'] = {'format': '%(message)s'}
+        self.configuration['loggers'] = {
+            'helper.tests.update': {'handlers': ['console'],
+                                    'level': 'INFO'},
+            'helper.tests.removed': {'handlers': ['console'],
+                                     'level': 'ERROR'}}
+        self.logging_config = config.LoggingConfig(self.configuration)
+        self.logger = logging.getLogger('helper.tests.update')
+        self.handler = self.logger.handlers[0]
+
+    def update(self):
+        with mock.patch('logging.config.dictConfigClass',
+                        wraps=logging.config.DictConfigurator) as dict_config:
+            self.assertTrue(self.logging_config.update(self.configuration))
+        dict_config.assert_not_called()
+
+    def test_unchanged_configuration_is_not_applied(self):
+        with mock.patch.object(self.logging_config, 'configure') as configure:
+            self.assertFalse(self.logging_config.update(
+                copy.deepcopy(self.configuration)))
+        configure.assert_not_called()
+
+    def test_debug_change_is_applied(self):
+        with mock.patch.object(self.logging_config, 'configure') as configure:
+            self.assertTrue(self.logging_config.update(
+                self.configuration, False))
+        configure.assert_called_once_with(mock.ANY)
+
+    def test_logger_level_change_keeps_handler(self):
+        self.configuration['loggers']['helper.tests.update']['level'] = 'DEBUG'
+        self.update()
+        self.assertEqual(self.logger.level, logging.DEBUG)
+        self.assertIs(self.logger.handlers[0], self.handler)
+
+    def test_handler_options_are_updated_in_place(self):
+        self.configuration['handlers']['console'].update(
+            {'formatter': 'plain', 'level': 'WARNING'})
+        self.update()
+        self.assertIs(self.logger.handlers[0], self.handler)
+        self.assertEqual(self.handler.level, logging.WARNING)
+        self.assertEqual(self.handler.formatter._fmt, '%(message)s')
+
+    def test_changed_handler_is_replaced_and_closed(self):
+        self.configuration['handlers']['console']['stream'] = \
+            'ext://sys.stdout'
+        with mock.patch.object(self.handler, 'close') as close:
+            self.update()
+        close.assert_called_once_with()
+        self.assertIsNot(self.logger.handlers[0], self.handler)
+        self.assertEqual(self.logger.handlers[0].name, 'console')
+
+    def test_removed_logger_is_reset(self):
+        del self.configuration['loggers']['helper.tests.removed']
+        self.update()
+        logger = logging.getLogger('helper.tests.removed')
+        self.assertEqual(logger.handlers, [])
+        self.assertEqual(logger.level, logging.NOTSET)
+        self.assertTrue(logger.disabled)
+
+    def test_removed_logger_is_enabled_when_not_disabling(self):
+        del self.configuration['loggers']['helper.tests.removed']
+        self.configuration['disable_existing_loggers'] = False
+        self.update()
+        self.assertFalse(logging.getLogger('helper.tests.removed').disabled)
+
+    def test_removed_child_of_configured_logger_is_enabled(self):
+        self.configuration['loggers']['helper.tests.update.child'] = {
+            'level': 'ERROR'}
+        self.update()
+        del self.configuration['loggers']['helper.tests.update.child']
+        self.update()
+        logger = logging.getLogger('helper.tests.update.child')
+        self.assertFalse(logger.disabled)
+        self.assertTrue(logger.propagate)
+
+    def test_configured_logger_is_enabled(self):
+        self.logger.disabled = True
+        self.configuration['loggers']['helper.tests.update']['level'] = 'DEBUG'
+        self.update()
+        self.assertFalse(self.logger.disabled)
+
+    def test_incremental_configuration_uses_dict_config(self):
+        self.configuration['incremental'] = True
+        with mock.patch('logging.config.dictConfigClass',
+                        wraps=logging.config.DictConfigurator) as dict_config:
+            self.logging_config.update(self.configuration)
+        dict_config.assert_called_once_with(mock.ANY)
+
+    def test_queue_keeps_handler(self):
+        self.configuration['queue'] = True
+        self.update()
+        self.addCleanup(self.logging_config.stop)
+        self.configuration['loggers']['helper.tests.update']['level'] = 'DEBUG'
+        self.update()
+        self.assertIsInstance(self.logger.handlers[0], handlers.QueueHandler)
+        self.assertEqual(self.logger.handlers[0].handlers, (self.handler,))
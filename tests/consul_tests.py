@@ -0,0 +1,117 @@
+import base64
+import json
+import os
+import threading
+import unittest
+
+import mock
+
+from helper import consul, watcher
+
+
+def entry(key, value):
+    return {'Key': key,
+            'Value': base64.b64encode(value.encode('utf-8')).decode('ascii')}
+
+
+class KVTests(unittest.TestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.session.get.return_value = mock.Mock(
+            ok=True, status_code=200, headers={'X-Consul-Index': '7'})
+
+    def test_api_url(self):
+        kv = consul.KV('consul://consul.local:8500/app/config', self.session)
+        self.assertEqual(kv.api_url,
+                         'http://consul.local:8500/v1/kv/app/config')
+        self.assertFalse(kv.is_prefix)
+
+    def test_api_url_from_environment(self):
+        with mock.patch.dict(os.environ, {'CONSUL_HTTP_ADDR': 'other:1234',
+                                          'CONSUL_HTTP_SSL': 'true'}):
+            kv = consul.KV('consul:///app/', self.session)
+        self.assertEqual(kv.api_url, 'https://other:1234/v1/kv/app/')
+        self.assertTrue(kv.is_prefix)
+
+    def test_get_key(self):
+        self.session.get.return_value.text = 'Application: {key: 1}'
+        kv = consul.KV('consul://localhost/app/config', self.session)
+        self.assertEqual(kv.get(), ('Application: {key: 1}', 7))
+        self.assertEqual(self.session.get.call_args[1]['params'],
+                         {'raw': 'true'})
+
+    def test_get_prefix(self):
+        self.session.get.return_value.json.return_value = [
+            entry('app/', ''),
+            entry('app/Application/wake_interval', '30'),
+            entry('app/Application/name', 'test'),
+            entry('app/Logging/loggers/app/level', 'DEBUG')]
+        content, index = consul.KV(
+            'consul://localhost/app/', self.session).get()
+        self.assertEqual(json.loads(content), {
+            'Application': {'wake_interval': 30, 'name': 'test'},
+            'Logging': {'loggers': {'app': {'level': 'DEBUG'}}}})
+        self.assertEqual(index, 7)
+
+    def test_get_missing_prefix(self):
+        self.session.get.return_value = mock.Mock(
+            ok=False, status_code=404, headers={'X-Consul-Index': '3'})
+        kv = consul.KV('consul://localhost/app/', self.session)
+        self.assertEqual(kv.get(), ('{}', 3))
+
+    def test_get_missing_key(self):
+        self.session.get.return_value = mock.Mock(
+            ok=False, status_code=404, headers={})
+        with self.assertRaises(ValueError):
+            consul.KV('consul://localhost/app/config', self.session).get()
+
+    def test_blocking_query(self):
+        self.session.get.return_value.text = ''
+        consul.KV('consul://localhost/app/config', self.session).get(5, 60)
+        kwargs = self.session.get.call_args[1]
+        self.assertEqual(kwargs['params'],
+                         {'raw': 'true', 'index': 5, 'wait': '60s'})
+        self.assertGreater(kwargs['timeout'], 60)
+
+
+class ConsulWatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.changed = threading.Event()
+        self.watcher = watcher.ConsulWatcher(
+            'consul://localhost/app/', self.changed.set, index=5)
+        self.indexes = [5, 5, 6]
+        self.watcher.kv = mock.Mock()
+        self.watcher.kv.get.side_effect = self.get
+        self.addCleanup(self.watcher.stop)
+
+    def get(self, index, wait):
+        if not self.indexes:
+            self.watcher._stop.wait(5)
+            return '{}', index
+        return '{}', self.indexes.pop(0)
+
+    def test_callback_invoked_when_index_changes(self):
+        self.watcher.start()
+        self.assertTrue(self.changed.wait(5))
+        self.assertEqual(self.watcher.index, 6)
+        self.assertEqual(self.watcher.kv.get.call_args_list[:3], [
+            mock.call(5, 300), mock.call(5, 300), mock.call(5, 300)])
+
+    def test_errors_are_retried(self):
+        self.indexes = [ValueError('test'), 6]
+        self.watcher.RETRY_DELAY = 0.01
+
+        def get(index, wait):
+            if not self.indexes:
+                self.watcher._stop.wait(5)
+                return '{}', index
+            value = self.indexes.pop(0)
+            if isinstance(value, Exception):
+                raise value
+            return '{}', value
+
+        self.watcher.kv.get.side_effect = get
+        self.watcher.start()
+        self.assertTrue(self.changed.wait(5))
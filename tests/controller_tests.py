@@ -0,0 +1,807 @@
+import argparse
+import functools
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+
+import mock
+import yaml
+
+from helper import controller, parser
+
+
+class ControllerTestCase(unittest.TestCase):
+
+    APPLICATION = {}
+
+    def setUp(self):
+        self.controller = controller.Controller(
+            argparse.Namespace(config=None, foreground=True), 'test')
+        self.update_application(self.APPLICATION)
+
+    def update_application(self, values):
+        config = self.controller.config
+        config._values['Application'].update(values)
+        config._set_values(config._values)
+
+
+class LoopTestCase(unittest.TestCase):
+
+    APPLICATION = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        path = os.path.join(self.directory, 'config.yml')
+        with open(path, 'w') as handle:
+            yaml.safe_dump({'Application': self.APPLICATION}, handle)
+        self.controller = controller.Controller(
+            argparse.Namespace(config=path, foreground=True), 'test')
+        self.controller.process = self.process
+        self.calls = []
+
+    def process(self):
+        self.record(3)
+
+    def record(self, count):
+        self.calls.append(time.time())
+        if len(self.calls) == count:
+            self.controller._on_signal(signal.SIGTERM, None)
+
+    def run_controller(self):
+        timeout = threading.Timer(5, self.controller._on_signal,
+                                  (signal.SIGTERM, None))
+        timeout.start()
+        self.addCleanup(timeout.cancel)
+        self.controller.run()
+        self.assertTrue(self.controller.is_stopped)
+
+    def intervals(self):
+        return [after - before
+                for before, after in zip(self.calls, self.calls[1:])]
+
+
+class FixedRateLoopTests(LoopTestCase):
+
+    APPLICATION = {'fixed_rate': True, 'wake_interval': 0.05}
+
+    def process(self):
+        time.sleep(0.02)
+        self.record(4)
+        return self.controller.PROCESS_BACKLOG
+
+    def test_process_is_invoked_at_fixed_rate(self):
+        self.run_controller()
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(self.controller.tick_counters['ticks'], 4)
+        for interval in self.intervals():
+            self.assertGreater(interval, 0.04)
+            self.assertLess(interval, 0.5)
+
+
+class FixedRateSkipTests(ControllerTestCase):
+
+    APPLICATION = {'fixed_rate': True, 'wake_interval': 10}
+
+    def test_fixed_rate(self):
+        self.assertTrue(self.controller.fixed_rate)
+
+    def test_default_overrun_policy(self):
+        self.assertEqual(self.controller.overrun_policy,
+                         controller.Controller.OVERRUN_SKIP)
+
+    def test_next_deadline_without_overrun(self):
+        self.assertEqual(self.controller._next_deadline(100, 105, 10), 110)
+
+    def test_next_deadline_skips_missed_ticks(self):
+        self.assertEqual(self.controller._next_deadline(100, 135, 10), 140)
+        self.assertEqual(self.controller.tick_counters['skipped'], 3)
+
+    def test_sleep_timeout_uses_deadline(self):
+        self.controller._deadline = 110
+        with mock.patch('helper.controller.monotonic', return_value=104):
+            self.assertEqual(self.controller._sleep_timeout(), 6)
+
+    def test_sleep_timeout_is_never_negative(self):
+        self.controller._deadline = 110
+        with mock.patch('helper.controller.monotonic', return_value=120):
+            self.assertEqual(self.controller._sleep_timeout(), 0)
+
+    def test_process_tick_records_lateness(self):
+        self.controller._deadline = 100
+        with mock.patch.object(self.controller, 'process') as process:
+            with mock.patch('helper.controller.monotonic',
+                            side_effect=[102.5, 104]):
+                self.controller._process_tick()
+        process.assert_called_once_with()
+        self.assertEqual(self.controller.tick_counters['ticks'], 1)
+        self.assertEqual(self.controller.tick_counters['lateness_last'], 2.5)
+        self.assertEqual(self.controller.tick_counters['lateness_max'], 2.5)
+        self.assertEqual(self.controller._deadline, 110)
+
+
+class FixedRateCatchUpTests(ControllerTestCase):
+
+    APPLICATION = {'fixed_rate': True, 'overrun_policy': 'catch_up'}
+
+    def test_next_deadline_runs_missed_ticks(self):
+        self.assertEqual(self.controller._next_deadline(100, 135, 10), 110)
+        self.assertEqual(self.controller.tick_counters['skipped'], 0)
+
+
+class FixedRateBackToBackTests(ControllerTestCase):
+
+    APPLICATION = {'fixed_rate': True, 'overrun_policy': 'back_to_back'}
+
+    def test_next_deadline_runs_immediately(self):
+        self.assertEqual(self.controller._next_deadline(100, 135, 10), 135)
+
+
+class FixedDelayTests(ControllerTestCase):
+
+    APPLICATION = {'wake_interval': 5}
+
+    def test_fixed_rate(self):
+        self.assertFalse(self.controller.fixed_rate)
+
+    def test_sleep_timeout_is_wake_interval(self):
+        with mock.patch('helper.controller.monotonic', return_value=100):
+            self.controller._apply_process_hint(None)
+            self.assertEqual(self.controller._sleep_timeout(), 5)
+
+    def test_invalid_overrun_policy_is_not_applied(self):
+        with self.assertRaises(ValueError):
+            self.update_application({'overrun_policy': 'bogus'})
+        self.assertEqual(self.controller.overrun_policy,
+                         controller.Controller.OVERRUN_SKIP)
+
+
+class ShutdownTests(ControllerTestCase):
+
+    APPLICATION = {'drain_timeout': 5}
+
+    def test_stop_when_not_active_does_not_wait(self):
+        self.controller.set_state(self.controller.STATE_SLEEPING)
+        with mock.patch.object(self.controller._state_changed,
+                               'wait') as wait:
+            self.controller.stop()
+        wait.assert_not_called()
+        self.assertTrue(self.controller.is_stopped)
+
+    def test_stop_waits_for_active_process(self):
+        started, finished = threading.Event(), threading.Event()
+
+        def process():
+            started.set()
+            time.sleep(0.1)
+            finished.set()
+
+        thread = threading.Thread(target=self._run_process, args=(process,))
+        thread.start()
+        started.wait(1)
+        self.controller.stop()
+        self.assertTrue(finished.is_set())
+        self.assertTrue(self.controller.is_stopped)
+        thread.join()
+
+    def test_stop_continues_after_drain_timeout(self):
+        self.update_application({'drain_timeout': 0.05})
+        self.controller._begin_work()
+        thread = threading.Thread(target=self.controller.stop)
+        thread.start()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(self.controller.is_stopped)
+
+    def test_stop_from_within_process_does_not_wait(self):
+        self.controller._begin_work()
+        with mock.patch.object(self.controller._state_changed,
+                               'wait') as wait:
+            self.controller._execute(self.controller.stop)
+        wait.assert_not_called()
+        self.assertTrue(self.controller.is_stopped)
+        self.assertEqual(self.controller.in_flight, 0)
+
+    def test_stop_waits_for_active_state_of_custom_run(self):
+        started, finished = threading.Event(), threading.Event()
+
+        def run():
+            self.controller.set_state(self.controller.STATE_ACTIVE)
+            started.set()
+            time.sleep(0.1)
+            finished.set()
+            self.controller.set_state(self.controller.STATE_IDLE)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        started.wait(1)
+        self.controller.stop()
+        self.assertTrue(finished.is_set())
+        self.assertTrue(self.controller.is_stopped)
+        thread.join()
+
+    def test_stop_from_within_custom_run_does_not_wait(self):
+        self.controller.set_state(self.controller.STATE_ACTIVE)
+        with mock.patch.object(self.controller._state_changed,
+                               'wait') as wait:
+            self.controller.stop()
+        wait.assert_not_called()
+        self.assertTrue(self.controller.is_stopped)
+
+    def test_overriding_sleep_unit_is_deprecated(self):
+
+        class Application(controller.Controller):
+            SLEEP_UNIT = 1
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            controller.Controller(
+                argparse.Namespace(config=None, foreground=True), 'test')
+            self.assertEqual(caught, [])
+            Application(
+                argparse.Namespace(config=None, foreground=True), 'test')
+        self.assertEqual([warning.category for warning in caught],
+                         [DeprecationWarning])
+        self.assertIn('SLEEP_UNIT', str(caught[0].message))
+
+    def _run_process(self, process):
+        self.controller._begin_work()
+        self.controller._execute(process)
+
+
+class StatsTests(ControllerTestCase):
+
+    def test_wait_for_signal_records_sleep_and_signals(self):
+        self.controller.pending_signals.put(10)
+        self.assertEqual(self.controller._wait_for_signal(1), 10)
+        self.assertIsNone(self.controller._wait_for_signal(0))
+        self.assertEqual(self.controller.stats.signals, 1)
+        self.assertEqual(self.controller.stats.sleep.count, 2)
+
+    def test_on_sigusr1_logs_stats(self):
+        with mock.patch('helper.controller.LOGGER') as logger:
+            self.controller.on_sigusr1()
+        self.assertEqual(logger.info.call_count, 3)
+
+
+class ProfilingTests(ControllerTestCase):
+
+    APPLICATION = {'profile_signal': 'prof'}
+
+    def setUp(self):
+        super(ProfilingTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.update_application({'profile_directory': self.directory})
+
+    def test_profile_signal(self):
+        self.assertEqual(self.controller.profile_signal, signal.SIGPROF)
+
+    def test_invalid_profile_signal_is_not_applied(self):
+        for value in ['SIGTERM', 'bogus']:
+            with self.assertRaises(ValueError):
+                self.update_application({'profile_signal': value})
+            self.assertEqual(self.controller.profile_signal, signal.SIGPROF)
+
+    def test_handled_signals_are_rejected(self):
+        for value in ['hup', 'SIGUSR1', signal.SIGUSR2]:
+            with self.assertRaises(ValueError):
+                self.update_application({'profile_signal': value})
+        self.assertEqual(self.controller.profile_signal, signal.SIGPROF)
+
+    def test_signal_after_invalid_reload(self):
+        with self.assertRaises(ValueError):
+            self.update_application({'profile_signal': 'bogus'})
+        with mock.patch.object(self.controller, 'on_sigusr1') as on_sigusr1:
+            self.controller.process_signal(signal.SIGUSR1)
+        on_sigusr1.assert_called_once_with()
+
+    def test_profile_signal_toggles_profiling(self):
+        self.controller.process_signal(signal.SIGPROF)
+        self.assertTrue(self.controller.is_profiling)
+        self.controller.process_signal(signal.SIGPROF)
+        self.assertFalse(self.controller.is_profiling)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_toggle_profiling_writes_profile(self):
+        self.assertIsNone(self.controller.toggle_profiling())
+        self.controller._profiler.enable()
+        sum(range(100))
+        self.controller._profiler.disable()
+        filename = self.controller.toggle_profiling()
+        self.assertEqual(os.path.dirname(filename), self.directory)
+        self.assertTrue(os.path.exists(filename))
+
+    def test_signals_includes_profile_signal(self):
+        self.assertIn(signal.SIGPROF, self.controller._signals())
+
+
+class ProcessHintTests(ControllerTestCase):
+
+    APPLICATION = {'wake_interval': 10, 'max_wake_interval': 50,
+                   'min_wake_interval': 0.5}
+
+    def delay_after(self, hint):
+        with mock.patch('helper.controller.monotonic', return_value=100):
+            self.controller._apply_process_hint(hint)
+        return self.controller._deadline - 100
+
+    def test_none_uses_wake_interval(self):
+        self.assertEqual(self.delay_after(None), 10)
+
+    def test_backlog_uses_min_wake_interval(self):
+        self.assertEqual(self.delay_after(self.controller.PROCESS_BACKLOG),
+                         0.5)
+
+    def test_explicit_delay(self):
+        self.assertEqual(self.delay_after(2.5), 2.5)
+
+    def test_idle_backs_off_exponentially(self):
+        self.assertEqual(
+            [self.delay_after(self.controller.PROCESS_IDLE)
+             for _iteration in range(5)], [10, 20, 40, 50, 50])
+
+    def test_backlog_resets_idle_backoff(self):
+        self.delay_after(self.controller.PROCESS_IDLE)
+        self.delay_after(self.controller.PROCESS_IDLE)
+        self.delay_after(self.controller.PROCESS_BACKLOG)
+        self.assertEqual(self.delay_after(self.controller.PROCESS_IDLE), 10)
+
+    def test_invalid_hint_is_ignored(self):
+        self.delay_after(2)
+        self.assertEqual(self.delay_after(True), 10)
+
+    def test_fixed_rate_none_keeps_deadline(self):
+        self.update_application({'fixed_rate': True})
+        self.controller._deadline = 110
+        self.assertEqual(self.delay_after(None), 10)
+        self.controller._deadline = 107
+        self.assertEqual(self.delay_after(None), 7)
+
+    def test_fixed_rate_ignores_hints(self):
+        self.update_application({'fixed_rate': True})
+        for hint in [3, self.controller.PROCESS_BACKLOG,
+                     self.controller.PROCESS_IDLE]:
+            self.controller._deadline = 110
+            self.assertEqual(self.delay_after(hint), 10)
+
+
+class TaskTests(ControllerTestCase):
+
+    APPLICATION = {'wake_interval': 60}
+
+    def test_add_task(self):
+        task = self.controller.add_task('test', mock.Mock(), interval=5)
+        self.assertIn('test', self.controller.tasks)
+        self.assertEqual(task.overrun_policy, self.controller.overrun_policy)
+
+    def test_remove_task(self):
+        self.controller.add_task('test', mock.Mock(), interval=5)
+        self.controller.remove_task('test')
+        self.assertNotIn('test', self.controller.tasks)
+        self.assertIsNone(self.controller.tasks.next_deadline())
+
+    def test_sleep_timeout_uses_next_task(self):
+        self.controller._deadline = 160
+        with mock.patch('helper.scheduler.monotonic', return_value=100):
+            self.controller.add_task('test', mock.Mock(), interval=5)
+        with mock.patch('helper.controller.monotonic', return_value=101):
+            self.assertEqual(self.controller._sleep_timeout(), 4)
+
+    def test_run_tasks_runs_due_tasks(self):
+        callback = mock.Mock(side_effect=[None, ValueError('test')])
+        with mock.patch('helper.scheduler.monotonic', return_value=100):
+            task = self.controller.add_task('test', callback, interval=5)
+        with mock.patch('helper.controller.monotonic',
+                        side_effect=[105, 105, 106, 111, 111, 112]):
+            self.controller._run_tasks()
+            self.controller._run_tasks()
+        self.assertEqual(callback.call_count, 2)
+        self.assertEqual(task.duration.count, 2)
+        self.assertEqual(task.failures, 1)
+        self.assertEqual(task.deadline, 115)
+
+
+class TaskLoopTests(LoopTestCase):
+
+    APPLICATION = {'wake_interval': 60}
+
+    def test_tasks_run_on_their_own_schedule(self):
+        process = mock.Mock()
+        self.controller.process = process
+        task = self.controller.add_task(
+            'test', functools.partial(self.record, 3), interval=0.05)
+        self.run_controller()
+        process.assert_not_called()
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(task.duration.count, 3)
+        for interval in self.intervals():
+            self.assertGreater(interval, 0.04)
+            self.assertLess(interval, 0.5)
+
+
+@unittest.skipIf(controller.futures is None,
+                 'concurrent.futures is not available')
+class ThreadPoolTests(ControllerTestCase):
+
+    APPLICATION = {'pool_size': 2, 'wake_interval': 0.01}
+
+    def setUp(self):
+        super(ThreadPoolTests, self).setUp()
+        self.release = threading.Event()
+        self.calls = []
+        self.controller.process = self.process
+        self.controller._start_executor()
+        self.addCleanup(self.controller._executor.shutdown)
+        self.addCleanup(self.release.set)
+        self.controller._deadline = 0
+
+    def process(self):
+        self.calls.append(threading.current_thread())
+        self.release.wait(5)
+        return 1
+
+    def test_pool_size(self):
+        self.assertEqual(self.controller.pool_size, 2)
+
+    def test_profiling_is_refused(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.update_application({'profile_directory': directory,
+                                 'profile_signal': 'prof'})
+        self.controller.process_signal(signal.SIGPROF)
+        self.assertFalse(self.controller.is_profiling)
+        self.assertIsNone(self.controller.toggle_profiling())
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_dispatch_is_bounded_by_pool_size(self):
+        for _iteration in range(3):
+            self.controller._dispatch_process()
+        self.assertEqual(self.controller.in_flight, 2)
+        self.assertEqual(self.controller.stats.saturated, 1)
+
+    def test_completed_process_is_recorded(self):
+        self.controller._dispatch_process()
+        self.release.set()
+        while self.controller.in_flight or not self.controller._completed:
+            time.sleep(0.001)
+        with mock.patch('helper.controller.monotonic', return_value=100):
+            self.controller._process_completed()
+        self.assertIsNot(self.calls[0], threading.current_thread())
+        self.assertEqual(self.controller.stats.process.count, 1)
+        self.assertEqual(self.controller._deadline, 101)
+
+    def test_stop_waits_for_all_in_flight(self):
+        self.controller._dispatch_process()
+        self.controller._dispatch_process()
+        threading.Timer(0.05, self.release.set).start()
+        self.controller.stop()
+        self.assertEqual(self.controller.in_flight, 0)
+        self.assertTrue(self.controller.is_stopped)
+
+    def test_dispatched_task_is_rescheduled(self):
+        callback = mock.Mock(side_effect=ValueError('test'))
+        with mock.patch('helper.scheduler.monotonic', return_value=100):
+            task = self.controller.add_task('test', callback, interval=5)
+        with mock.patch('helper.controller.monotonic', return_value=105):
+            self.controller._run_tasks()
+            while (self.controller.in_flight or
+                   not self.controller._completed):
+                time.sleep(0.001)
+            self.controller._process_completed()
+        self.assertEqual(task.failures, 1)
+        self.assertEqual(task.deadline, 110)
+
+
+@unittest.skipIf(controller.futures is None,
+                 'concurrent.futures is not available')
+class ThreadPoolLoopTests(LoopTestCase):
+
+    APPLICATION = {'pool_size': 2, 'wake_interval': 0.01}
+
+    def process(self):
+        self.threads.append(threading.current_thread())
+        self.record(3)
+
+    def test_process_is_dispatched_onto_pool(self):
+        self.threads = []
+        self.run_controller()
+        self.assertGreaterEqual(len(self.calls), 3)
+        self.assertNotIn(threading.current_thread(), self.threads)
+        self.assertEqual(self.controller.in_flight, 0)
+
+
+class WatchConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'config.yml')
+        self.write(5)
+        self.controller = controller.Controller(
+            argparse.Namespace(config=self.path, foreground=True), 'test')
+        self.controller.on_configuration_reloaded = mock.Mock()
+
+    def write(self, wake_interval):
+        with open(self.path, 'w') as handle:
+            handle.write('Application:\n  watch_config: true\n'
+                         '  watch_debounce: 0.01\n'
+                         '  wake_interval: {}\n'.format(wake_interval))
+
+    def test_watch_config(self):
+        self.assertTrue(self.controller.watch_config)
+        self.assertEqual(self.controller.watch_debounce, 0.01)
+
+    def test_change_reloads_configuration(self):
+        self.controller._start_watcher()
+        self.addCleanup(self.controller._stop_watcher)
+        self.write(10)
+        deadline = time.time() + 5
+        while not self.controller._reload_requested and time.time() < deadline:
+            self.controller._wait_for_signal(0.1)
+        self.assertTrue(self.controller._reload_requested)
+        changes = self.controller.reload_configuration()
+        self.assertEqual(changes.changed, {'Application:wake_interval'})
+        self.assertEqual(self.controller.wake_interval, 10)
+        self.controller.on_configuration_reloaded.assert_called_once_with(
+            changes)
+
+    def test_invalid_configuration_is_not_applied(self):
+        with open(self.path, 'w') as handle:
+            handle.write('Application: [')
+        self.assertFalse(self.controller.reload_configuration())
+        self.assertEqual(self.controller.wake_interval, 5)
+        self.controller.on_configuration_reloaded.assert_not_called()
+
+    def test_empty_configuration_is_not_applied(self):
+        with open(self.path, 'w') as handle:
+            handle.write('')
+        self.assertFalse(self.controller.reload_configuration())
+        self.assertEqual(self.controller.wake_interval, 5)
+        self.controller.on_configuration_reloaded.assert_not_called()
+
+    def test_list_configuration_is_not_applied(self):
+        with open(self.path, 'w') as handle:
+            handle.write('- a\n- b')
+        self.assertFalse(self.controller.reload_configuration())
+        self.assertEqual(self.controller.wake_interval, 5)
+        self.write(10)
+        self.assertTrue(self.controller.reload_configuration())
+        self.assertEqual(self.controller.wake_interval, 10)
+
+    def test_invalid_overrun_policy_keeps_configuration(self):
+        with open(self.path, 'w') as handle:
+            handle.write('Application:\n  fixed_rate: true\n'
+                         '  overrun_policy: bogus\n  wake_interval: 10\n')
+        self.assertFalse(self.controller.reload_configuration())
+        self.assertEqual(self.controller.wake_interval, 5)
+        self.assertEqual(self.controller.overrun_policy,
+                         controller.Controller.OVERRUN_SKIP)
+        self.controller.on_configuration_reloaded.assert_not_called()
+
+    def test_logging_is_only_reconfigured_when_changed(self):
+        self.write(10)
+        with mock.patch.object(self.controller.logging_config,
+                               'configure') as configure:
+            self.controller.reload_configuration()
+            configure.assert_not_called()
+            with open(self.path, 'a') as handle:
+                handle.write('Logging:\n  loggers:\n    test:\n'
+                             '      level: DEBUG\n')
+            self.controller.reload_configuration()
+            configure.assert_called_once_with(mock.ANY)
+
+    def test_logging_level_change_keeps_handlers(self):
+        with open(self.path, 'a') as handle:
+            handle.write('Logging:\n  loggers:\n    test:\n'
+                         '      handlers: [console]\n'
+                         '      level: INFO\n')
+        self.controller.reload_configuration()
+        handler = logging.getLogger('test').handlers[0]
+        with open(self.path, 'w') as handle:
+            handle.write('Application:\n  wake_interval: 5\n'
+                         'Logging:\n  loggers:\n    test:\n'
+                         '      handlers: [console]\n'
+                         '      level: DEBUG\n')
+        with mock.patch('logging.config.dictConfigClass',
+                        wraps=logging.config.DictConfigurator) as dict_config:
+            self.controller.reload_configuration()
+        dict_config.assert_not_called()
+        self.assertEqual(logging.getLogger('test').level, logging.DEBUG)
+        self.assertIs(logging.getLogger('test').handlers[0], handler)
+
+    def test_sighup_reopens_log_files(self):
+        log_path = os.path.join(self.directory, 'test.log')
+        with open(self.path, 'a') as handle:
+            handle.write('Logging:\n  handlers:\n    file:\n'
+                         '      class: helper.handlers.BufferedFileHandler\n'
+                         '      filename: {}\n'
+                         '  loggers:\n    test:\n'
+                         '      handlers: [file]\n'
+                         '      level: INFO\n'.format(log_path))
+        self.controller.reload_configuration()
+        self.addCleanup(logging.getLogger('test').handlers[0].close)
+        logging.getLogger('test').info('Before')
+        os.rename(log_path, log_path + '.1')
+        with mock.patch.object(self.controller,
+                               'reload_configuration') as reload_config:
+            self.controller.process_signal(signal.SIGHUP)
+        reload_config.assert_called_once_with()
+        logging.getLogger('test').error('After')
+        with open(log_path + '.1') as handle:
+            self.assertEqual(handle.read(), 'Before\n')
+        with open(log_path) as handle:
+            self.assertEqual(handle.read(), 'After\n')
+
+    def test_reload_installs_changed_profile_signal(self):
+        with mock.patch('signal.signal') as set_handler:
+            self.controller._installed_signals = self.controller._signals()
+            with open(self.path, 'a') as handle:
+                handle.write('  profile_signal: SIGPROF\n')
+            self.controller.reload_configuration()
+            set_handler.assert_called_once_with(
+                signal.SIGPROF, self.controller._on_signal)
+            set_handler.reset_mock()
+            self.write(5)
+            with open(self.path, 'a') as handle:
+                handle.write('  profile_signal: SIGALRM\n')
+            self.controller.reload_configuration()
+        self.assertEqual(set_handler.call_args_list,
+                         [mock.call(signal.SIGPROF, signal.SIG_DFL),
+                          mock.call(signal.SIGALRM,
+                                    self.controller._on_signal)])
+        self.assertEqual(self.controller.profile_signal, signal.SIGALRM)
+
+    def test_reload_before_start_installs_nothing(self):
+        with open(self.path, 'a') as handle:
+            handle.write('  profile_signal: SIGPROF\n')
+        with mock.patch('signal.signal') as set_handler:
+            self.controller.reload_configuration()
+        set_handler.assert_not_called()
+
+    def test_hook_without_argument(self):
+        calls = []
+
+        class Controller(controller.Controller):
+
+            def on_configuration_reloaded(self):
+                calls.append(True)
+
+        instance = Controller(
+            argparse.Namespace(config=self.path, foreground=True), 'test')
+        self.write(10)
+        self.assertTrue(instance.reload_configuration())
+        self.assertEqual(calls, [True])
+
+    def test_partial_hook_is_invoked_without_argument(self):
+        calls = []
+        self.controller.on_configuration_reloaded = functools.partial(
+            calls.append, True)
+        self.write(10)
+        self.assertTrue(self.controller.reload_configuration())
+        self.assertEqual(calls, [True])
+
+    def test_callable_object_hook_is_passed_changes(self):
+        calls = []
+
+        class Hook(object):
+
+            def __call__(self, changes):
+                calls.append(changes)
+
+        self.controller.on_configuration_reloaded = Hook()
+        self.write(10)
+        changes = self.controller.reload_configuration()
+        self.assertEqual(calls, [changes])
+
+    @unittest.skipIf(sys.version_info < (3, 0),
+                     'Keyword-only arguments require Python 3')
+    def test_keyword_only_hook_is_passed_changes(self):
+        calls = []
+        namespace = {'calls': calls}
+        exec('def hook(*, changes):\n    calls.append(changes)\n', namespace)
+        self.controller.on_configuration_reloaded = namespace['hook']
+        self.write(10)
+        changes = self.controller.reload_configuration()
+        self.assertEqual(calls, [changes])
+
+    def wait_for_reload_request(self, instance):
+        deadline = time.time() + 5
+        while not instance._reload_requested and time.time() < deadline:
+            instance._wait_for_signal(0.1)
+        return instance._reload_requested
+
+    def test_includes_are_watched(self):
+        conf_d = os.path.join(self.directory, 'conf.d')
+        os.mkdir(conf_d)
+        include = os.path.join(self.directory, 'local.yml')
+        with open(include, 'w') as handle:
+            handle.write('Application:\n  wake_interval: 7\n')
+        instance = controller.Controller(argparse.Namespace(
+            config=self.path, foreground=True, includes=[conf_d, include]),
+            'test')
+        instance._start_watcher()
+        self.addCleanup(instance._stop_watcher)
+        self.assertEqual(len(instance._watchers), 3)
+        with open(os.path.join(conf_d, '10-extra.yml'), 'w') as handle:
+            handle.write('Application:\n  wake_interval: 8\n')
+        self.assertTrue(self.wait_for_reload_request(instance))
+        instance.reload_configuration()
+        self.assertEqual(instance.wake_interval, 7)
+        instance._reload_requested = False
+        with open(include, 'w') as handle:
+            handle.write('Application:\n  wake_interval: 9\n')
+        self.assertTrue(self.wait_for_reload_request(instance))
+        instance.reload_configuration()
+        self.assertEqual(instance.wake_interval, 9)
+
+    def test_consul_configuration_is_watched(self):
+        with mock.patch.object(self.controller.config, '_file_path',
+                               'consul:///app/'), \
+                mock.patch.object(self.controller.config, '_etag', '12'), \
+                mock.patch('helper.watcher.ConsulWatcher') as consul_watcher:
+            self.controller._start_watcher()
+        consul_watcher.assert_called_once_with(
+            'consul:///app/', self.controller._request_reload, '12')
+        consul_watcher.return_value.start.assert_called_once_with()
+
+
+class SettingsTests(unittest.TestCase):
+
+    def test_settings_without_schema(self):
+        instance = controller.Controller(
+            argparse.Namespace(config=None, foreground=True), 'test')
+        self.assertIsNone(instance.settings)
+
+    def test_settings_from_schema(self):
+
+        class Controller(controller.Controller):
+            SCHEMA = {'wake_interval': 60, 'database': {'port': 5432}}
+
+        instance = Controller(
+            argparse.Namespace(config=None, foreground=True), 'test')
+        self.assertEqual(instance.settings.wake_interval, 60)
+        self.assertEqual(instance.settings.database.port, 5432)
+
+
+class LayeredConfigTests(unittest.TestCase):
+
+    def assert_reports_error(self, argv, message):
+        args = parser.get().parse_args(argv)
+        with mock.patch('sys.stderr') as stderr:
+            with self.assertRaises(SystemExit) as exit_error:
+                controller.Controller(args, 'test')
+        self.assertEqual(exit_error.exception.code, 1)
+        self.assertIn(message, ''.join(
+            call[0][0] for call in stderr.write.call_args_list))
+
+    def test_invalid_override_is_reported(self):
+        self.assert_reports_error(['--set', 'foo'],
+                                  "Invalid configuration override 'foo'")
+
+    def test_invalid_value_is_reported(self):
+        self.assert_reports_error(
+            ['--set', 'Application:overrun_policy=bogus'],
+            'Invalid overrun policy bogus')
+
+    def test_overrides_and_environment(self):
+
+        class Controller(controller.Controller):
+            ENV_PREFIX = 'TESTAPP'
+
+        args = parser.get().parse_args(
+            ['--set', 'Application:wake_interval=5', '--set',
+             'Application:name=test'])
+        with mock.patch.dict(os.environ, {'TESTAPP__Application__name': 'x',
+                                          'TESTAPP__Daemon__user': 'www'}):
+            instance = Controller(args, 'test')
+        self.assertEqual(instance.config.application['wake_interval'], 5)
+        self.assertEqual(instance.config.application['name'], 'test')
+        self.assertEqual(instance.config.daemon['user'], 'www')
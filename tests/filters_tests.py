@@ -0,0 +1,202 @@
+import copy
+import logging
+import time
+import unittest
+
+import mock
+
+from helper import config, filters
+
+
+def make_record(message='Failed to connect to %s', args=('db',),
+                name='helper.tests', level=logging.WARNING):
+    return logging.LogRecord(name, level, __file__, 10, message, args, None)
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_logger(test, log_filter):
+    logger = logging.getLogger('helper.tests.rate_limit')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = RecordingHandler()
+    logger.handlers = [handler]
+    logger.filters = [log_filter]
+    test.addCleanup(setattr, logger, 'handlers', [])
+    test.addCleanup(setattr, logger, 'filters', [])
+    return logger, handler
+
+
+class RateLimitFilterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        for patcher in [
+                mock.patch('helper.filters.monotonic',
+                           side_effect=lambda: self.now),
+                mock.patch.object(filters.RateLimitFilter, '_start_thread')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_limits_each_message_template(self):
+        log_filter = filters.RateLimitFilter(rate=2, period=60)
+        self.assertEqual(
+            [log_filter.filter(make_record(args=(host,)))
+             for host in ['a', 'b', 'c']], [True, True, False])
+        self.assertTrue(log_filter.filter(make_record('Other message')))
+
+    def test_limits_each_logger(self):
+        log_filter = filters.RateLimitFilter(rate=1, key=filters.KEY_LOGGER)
+        self.assertTrue(log_filter.filter(make_record('First')))
+        self.assertFalse(log_filter.filter(make_record('Second')))
+        self.assertTrue(log_filter.filter(make_record(name='other')))
+
+    def test_suppressed_count_is_reported_next_period(self):
+        log_filter = filters.RateLimitFilter(rate=1, period=60)
+        for _offset in range(4):
+            log_filter.filter(make_record())
+        self.now += 60
+        record = make_record()
+        self.assertTrue(log_filter.filter(record))
+        self.assertEqual(record.suppressed, 3)
+        self.assertEqual(record.getMessage(),
+                         'Failed to connect to db (3 similar messages '
+                         'suppressed)')
+        record = make_record()
+        self.assertFalse(log_filter.filter(record))
+
+    def test_suppressed_count_is_reported_when_burst_stops(self):
+        log_filter = filters.RateLimitFilter(rate=1, period=60)
+        logger, handler = make_logger(self, log_filter)
+        for offset in range(4):
+            logger.warning('Failed to connect to %s', offset)
+        self.assertTrue(log_filter._report())
+        self.assertEqual(len(handler.records), 1)
+        self.now += 60
+        self.assertFalse(log_filter._report())
+        self.assertEqual(handler.records[-1].suppressed, 3)
+        self.assertEqual(handler.records[-1].getMessage(),
+                         'Failed to connect to 3 (3 similar messages '
+                         'suppressed)')
+        logger.warning('Failed to connect to %s', 'db')
+        self.assertFalse(hasattr(handler.records[-1], 'suppressed'))
+        self.assertEqual(len(handler.records), 3)
+
+    def test_suppressed_count_is_reported_once(self):
+        log_filter = filters.RateLimitFilter(rate=1, period=60)
+        logger, handler = make_logger(self, log_filter)
+        for _offset in range(3):
+            logger.warning('Failed')
+        self.now += 60
+        logger.warning('Failed')
+        self.assertEqual(handler.records[-1].suppressed, 2)
+        self.assertFalse(log_filter._report())
+        self.assertEqual(len(handler.records), 2)
+
+    def test_level_is_not_limited(self):
+        log_filter = filters.RateLimitFilter(rate=0, level='error')
+        self.assertFalse(log_filter.filter(make_record()))
+        self.assertTrue(log_filter.filter(make_record(level=logging.ERROR)))
+
+    def test_name_is_honored(self):
+        log_filter = filters.RateLimitFilter(rate=5, name='other')
+        self.assertFalse(log_filter.filter(make_record()))
+
+    def test_keys_are_forgotten(self):
+        log_filter = filters.RateLimitFilter(rate=1, period=60, max_keys=2)
+        log_filter.filter(make_record('First'))
+        self.now += 60
+        log_filter.filter(make_record('Second'))
+        log_filter.filter(make_record('Third'))
+        self.assertEqual(len(log_filter._windows), 2)
+        self.assertNotIn(('helper.tests', 'First'), log_filter._windows)
+
+    def test_invalid_arguments_raise(self):
+        with self.assertRaises(ValueError):
+            filters.RateLimitFilter(key='thread')
+        with self.assertRaises(ValueError):
+            filters.RateLimitFilter(level='LOUD')
+
+
+class RateLimitReportTests(unittest.TestCase):
+
+    def test_summary_is_logged_by_background_thread(self):
+        log_filter = filters.RateLimitFilter(rate=1, period=0.05)
+        logger, handler = make_logger(self, log_filter)
+        for _offset in range(5):
+            logger.warning('Burst')
+        deadline = time.time() + 5
+        while len(handler.records) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([record.getMessage() for record in handler.records],
+                         ['Burst', 'Burst (4 similar messages suppressed)'])
+        while log_filter._thread is not None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(log_filter._thread)
+
+
+class SamplingFilterTests(unittest.TestCase):
+
+    def test_sampling(self):
+        log_filter = filters.SamplingFilter(rate=0.5)
+        log_filter._random = mock.Mock(side_effect=[0.1, 0.9])
+        record = make_record()
+        self.assertTrue(log_filter.filter(record))
+        self.assertEqual(record.sample_rate, 0.5)
+        self.assertFalse(log_filter.filter(make_record()))
+        self.assertEqual(log_filter.dropped, 1)
+
+    def test_level_is_not_sampled(self):
+        log_filter = filters.SamplingFilter(rate=0, level=logging.ERROR)
+        self.assertFalse(log_filter.filter(make_record()))
+        self.assertTrue(log_filter.filter(make_record(level=logging.ERROR)))
+
+    def test_invalid_rate_raises(self):
+        with self.assertRaises(ValueError):
+            filters.SamplingFilter(rate=2)
+
+
+class LoggingConfigFilterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.configuration = copy.deepcopy(config.LOGGING)
+        self.configuration['filters'] = {
+            'limit': {'()': 'helper.filters.RateLimitFilter', 'rate': 1}}
+        self.configuration['handlers']['debug'] = {
+            'class': 'logging.StreamHandler', 'debug_only': True}
+        self.configuration['loggers'] = {
+            'helper.tests.filters': {'handlers': ['console', 'debug'],
+                                     'filters': ['limit'],
+                                     'level': 'INFO'}}
+        self.logger = logging.getLogger('helper.tests.filters')
+
+    def test_filter_is_configured_with_debug_only_handlers(self):
+        config.LoggingConfig(self.configuration, False)
+        self.assertIsInstance(self.logger.filters[0],
+                              filters.RateLimitFilter)
+        self.assertEqual([handler.name for handler in self.logger.handlers],
+                         ['console'])
+
+    def test_filter_state_is_kept_on_reload(self):
+        logging_config = config.LoggingConfig(self.configuration, True)
+        log_filter = self.logger.filters[0]
+        self.configuration['loggers']['helper.tests.filters']['level'] = \
+            'DEBUG'
+        self.assertTrue(logging_config.update(self.configuration, False))
+        self.assertIs(self.logger.filters[0], log_filter)
+
+    def test_changed_filter_is_replaced(self):
+        logging_config = config.LoggingConfig(self.configuration)
+        log_filter = self.logger.filters[0]
+        self.configuration['filters']['limit']['rate'] = 5
+        logging_config.update(self.configuration)
+        self.assertIsNot(self.logger.filters[0], log_filter)
+        self.assertEqual(self.logger.filters[0].rate, 5)
@@ -0,0 +1,143 @@
+import copy
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+import mock
+
+from helper import config, formatters
+
+
+def make_record(message='Hello %s', args=('world',), **kwargs):
+    record = logging.LogRecord('helper.tests', logging.WARNING, __file__, 10,
+                               message, args, None, 'test_function')
+    record.created, record.msecs = 1500000000.25, 250.0
+    record.__dict__.update(kwargs)
+    return record
+
+
+class JSONFormatterTests(unittest.TestCase):
+
+    def test_default_fields(self):
+        formatter = formatters.JSONFormatter(encoder='json')
+        self.assertEqual(json.loads(formatter.format(make_record())), {
+            'timestamp': '2017-07-14T02:40:00.250Z',
+            'level': 'WARNING',
+            'logger': 'helper.tests',
+            'message': 'Hello world'})
+
+    def test_renamed_fields(self):
+        formatter = formatters.JSONFormatter(
+            {'msg': 'message', 'line': 'lineno'}, encoder='json')
+        self.assertEqual(json.loads(formatter.format(make_record())),
+                         {'msg': 'Hello world', 'line': 10})
+
+    def test_datefmt(self):
+        formatter = formatters.JSONFormatter(['timestamp'], datefmt='%Y')
+        self.assertEqual(json.loads(formatter.format(make_record())),
+                         {'timestamp': logging.Formatter().formatTime(
+                             make_record(), '%Y')})
+
+    def test_extra_attributes(self):
+        formatter = formatters.JSONFormatter(
+            ['message'], extra=True, encoder='json')
+        record = make_record(request_id='abc', value=object())
+        result = json.loads(formatter.format(record))
+        self.assertEqual(result['request_id'], 'abc')
+        self.assertTrue(result['value'].startswith('<object'))
+        self.assertNotIn('lineno', result)
+
+    def test_exception(self):
+        formatter = formatters.JSONFormatter(['message'], encoder='json')
+        try:
+            raise ValueError('failed')
+        except ValueError:
+            record = make_record(exc_info=sys.exc_info())
+        result = json.loads(formatter.format(record))
+        self.assertIn('ValueError: failed', result['exception'])
+
+    def test_missing_encoder_raises(self):
+        with mock.patch.dict(sys.modules, {'orjson': None}):
+            with self.assertRaises(ValueError):
+                formatters.JSONFormatter(encoder='orjson')
+
+    def test_falls_back_to_json(self):
+        with mock.patch.dict(sys.modules, {'orjson': None, 'ujson': None}):
+            formatter = formatters.JSONFormatter()
+        self.assertEqual(formatter.format(make_record()),
+                         '{"timestamp":"2017-07-14T02:40:00.250Z",'
+                         '"level":"WARNING","logger":"helper.tests",'
+                         '"message":"Hello world"}')
+
+
+class LogfmtFormatterTests(unittest.TestCase):
+
+    def test_values_are_quoted(self):
+        formatter = formatters.LogfmtFormatter(
+            ['level', 'message', 'lineno', 'missing'])
+        self.assertEqual(
+            formatter.format(make_record('Say "%s"', ('hi',))),
+            'level=WARNING message="Say \\"hi\\"" lineno=10 missing=')
+
+    def test_empty_value_is_quoted(self):
+        formatter = formatters.LogfmtFormatter(['message'])
+        self.assertEqual(formatter.format(make_record('', ())), 'message=""')
+
+
+class LoggingConfigFormatterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.configuration = copy.deepcopy(config.LOGGING)
+        self.configuration['formatters']['json'] = {
+            '()': 'helper.formatters.JSONFormatter'}
+        self.configuration['handlers']['console']['formatter'] = 'json'
+        self.configuration['loggers'] = {
+            'helper.tests': {'handlers': ['console'], 'level': 'INFO'}}
+        self.addCleanup(setattr, logging, '_srcfile', logging._srcfile)
+
+    def test_json_formatter_is_created_by_factory(self):
+        config.LoggingConfig(self.configuration)
+        handler = logging.getLogger('helper.tests').handlers[0]
+        self.assertIsInstance(handler.formatter, formatters.JSONFormatter)
+
+    def test_user_defined_json_formatter_is_not_merged(self):
+        handle, file_path = tempfile.mkstemp(suffix='.yml')
+        os.close(handle)
+        self.addCleanup(os.unlink, file_path)
+        with open(file_path, 'w') as handle:
+            handle.write('Logging:\n'
+                         '  formatters:\n'
+                         '    json:\n'
+                         '      format: "%(message)s"\n'
+                         '  handlers:\n'
+                         '    console:\n'
+                         '      formatter: json\n'
+                         '  loggers:\n'
+                         '    helper.tests:\n'
+                         '      handlers: [console]\n')
+        cfg = config.Config(file_path)
+        self.assertDictEqual(cfg.logging['formatters']['json'],
+                             {'format': '%(message)s'})
+        config.LoggingConfig(cfg.logging)
+        handler = logging.getLogger('helper.tests').handlers[0]
+        self.assertNotIsInstance(handler.formatter, formatters.JSONFormatter)
+        self.assertEqual(handler.formatter._fmt, '%(message)s')
+
+    def test_find_caller_can_be_disabled(self):
+        self.configuration['find_caller'] = False
+        logging_config = config.LoggingConfig(self.configuration)
+        self.assertIsNone(logging._srcfile)
+        del self.configuration['find_caller']
+        logging_config.update(self.configuration)
+        self.assertIsNotNone(logging._srcfile)
+
+    def test_find_caller_is_unchanged_when_not_set(self):
+        logging._srcfile = None
+        logging_config = config.LoggingConfig(self.configuration)
+        self.assertIsNone(logging._srcfile)
+        self.configuration['incremental'] = True
+        logging_config.update(self.configuration)
+        self.assertIsNone(logging._srcfile)
@@ -0,0 +1,217 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from helper import handlers
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.records = []
+        self.thread_names = []
+        self.flushed = 0
+
+    def emit(self, record):
+        self.records.append(record)
+        self.thread_names.append(threading.current_thread().name)
+
+    def flush(self):
+        self.flushed += 1
+
+
+class BlockingHandler(RecordingHandler):
+
+    def __init__(self):
+        RecordingHandler.__init__(self)
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.unblock.wait(5)
+        RecordingHandler.emit(self, record)
+
+
+class QueuePipelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('helper.tests.queue')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = RecordingHandler()
+        self.logger.handlers = [self.handler]
+        self.addCleanup(setattr, self.logger, 'handlers', [])
+
+    def start(self, **kwargs):
+        pipeline = handlers.QueuePipeline([self.logger], **kwargs)
+        pipeline.start()
+        self.addCleanup(pipeline.stop)
+        return pipeline
+
+    def test_records_are_emitted_on_background_thread(self):
+        pipeline = self.start()
+        self.assertIsInstance(self.logger.handlers[0], handlers.QueueHandler)
+        self.logger.info('Hello %s', 'world')
+        pipeline.stop()
+        self.assertEqual([record.getMessage()
+                          for record in self.handler.records],
+                         ['Hello world'])
+        self.assertEqual(self.handler.thread_names, ['helper-logging'])
+        self.assertEqual(self.handler.flushed, 1)
+
+    def test_stop_restores_handlers(self):
+        pipeline = self.start()
+        pipeline.stop()
+        self.assertEqual(self.logger.handlers, [self.handler])
+        self.assertFalse(pipeline.is_running)
+
+    def test_message_is_merged_when_logged(self):
+        pipeline = self.start()
+        value = ['before']
+        self.logger.info('Value %s', value)
+        value[0] = 'after'
+        pipeline.stop()
+        self.assertEqual(self.handler.records[0].getMessage(),
+                         "Value ['before']")
+
+    def test_handler_level_is_honored(self):
+        self.handler.setLevel(logging.WARNING)
+        pipeline = self.start()
+        self.logger.info('Ignored')
+        self.logger.warning('Emitted')
+        pipeline.stop()
+        self.assertEqual([record.getMessage()
+                          for record in self.handler.records], ['Emitted'])
+
+    def test_drop_policy_counts_dropped_records(self):
+        handler = BlockingHandler()
+        self.logger.handlers = [handler]
+        pipeline = self.start(size=1)
+        for offset in range(10):
+            self.logger.info('Record %i', offset)
+        handler.unblock.set()
+        pipeline.stop()
+        self.assertGreater(pipeline.dropped, 0)
+        self.assertEqual(len(handler.records) + pipeline.dropped, 10)
+
+    def test_block_policy_does_not_drop(self):
+        pipeline = self.start(size=1, policy=handlers.POLICY_BLOCK)
+        for offset in range(100):
+            self.logger.info('Record %i', offset)
+        pipeline.stop()
+        self.assertEqual(pipeline.dropped, 0)
+        self.assertEqual(len(self.handler.records), 100)
+
+    def test_invalid_policy_raises(self):
+        with self.assertRaises(ValueError):
+            handlers.QueuePipeline([self.logger], policy='wait')
+
+    def test_loggers_with_same_handlers_share_queue_handler(self):
+        other = logging.getLogger('helper.tests.queue.other')
+        other.handlers = [self.handler]
+        self.addCleanup(setattr, other, 'handlers', [])
+        pipeline = handlers.QueuePipeline([self.logger, other])
+        pipeline.start()
+        self.addCleanup(pipeline.stop)
+        self.assertIs(self.logger.handlers[0], other.handlers[0])
+
+    def test_restart_after_fork_replaces_thread(self):
+        pipeline = self.start()
+        thread, previous = pipeline._thread, pipeline._queue
+        with mock.patch('os.getpid', return_value=-1):
+            handlers.after_fork()
+        previous.put(None)
+        thread.join()
+        self.assertIsNot(pipeline._thread, thread)
+        self.logger.info('After fork')
+        pipeline.stop()
+        self.assertEqual(self.handler.records[-1].getMessage(), 'After fork')
+
+    def test_restart_in_same_process_keeps_thread(self):
+        pipeline = self.start()
+        thread = pipeline._thread
+        handlers.after_fork()
+        self.assertIs(pipeline._thread, thread)
+
+
+class BufferedFileHandlerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'test.log')
+        self.logger = logging.getLogger('helper.tests.buffered')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.addCleanup(setattr, self.logger, 'handlers', [])
+
+    def create(self, **kwargs):
+        kwargs.setdefault('flush_interval', 60)
+        handler = handlers.BufferedFileHandler(self.path, **kwargs)
+        self.addCleanup(handler.close)
+        self.logger.handlers = [handler]
+        return handler
+
+    def read(self, path=None):
+        with open(path or self.path) as handle:
+            return handle.read()
+
+    def test_records_are_buffered(self):
+        handler = self.create()
+        self.logger.info('Buffered')
+        self.assertEqual(self.read(), '')
+        handler.flush()
+        self.assertEqual(self.read(), 'Buffered\n')
+
+    def test_writes_when_capacity_is_reached(self):
+        self.create(capacity=3)
+        for offset in range(4):
+            self.logger.info('Record %i', offset)
+        self.assertEqual(self.read(), 'Record 0\nRecord 1\nRecord 2\n')
+
+    def test_writes_at_flush_level(self):
+        self.create(flush_level='warning')
+        self.logger.info('Before')
+        self.logger.warning('Warning')
+        self.assertEqual(self.read(), 'Before\nWarning\n')
+
+    def test_writes_after_flush_interval(self):
+        handler = self.create(flush_interval=0.01)
+        self.logger.info('Eventually')
+        for _offset in range(500):
+            if not handler.buffer:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(self.read(), 'Eventually\n')
+
+    def test_close_writes_buffer(self):
+        handler = self.create()
+        self.logger.info('Closing')
+        handler.close()
+        self.assertEqual(self.read(), 'Closing\n')
+        self.assertFalse(handler._thread.is_alive())
+
+    def test_invalid_flush_level_raises(self):
+        with self.assertRaises(ValueError):
+            handlers.BufferedFileHandler(self.path, flush_level='LOUD')
+
+    def test_reopen_files_after_rotation(self):
+        self.create()
+        self.logger.info('Before')
+        rotated = self.path + '.1'
+        os.rename(self.path, rotated)
+        handlers.reopen_files()
+        self.logger.error('After')
+        self.assertEqual(self.read(rotated), 'Before\n')
+        self.assertEqual(self.read(), 'After\n')
+
+    def test_closed_handler_is_not_reopened(self):
+        handler = self.create()
+        handler.close()
+        handlers.reopen_files()
+        self.assertIsNone(handler.stream)
@@ -0,0 +1,149 @@
+import datetime
+import unittest
+
+import mock
+
+from helper import scheduler
+
+
+class NextDeadlineTests(unittest.TestCase):
+
+    def test_on_schedule(self):
+        self.assertEqual(scheduler.next_deadline(
+            100, 105, 10, scheduler.OVERRUN_SKIP), (110, 0))
+
+    def test_skip(self):
+        self.assertEqual(scheduler.next_deadline(
+            100, 135, 10, scheduler.OVERRUN_SKIP), (140, 3))
+
+    def test_catch_up(self):
+        self.assertEqual(scheduler.next_deadline(
+            100, 135, 10, scheduler.OVERRUN_CATCH_UP), (110, 0))
+
+    def test_back_to_back(self):
+        self.assertEqual(scheduler.next_deadline(
+            100, 135, 10, scheduler.OVERRUN_BACK_TO_BACK), (135, 0))
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            scheduler.next_deadline(100, 135, 10, 'bogus')
+
+
+class CronScheduleTests(unittest.TestCase):
+
+    START = datetime.datetime(2018, 12, 31, 23, 58, 30)
+
+    def next_after(self, expression, value=START):
+        return scheduler.CronSchedule(expression).next_after(value)
+
+    def test_every_minute(self):
+        self.assertEqual(self.next_after('* * * * *'),
+                         datetime.datetime(2018, 12, 31, 23, 59))
+
+    def test_step(self):
+        self.assertEqual(self.next_after('*/15 * * * *'),
+                         datetime.datetime(2019, 1, 1, 0, 0))
+
+    def test_list_and_range(self):
+        self.assertEqual(self.next_after('5,10 2-4 * * *'),
+                         datetime.datetime(2019, 1, 1, 2, 5))
+
+    def test_month(self):
+        self.assertEqual(self.next_after('0 0 1 3 *'),
+                         datetime.datetime(2019, 3, 1))
+
+    def test_weekday(self):
+        # 2019-01-05 is a Saturday
+        self.assertEqual(self.next_after('30 12 * * 6'),
+                         datetime.datetime(2019, 1, 5, 12, 30))
+
+    def test_sunday_as_seven(self):
+        self.assertEqual(self.next_after('0 0 * * 7'),
+                         datetime.datetime(2019, 1, 6))
+
+    def test_day_or_weekday(self):
+        self.assertEqual(self.next_after('0 0 15 * 6'),
+                         datetime.datetime(2019, 1, 5))
+
+    def test_never_matches(self):
+        with self.assertRaises(ValueError):
+            self.next_after('0 0 31 2 *')
+
+    def test_invalid_expressions(self):
+        for expression in ['* * * *', '60 * * * *', '*/0 * * * *',
+                           'a * * * *', '5-1 * * * *']:
+            with self.assertRaises(ValueError):
+                scheduler.CronSchedule(expression)
+
+
+class TaskTests(unittest.TestCase):
+
+    def test_requires_interval_or_cron(self):
+        with self.assertRaises(ValueError):
+            scheduler.Task('test', mock.Mock())
+        with self.assertRaises(ValueError):
+            scheduler.Task('test', mock.Mock(), 5, '* * * * *')
+
+    def test_invalid_interval(self):
+        with self.assertRaises(ValueError):
+            scheduler.Task('test', mock.Mock(), 0)
+
+    def test_invalid_overrun_policy(self):
+        with self.assertRaises(ValueError):
+            scheduler.Task('test', mock.Mock(), 5, overrun_policy='bogus')
+
+    def test_next_deadline_counts_skipped(self):
+        task = scheduler.Task('test', mock.Mock(), 10)
+        self.assertEqual(task.next_deadline(100, 135), 140)
+        self.assertEqual(task.skipped, 3)
+
+    def test_cron_deadline(self):
+        task = scheduler.Task('test', mock.Mock(), cron='* * * * *')
+        deadline = task.first_deadline(1000)
+        self.assertGreater(deadline, 1000)
+        self.assertLessEqual(deadline, 1060)
+
+
+class SchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = scheduler.Scheduler()
+        with mock.patch('helper.scheduler.monotonic', return_value=100):
+            self.first = scheduler.Task('first', mock.Mock(), 10)
+            self.second = scheduler.Task('second', mock.Mock(), 5)
+            self.scheduler.add(self.first)
+            self.scheduler.add(self.second)
+
+    def test_duplicate_name(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.add(scheduler.Task('first', mock.Mock(), 1))
+
+    def test_next_deadline(self):
+        self.assertEqual(self.scheduler.next_deadline(), 105)
+
+    def test_pop_due_in_order(self):
+        self.assertEqual(self.scheduler.pop_due(104), [])
+        self.assertEqual(self.scheduler.pop_due(110),
+                         [(self.second, 105), (self.first, 110)])
+        self.assertIsNone(self.scheduler.next_deadline())
+
+    def test_complete_reschedules(self):
+        for task, scheduled in self.scheduler.pop_due(105):
+            self.scheduler.complete(task, scheduled, 105.5, 106)
+        self.assertEqual(self.scheduler.next_deadline(), 110)
+        self.assertEqual(self.second.deadline, 110)
+        self.assertEqual(self.second.duration.count, 1)
+        self.assertEqual(self.second.lateness_last, 0.5)
+
+    def test_removed_task_is_not_rescheduled(self):
+        due = self.scheduler.pop_due(105)
+        self.scheduler.remove('second')
+        for task, scheduled in due:
+            self.scheduler.complete(task, scheduled, 105, 106)
+        self.assertEqual(self.scheduler.next_deadline(), 110)
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_remove_discards_pending_run(self):
+        self.scheduler.remove('second')
+        self.assertEqual(self.scheduler.next_deadline(), 110)
+        self.assertEqual(list(self.scheduler), [self.first])
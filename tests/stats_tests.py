@@ -0,0 +1,56 @@
+import unittest
+
+from helper import stats
+
+
+class HistogramTests(unittest.TestCase):
+
+    def setUp(self):
+        self.histogram = stats.Histogram()
+
+    def test_empty(self):
+        self.assertEqual(self.histogram.count, 0)
+        self.assertIsNone(self.histogram.mean)
+        self.assertIsNone(self.histogram.percentile(50))
+
+    def test_add(self):
+        for value in [0.001, 0.002, 0.003, 0.5]:
+            self.histogram.add(value)
+        self.assertEqual(self.histogram.count, 4)
+        self.assertEqual(self.histogram.minimum, 0.001)
+        self.assertEqual(self.histogram.maximum, 0.5)
+        self.assertAlmostEqual(self.histogram.mean, 0.1265)
+        self.assertEqual(sum(self.histogram.counts), 4)
+
+    def test_percentile_is_bucket_upper_bound(self):
+        for _value in range(99):
+            self.histogram.add(0.001)
+        self.histogram.add(2.0)
+        self.assertGreaterEqual(self.histogram.percentile(50), 0.001)
+        self.assertLess(self.histogram.percentile(50), 0.002)
+        self.assertEqual(self.histogram.percentile(100), 2.0)
+
+    def test_overflow_bucket(self):
+        self.histogram.add(100000)
+        self.assertEqual(self.histogram.counts[-1], 1)
+        self.assertEqual(self.histogram.percentile(99), 100000)
+
+    def test_reset(self):
+        self.histogram.add(1)
+        self.histogram.reset()
+        self.assertEqual(self.histogram.count, 0)
+        self.assertEqual(sum(self.histogram.counts), 0)
+        self.assertIsNone(self.histogram.maximum)
+
+
+class StatsTests(unittest.TestCase):
+
+    def test_as_dict(self):
+        value = stats.Stats()
+        value.process.add(0.5)
+        value.signals += 1
+        summary = value.as_dict()
+        self.assertEqual(summary['process']['count'], 1)
+        self.assertEqual(summary['sleep']['count'], 0)
+        self.assertEqual(summary['signals'], 1)
+        self.assertEqual(summary['reloads'], 0)
@@ -0,0 +1,416 @@
+import argparse
+import errno
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+
+import mock
+
+import helper
+from helper import handlers, unix, wakeup
+
+
+class Worker(object):
+
+    started = []
+
+    def __init__(self, args, operating_system):
+        self.args = args
+        self.operating_system = operating_system
+
+    def start(self):
+        self.started.append((self.args, self.operating_system))
+
+    def stop(self):
+        pass
+
+
+class FailingWorker(Worker):
+
+    def start(self):
+        raise RuntimeError('failed')
+
+
+class ExitingWorker(Worker):
+
+    def start(self):
+        raise SystemExit(3)
+
+
+class CleanExitWorker(Worker):
+
+    def start(self):
+        raise SystemExit()
+
+
+class MessageExitWorker(Worker):
+
+    def start(self):
+        raise SystemExit('Stopped')
+
+
+class SleepingWorker(Worker):
+
+    def start(self):
+        time.sleep(30)
+
+
+class LoggingWorker(Worker):
+
+    def start(self):
+        for offset in range(3):
+            logging.getLogger('helper.tests.worker').info('Worker %i', offset)
+
+
+def make_supervisor(controller_class=Worker, workers=2):
+    controller = controller_class(mock.sentinel.args, 'Linux')
+    controller.config = mock.Mock()
+    supervisor = unix.Supervisor(controller, workers)
+    supervisor._wakeup = wakeup.Wakeup()
+    return supervisor
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = make_supervisor()
+        self.addCleanup(self.supervisor._wakeup.close)
+
+
+class SpawnTests(SupervisorTestCase):
+
+    def setUp(self):
+        super(SpawnTests, self).setUp()
+        Worker.started = []
+
+    def spawn(self, supervisor=None):
+        supervisor = supervisor or self.supervisor
+        with mock.patch('os.fork', return_value=0), \
+                mock.patch('os._exit') as exit_process, \
+                mock.patch('signal.signal') as set_handler, \
+                mock.patch('helper.handlers.shutdown') as shutdown, \
+                mock.patch.object(supervisor._wakeup, 'close') as close:
+            supervisor._spawn(1)
+        close.assert_called_once_with()
+        shutdown.assert_called_once_with()
+        set_handler.assert_any_call(signal.SIGTERM, signal.SIG_DFL)
+        return exit_process
+
+    def test_parent_records_worker(self):
+        with mock.patch('os.fork', return_value=100), \
+                mock.patch('helper.unix.time.time', return_value=1000):
+            self.supervisor._spawn(1)
+        self.assertEqual(self.supervisor._pids, {100: 1})
+        self.assertEqual(self.supervisor._started_at, {1: 1000})
+
+    def test_child_runs_controller(self):
+        self.spawn().assert_called_once_with(0)
+        self.assertEqual(Worker.started, [(mock.sentinel.args, 'Linux')])
+
+    def test_child_exits_with_status_on_failure(self):
+        supervisor = make_supervisor(FailingWorker)
+        self.addCleanup(supervisor._wakeup.close)
+        self.spawn(supervisor).assert_called_once_with(1)
+
+    def test_child_exits_with_system_exit_code(self):
+        supervisor = make_supervisor(ExitingWorker)
+        self.addCleanup(supervisor._wakeup.close)
+        self.spawn(supervisor).assert_called_once_with(3)
+
+    def test_child_exits_cleanly_without_exit_code(self):
+        supervisor = make_supervisor(CleanExitWorker)
+        self.addCleanup(supervisor._wakeup.close)
+        self.spawn(supervisor).assert_called_once_with(0)
+
+    def test_child_exits_with_status_for_exit_message(self):
+        supervisor = make_supervisor(MessageExitWorker)
+        self.addCleanup(supervisor._wakeup.close)
+        self.spawn(supervisor).assert_called_once_with(1)
+
+    def test_respawn_spawns_due_workers(self):
+        self.supervisor._respawn_at = {0: 999, 1: 1001}
+        with mock.patch.object(self.supervisor, '_spawn') as spawn, \
+                mock.patch('helper.unix.time.time', return_value=1000):
+            self.supervisor._respawn()
+        spawn.assert_called_once_with(0)
+        self.assertEqual(self.supervisor._respawn_at, {1: 1001})
+
+
+class ReapTests(SupervisorTestCase):
+
+    def exit(self, status, runtime=1):
+        self.supervisor._pids = {100: 0}
+        self.supervisor._started_at = {0: 1000 - runtime}
+        with mock.patch('os.waitpid', side_effect=[(100, status), (0, 0)]), \
+                mock.patch('helper.unix.time.time', return_value=1000):
+            self.supervisor._reap()
+        self.assertEqual(self.supervisor._pids, {})
+        return self.supervisor._respawn_at.get(0)
+
+    def test_clean_exit_is_not_respawned(self):
+        self.assertIsNone(self.exit(0))
+
+    def test_abnormal_exit_is_respawned_with_backoff(self):
+        self.assertEqual(self.exit(signal.SIGKILL), 1000)
+        self.assertEqual(self.exit(signal.SIGKILL), 1002)
+        self.assertEqual(self.exit(1 << 8), 1004)
+        self.assertEqual(self.exit(signal.SIGKILL), 1008)
+
+    def test_backoff_is_limited(self):
+        self.supervisor._failures[0] = 20
+        self.assertEqual(self.exit(signal.SIGKILL),
+                         1000 + unix.Supervisor.RESPAWN_DELAY_MAX)
+
+    def test_backoff_resets_after_long_runtime(self):
+        self.exit(signal.SIGKILL)
+        self.exit(signal.SIGKILL)
+        self.assertEqual(
+            self.exit(signal.SIGKILL, unix.Supervisor.RESPAWN_RESET), 1000)
+        self.assertEqual(self.exit(signal.SIGKILL), 1002)
+
+    def test_exit_while_stopping_is_not_respawned(self):
+        self.supervisor._stopping = True
+        self.assertIsNone(self.exit(signal.SIGKILL))
+
+    def test_no_children(self):
+        self.supervisor._pids = {100: 0}
+        with mock.patch('os.waitpid',
+                        side_effect=OSError(errno.ECHILD, 'No children')):
+            self.supervisor._reap()
+        self.assertEqual(self.supervisor._pids, {100: 0})
+
+
+class SignalTests(SupervisorTestCase):
+
+    def setUp(self):
+        super(SignalTests, self).setUp()
+        self.supervisor._pids = {100: 0, 101: 1}
+
+    def test_signals_are_forwarded(self):
+        for signum in [signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2]:
+            self.supervisor._on_signal(signum, None)
+        with mock.patch('os.kill') as kill:
+            self.supervisor._process_signals(0)
+        self.assertEqual(
+            sorted(kill.call_args_list),
+            sorted(mock.call(pid, signum)
+                   for pid in [100, 101]
+                   for signum in [signal.SIGHUP, signal.SIGUSR1,
+                                  signal.SIGUSR2]))
+        self.assertFalse(self.supervisor._stopping)
+
+    def test_profile_signal_is_forwarded(self):
+        self.supervisor.controller.profile_signal = signal.SIGPROF
+        pids, self.supervisor._pids = self.supervisor._pids, {}
+        with mock.patch('signal.signal') as set_handler, \
+                mock.patch.object(self.supervisor, '_spawn'):
+            self.supervisor.start()
+        set_handler.assert_any_call(signal.SIGPROF,
+                                    self.supervisor._on_signal)
+        set_handler.assert_any_call(signal.SIGPROF, signal.SIG_DFL)
+        self.supervisor._pids = pids
+        self.supervisor._wakeup = wakeup.Wakeup()
+        self.addCleanup(self.supervisor._wakeup.close)
+        self.supervisor._on_signal(signal.SIGPROF, None)
+        with mock.patch('os.kill') as kill:
+            self.supervisor._process_signals(0)
+        kill.assert_has_calls([mock.call(100, signal.SIGPROF),
+                               mock.call(101, signal.SIGPROF)],
+                              any_order=True)
+
+    def test_sigterm_stops_respawning(self):
+        self.supervisor._respawn_at = {2: 1000}
+        self.supervisor._on_signal(signal.SIGTERM, None)
+        with mock.patch('os.kill') as kill:
+            self.supervisor._process_signals(0)
+        kill.assert_has_calls([mock.call(100, signal.SIGTERM),
+                               mock.call(101, signal.SIGTERM)],
+                              any_order=True)
+        self.assertTrue(self.supervisor._stopping)
+        self.assertEqual(self.supervisor._respawn_at, {})
+
+    def test_stop_reaps_every_worker(self):
+        with mock.patch('os.kill') as kill, \
+                mock.patch('os.waitpid',
+                           side_effect=[(100, 0), OSError()]) as waitpid:
+            self.supervisor.stop()
+        kill.assert_has_calls([mock.call(100, signal.SIGTERM),
+                               mock.call(101, signal.SIGTERM)],
+                              any_order=True)
+        waitpid.assert_has_calls([mock.call(100, 0), mock.call(101, 0)],
+                                 any_order=True)
+        self.assertEqual(self.supervisor._pids, {})
+
+
+class StartTests(unittest.TestCase):
+
+    def setUp(self):
+        self.controller_class = mock.Mock()
+        self.controller_class.return_value.config.application = {}
+        self.args = argparse.Namespace(config=None, foreground=True,
+                                       workers=2)
+        for patcher in [
+                mock.patch('helper.parser.parse', return_value=self.args),
+                mock.patch.object(helper.platform, 'operating_system',
+                                  return_value='Linux')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_workers_run_under_supervisor(self):
+        with mock.patch.object(helper.platform, 'Supervisor') as supervisor:
+            helper.start(self.controller_class)
+        supervisor.assert_called_once_with(
+            self.controller_class.return_value, 2)
+        supervisor.return_value.start.assert_called_once_with()
+
+    def test_workers_require_fork(self):
+        with mock.patch('helper.os', mock.Mock(spec=[])), \
+                mock.patch.object(helper.platform,
+                                  'Supervisor') as supervisor, \
+                mock.patch('sys.stderr') as stderr:
+            with self.assertRaises(SystemExit):
+                helper.start(self.controller_class)
+        supervisor.assert_not_called()
+        self.assertIn('requires os.fork', stderr.write.call_args[0][0])
+
+    def test_configured_workers_are_coerced(self):
+        self.args.workers = None
+        self.controller_class.return_value.config.application = {
+            'workers': '3'}
+        with mock.patch.object(helper.platform, 'Supervisor') as supervisor:
+            helper.start(self.controller_class)
+        supervisor.assert_called_once_with(
+            self.controller_class.return_value, 3)
+
+    def test_invalid_workers_are_rejected(self):
+        self.args.workers = None
+        for value in [0, -1, 'many']:
+            self.controller_class.return_value.config.application = {
+                'workers': value}
+            with mock.patch.object(helper.platform,
+                                   'Supervisor') as supervisor, \
+                    mock.patch('sys.stderr') as stderr:
+                with self.assertRaises(SystemExit):
+                    helper.start(self.controller_class)
+            supervisor.assert_not_called()
+            self.assertIn('workers must be a number',
+                          stderr.write.call_args[0][0])
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'os.fork is not available')
+class WorkerProcessTests(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = make_supervisor(SleepingWorker)
+        self.addCleanup(self.supervisor._wakeup.close)
+        self.addCleanup(self.supervisor.stop)
+
+    def wait_for_exit(self, pid):
+        deadline = time.time() + 5
+        while pid in self.supervisor._pids and time.time() < deadline:
+            self.supervisor._reap()
+            time.sleep(0.01)
+        self.assertNotIn(pid, self.supervisor._pids)
+
+    def test_killed_worker_is_respawned_and_stop_reaps_all(self):
+        for slot in range(self.supervisor.workers):
+            self.supervisor._spawn(slot)
+        killed = [pid for pid, slot in self.supervisor._pids.items()
+                  if slot == 0][0]
+        os.kill(killed, signal.SIGKILL)
+        self.wait_for_exit(killed)
+        self.supervisor._respawn()
+        self.assertEqual(sorted(self.supervisor._pids.values()), [0, 1])
+        self.assertNotIn(killed, self.supervisor._pids)
+        self.supervisor.stop()
+        self.assertEqual(self.supervisor._pids, {})
+        with self.assertRaises(OSError) as error:
+            os.waitpid(-1, os.WNOHANG)
+        self.assertEqual(error.exception.errno, errno.ECHILD)
+
+    def test_buffered_records_are_written_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        log_path = os.path.join(directory, 'worker.log')
+        handler = handlers.BufferedFileHandler(log_path, flush_interval=60)
+        self.addCleanup(handler.close)
+        logger = logging.getLogger('helper.tests.worker')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.handlers = [handler]
+        self.addCleanup(setattr, logger, 'handlers', [])
+        supervisor = make_supervisor(LoggingWorker, 1)
+        self.addCleanup(supervisor._wakeup.close)
+        logger.info('Before fork')
+        supervisor._spawn(0)
+        pid = list(supervisor._pids)[0]
+        _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        handler.close()
+        with open(log_path) as handle:
+            self.assertEqual(handle.read().splitlines(),
+                             ['Before fork', 'Worker 0', 'Worker 1',
+                              'Worker 2'])
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'os.fork is not available')
+class ForkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.log_path = os.path.join(self.directory, 'child.log')
+        handler = logging.FileHandler(self.log_path)
+        self.addCleanup(handler.close)
+        self.logger = logging.getLogger('helper.tests.fork')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.handlers = [handler]
+        self.addCleanup(setattr, self.logger, 'handlers', [])
+
+    def test_queued_records_are_written_by_child(self):
+        pipeline = handlers.QueuePipeline([self.logger])
+        pipeline.start()
+        self.addCleanup(pipeline.stop)
+        pid = unix._fork()
+        if not pid:
+            status = 1
+            try:
+                for offset in range(3):
+                    self.logger.info('Child %i', offset)
+                pipeline.stop()
+                status = 0
+            finally:
+                os._exit(status)
+        _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        pipeline.stop()
+        with open(self.log_path) as handle:
+            self.assertEqual(handle.read().splitlines(),
+                             ['Child 0', 'Child 1', 'Child 2'])
+
+    def test_buffered_records_are_written_once(self):
+        handler = handlers.BufferedFileHandler(self.log_path,
+                                               flush_interval=60)
+        self.addCleanup(handler.close)
+        self.logger.handlers = [handler]
+        self.logger.info('Before fork')
+        pid = unix._fork()
+        if not pid:
+            status = 1
+            try:
+                self.logger.info('Child')
+                handlers.shutdown()
+                status = 0
+            finally:
+                os._exit(status)
+        _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        handler.close()
+        with open(self.log_path) as handle:
+            self.assertEqual(handle.read().splitlines(),
+                             ['Before fork', 'Child'])
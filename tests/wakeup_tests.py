@@ -0,0 +1,59 @@
+import os
+import signal
+import threading
+import time
+import unittest
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from helper import wakeup
+
+
+class WakeupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.wakeup = wakeup.Wakeup()
+
+    def tearDown(self):
+        self.wakeup.close()
+
+    def test_get_returns_items_in_order(self):
+        self.wakeup.put(1)
+        self.wakeup.put(2)
+        self.assertEqual(self.wakeup.get(True, 1), 1)
+        self.assertEqual(self.wakeup.get_nowait(), 2)
+
+    def test_get_raises_empty_on_timeout(self):
+        start = time.time()
+        with self.assertRaises(queue.Empty):
+            self.wakeup.get(True, 0.05)
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+    def test_get_nowait_raises_empty(self):
+        with self.assertRaises(queue.Empty):
+            self.wakeup.get_nowait()
+
+    def test_notify_wakes_without_item(self):
+        threading.Timer(0.01, self.wakeup.notify).start()
+        with self.assertRaises(queue.Empty):
+            self.wakeup.get(True, 5)
+
+    def test_put_from_thread_wakes_loop(self):
+        threading.Timer(0.01, self.wakeup.put, ['item']).start()
+        self.assertEqual(self.wakeup.get(True, 5), 'item')
+
+    def test_put_from_signal_handler_wakes_loop(self):
+        previous = signal.signal(
+            signal.SIGUSR1, lambda signum, _frame: self.wakeup.put(signum))
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+        threading.Timer(
+            0.01, os.kill, [os.getpid(), signal.SIGUSR1]).start()
+        self.assertEqual(self.wakeup.get(True, 5), signal.SIGUSR1)
+
+    def test_many_notifications_do_not_block(self):
+        for value in range(100000):
+            self.wakeup.put(value)
+        self.assertEqual(self.wakeup.get(True, 1), 0)
+        self.assertFalse(self.wakeup.empty())
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from helper import watcher
+
+
+class InotifyWatcherTests(unittest.TestCase):
+
+    BACKEND = watcher.BACKEND_INOTIFY
+
+    def setUp(self):
+        if self.BACKEND == watcher.BACKEND_INOTIFY and not watcher._libc():
+            raise unittest.SkipTest('inotify is not available')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'config.yml')
+        self.write('a')
+        self.changed = threading.Event()
+        self.calls = []
+        self.watcher = watcher.Watcher(
+            self.path, self.on_change, debounce=0.05, poll_interval=0.01,
+            backend=self.BACKEND)
+        self.watcher.start()
+        self.addCleanup(self.watcher.stop)
+
+    def on_change(self):
+        self.calls.append(time.time())
+        self.changed.set()
+
+    def write(self, value, file_path=None):
+        with open(file_path or self.path, 'w') as handle:
+            handle.write(value)
+
+    def test_write_invokes_callback(self):
+        self.write('bb')
+        self.assertTrue(self.changed.wait(5))
+
+    def test_rename_invokes_callback(self):
+        temp_path = os.path.join(self.directory, '.config.yml.tmp')
+        self.write('bb', temp_path)
+        os.rename(temp_path, self.path)
+        self.assertTrue(self.changed.wait(5))
+
+    def test_changes_are_coalesced(self):
+        for value in ['bb', 'ccc', 'dddd']:
+            self.write(value)
+            time.sleep(0.01)
+        self.assertTrue(self.changed.wait(5))
+        time.sleep(0.2)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_other_files_are_ignored(self):
+        self.write('b', os.path.join(self.directory, 'other.yml'))
+        self.assertFalse(self.changed.wait(0.2))
+
+    def test_stop(self):
+        self.watcher.stop()
+        self.assertFalse(self.watcher.is_running)
+        self.write('bb')
+        self.assertFalse(self.changed.wait(0.2))
+
+
+class PollWatcherTests(InotifyWatcherTests):
+
+    BACKEND = watcher.BACKEND_POLL
+
+
+class InotifyDirectoryWatcherTests(unittest.TestCase):
+
+    BACKEND = watcher.BACKEND_INOTIFY
+
+    def setUp(self):
+        if self.BACKEND == watcher.BACKEND_INOTIFY and not watcher._libc():
+            raise unittest.SkipTest('inotify is not available')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, '10-base.yml')
+        self.write(self.path, 'a')
+        self.changed = threading.Event()
+        self.watcher = watcher.Watcher(
+            self.directory, self.changed.set, debounce=0.05,
+            poll_interval=0.01, backend=self.BACKEND)
+        self.watcher.start()
+        self.addCleanup(self.watcher.stop)
+
+    @staticmethod
+    def write(file_path, value):
+        with open(file_path, 'w') as handle:
+            handle.write(value)
+
+    def test_change_invokes_callback(self):
+        self.write(self.path, 'bb')
+        self.assertTrue(self.changed.wait(5))
+
+    def test_added_file_invokes_callback(self):
+        self.write(os.path.join(self.directory, '20-extra.yml'), 'a')
+        self.assertTrue(self.changed.wait(5))
+
+    def test_removed_file_invokes_callback(self):
+        os.unlink(self.path)
+        self.assertTrue(self.changed.wait(5))
+
+
+class PollDirectoryWatcherTests(InotifyDirectoryWatcherTests):
+
+    BACKEND = watcher.BACKEND_POLL